@@ -0,0 +1,175 @@
+"""Admission control for prediction requests.
+
+Each request's cost is estimated before it runs, as the number of windows
+it will score. Requests up to FAST_LANE_COST take the fast lane, which only
+bounds how many run at once. Costlier requests take the heavy lane: at most
+HEAVY_SLOTS run at once, at most HEAVY_QUEUE wait behind them, and no
+client holds more than CLIENT_SHARE running or waiting requests. A freed
+slot goes to the waiting client with the fewest heavy requests running,
+then to the longest waiting.
+
+A request that cannot be admitted raises Overloaded, carrying a Retry-After
+estimate from the measured heavy-lane throughput.
+
+Waiting requests hold an HTTP worker thread, so keep HEAVY_SLOTS plus
+HEAVY_QUEUE below the threads per worker (TRANSHLA_WORKER_THREADS) to
+leave the fast lane a thread.
+"""
+import os
+import math
+import time
+import itertools
+import threading
+
+# Largest cost, in windows, served by the fast lane
+FAST_LANE_COST = int(os.environ.get('TRANSHLA_FAST_LANE_COST', 500))
+FAST_LANE_SLOTS = int(os.environ.get('TRANSHLA_FAST_LANE_SLOTS', 16))
+# Seconds a fast request may wait for a fast lane slot
+FAST_LANE_WAIT = float(os.environ.get('TRANSHLA_FAST_LANE_WAIT', 1))
+
+HEAVY_SLOTS = int(os.environ.get('TRANSHLA_HEAVY_SLOTS', 1))
+HEAVY_QUEUE = int(os.environ.get('TRANSHLA_HEAVY_QUEUE', 2))
+# Heavy requests one client may have running or waiting
+CLIENT_SHARE = int(os.environ.get('TRANSHLA_CLIENT_SHARE', 2))
+# Seconds a heavy request may wait for a slot
+QUEUE_TIMEOUT = float(os.environ.get('TRANSHLA_QUEUE_TIMEOUT', 30))
+
+# Starting estimate of heavy-lane seconds per window, refined as requests finish
+INITIAL_SECONDS_PER_WINDOW = 0.002
+THROUGHPUT_SMOOTHING = 0.2
+
+
+class Overloaded(Exception):
+    """Raised when a request cannot be admitted; retry_after is in whole seconds."""
+
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class Ticket:
+    """An admitted request; release it when the response is complete."""
+
+    def __init__(self, controller, lane, client, cost, order):
+        self.controller = controller
+        self.lane = lane
+        self.client = client
+        self.cost = cost
+        self.order = order
+        self.admitted_at = None
+        self._released = False
+
+    def release(self):
+        if not self._released:
+            self._released = True
+            self.controller._release(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+class AdmissionController:
+    """Fast lane and fair-share heavy lane in front of the prediction endpoints."""
+
+    def __init__(self, fast_lane_cost=FAST_LANE_COST, fast_lane_slots=FAST_LANE_SLOTS,
+                 heavy_slots=HEAVY_SLOTS, heavy_queue=HEAVY_QUEUE, client_share=CLIENT_SHARE,
+                 queue_timeout=QUEUE_TIMEOUT):
+        self.fast_lane_cost = fast_lane_cost
+        self.heavy_slots = heavy_slots
+        self.heavy_queue = heavy_queue
+        self.client_share = client_share
+        self.queue_timeout = queue_timeout
+        self._fast_lane = threading.BoundedSemaphore(fast_lane_slots)
+        self._condition = threading.Condition()
+        self._running = {}
+        self._running_cost = 0
+        self._waiting = []
+        self._order = itertools.count()
+        self.seconds_per_window = INITIAL_SECONDS_PER_WINDOW
+        self.admitted = {"fast": 0, "heavy": 0}
+        self.rejected = {"fast": 0, "heavy": 0}
+
+    def lane(self, cost):
+        return "fast" if cost <= self.fast_lane_cost else "heavy"
+
+    def retry_after(self, extra_cost=0):
+        """Seconds until the heavy lane should have worked through its backlog."""
+        backlog = self._running_cost + sum(ticket.cost for ticket in self._waiting) + extra_cost
+        return max(1, math.ceil(backlog * self.seconds_per_window / self.heavy_slots))
+
+    def admit(self, client, cost):
+        """Return a Ticket once the request may run; raises Overloaded."""
+        if self.lane(cost) == "fast":
+            admitted = self._fast_lane.acquire(timeout=FAST_LANE_WAIT)
+            with self._condition:
+                (self.admitted if admitted else self.rejected)["fast"] += 1
+            if not admitted:
+                raise Overloaded("Too many requests in progress", 1)
+            ticket = Ticket(self, "fast", client, cost, None)
+            ticket.admitted_at = time.perf_counter()
+            return ticket
+
+        with self._condition:
+            held = self._running.get(client, 0) + sum(1 for ticket in self._waiting if ticket.client == client)
+            if held >= self.client_share:
+                self.rejected["heavy"] += 1
+                raise Overloaded(f"At most {self.client_share} large requests per client may run or wait at once",
+                                 self.retry_after(cost))
+            if len(self._waiting) >= self.heavy_queue and sum(self._running.values()) >= self.heavy_slots:
+                self.rejected["heavy"] += 1
+                raise Overloaded("The server is busy with large requests", self.retry_after(cost))
+
+            ticket = Ticket(self, "heavy", client, cost, next(self._order))
+            self._waiting.append(ticket)
+            deadline = time.monotonic() + self.queue_timeout
+            while sum(self._running.values()) >= self.heavy_slots or self._next() is not ticket:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._waiting.remove(ticket)
+                    self._condition.notify_all()
+                    self.rejected["heavy"] += 1
+                    raise Overloaded("Timed out waiting behind other large requests", self.retry_after(cost))
+                self._condition.wait(remaining)
+            self._waiting.remove(ticket)
+            self._running[client] = self._running.get(client, 0) + 1
+            self._running_cost += cost
+            self.admitted["heavy"] += 1
+            ticket.admitted_at = time.perf_counter()
+            # Another waiter may be next in line for a remaining slot
+            self._condition.notify_all()
+        return ticket
+
+    def _next(self):
+        """The waiting ticket whose client has the fewest heavy requests running."""
+        return min(self._waiting, key=lambda ticket: (self._running.get(ticket.client, 0), ticket.order))
+
+    def _release(self, ticket):
+        if ticket.lane == "fast":
+            self._fast_lane.release()
+            return
+        elapsed = time.perf_counter() - ticket.admitted_at
+        with self._condition:
+            self._running[ticket.client] -= 1
+            if not self._running[ticket.client]:
+                del self._running[ticket.client]
+            self._running_cost -= ticket.cost
+            if ticket.cost:
+                self.seconds_per_window += THROUGHPUT_SMOOTHING * (elapsed / ticket.cost - self.seconds_per_window)
+            self._condition.notify_all()
+
+    def stats(self):
+        with self._condition:
+            return {
+                "fast_lane_cost": self.fast_lane_cost,
+                "heavy_slots": self.heavy_slots,
+                "heavy_running": sum(self._running.values()),
+                "heavy_waiting": len(self._waiting),
+                "heavy_queue": self.heavy_queue,
+                "client_share": self.client_share,
+                "seconds_per_window": self.seconds_per_window,
+                "admitted": dict(self.admitted),
+                "rejected": dict(self.rejected),
+            }
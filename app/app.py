@@ -1,22 +1,51 @@
 import os
 import sys
-import json
 import torch
 import numpy as np
 import pandas as pd
 import traceback
+import uuid
+import threading
 import time
-import requests
-from flask import Flask, request, jsonify, send_from_directory
+from contextlib import nullcontext
+from flask import Flask, Response, g, request, jsonify, send_from_directory, stream_with_context
 from flask_cors import CORS
-from transformers import AutoTokenizer, AutoModel
 from werkzeug.utils import secure_filename
 
+# Models load lazily in background threads, on first use or at startup
+# when TRANSHLA_PRELOAD=1
+from . import model_loader
+from .model_loader import load_models, wait_for_models, CACHE_DIR
+
+from .batching import BatchingEngine, EPITOPE_THRESHOLD, HLA_CLASSES, MAX_TOKEN_LENGTH, PEPTIDE_LENGTHS, length_classes
+from .scheduler import MicroBatcher
+from .cache import score_cache, structure_cache, model_version
+from .score_store import open_score_store
+from .structure import StructureAPIError, StructureNotFound, create_structure_service
+from .jobs import JobManager
+from .inference_pool import INFERENCE_WORKERS, CORES_PER_WORKER, InferencePool, PoolEngine
+from .bulk import ARROW_FORMATS, columnar_results, columns_to_arrow, columns_to_json, read_upload, score_bulk, validate_peptides
+from .results import RESULT_LAYOUTS, WindowResults
+from .selection import hotspots, is_ranked, parse_selection, select_windows
+from .metrics import log_event, register_collector, render as render_metrics, set_trace_id, stage, ADMISSIONS, REQUEST_SECONDS, REQUESTS
+from .admission import AdmissionController, Overloaded
+from .epitope_index import DEFAULT_LIMIT as INDEX_LIMIT, open_index
+from .saliency import SaliencyProfile, SaliencyRecorder
+from .tokenizer import encode as encode_sequence, valid_residues, valid_window_starts
+from .variants import apply_mutations, mutation_name, parse_mutations, saturation_mutations, scan_variants
+from .wire import DecompressRequests, WireJSONProvider, compress_response, dumps, encode_response, installed, packb
+
 # Configure paths
 current_dir = os.path.dirname(os.path.abspath(__file__))
 parent_dir = os.path.dirname(current_dir)
 sys.path.append(parent_dir)
 
+# Largest number of peptides scored in one bulk request
+MAX_BULK_PEPTIDES = int(os.environ.get('TRANSHLA_MAX_BULK_PEPTIDES', 100000))
+
+# Largest number of variants scored in one variant scan request
+MAX_VARIANTS = int(os.environ.get('TRANSHLA_MAX_VARIANTS', 10000))
+
 # Set device
 device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
 print(f"Using device: {device}")
@@ -24,164 +53,448 @@ print(f"Using device: {device}")
 app = Flask(__name__)
 # Enable CORS for all routes when running in development
 CORS(app, resources={r"/*": {"origins": "*"}})
+
+@app.before_request
+def start_trace():
+    """Tag the request with a trace ID, reusing the client's X-Request-ID if sent."""
+    g.trace_id = request.headers.get('X-Request-ID') or uuid.uuid4().hex[:16]
+    g.started_at = time.perf_counter()
+    set_trace_id(g.trace_id)
+
+@app.after_request
+def finish_trace(response):
+    """Record request latency and status, and return the trace ID to the client."""
+    started_at = g.get('started_at')
+    if started_at is not None and request.endpoint != 'metrics':
+        endpoint = request.endpoint or 'unknown'
+        REQUEST_SECONDS.observe(time.perf_counter() - started_at, endpoint=endpoint)
+        REQUESTS.inc(endpoint=endpoint, status=response.status_code)
+    response.headers['X-Trace-ID'] = g.get('trace_id', '')
+    # A streamed body is still being computed, so it keeps its admission
+    # slot until the server closes the response
+    if response.is_streamed:
+        ticket = g.pop('admission_ticket', None)
+        if ticket is not None:
+            response.call_on_close(ticket.release)
+    return response
+
+@app.after_request
+def compress_body(response):
+    """Compress the response body with the client's preferred Accept-Encoding."""
+    return compress_response(response)
+
+@app.teardown_request
+def release_admission(exc):
+    """Free the admission slot of a request once its response is built."""
+    ticket = g.pop('admission_ticket', None)
+    if ticket is not None:
+        ticket.release()
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max upload size
 
-# Prediction cache
-MAX_CACHE_SIZE = 100
-prediction_cache = {}
-
-# Import model loader
-try:
-    from .model_loader import load_models, tokenizer, transHLA_I_model, transHLA_II_model, models_loaded
-    print(f"Models imported from model_loader, loaded status: {models_loaded}")
-except ImportError:
-    # Fallback to local variables if import fails
-    models_loaded = False
-    tokenizer = None
-    transHLA_I_model = None
-    transHLA_II_model = None
-    
-    # Load models on startup since they are already cached in the Docker image
-    print("Loading models on startup...")
+# Longest sequence accepted for a non-streamed sliding-window scan
+MAX_SLIDING_WINDOW_LENGTH = 1000
+
+# Response formats for streamed sliding-window scans
+STREAM_FORMATS = {
+    "ndjson": "application/x-ndjson",
+    "sse": "text/event-stream",
+    "msgpack": "application/msgpack"
+}
+
+# Batching engines and micro-batch schedulers, one per HLA class, created on first use
+batching_engines = {}
+micro_batchers = {}
+
+# Multi-process CPU inference pool, started on first use when configured
+inference_pool = None
+inference_pool_lock = threading.Lock()
+
+# Seconds a request waits for a model that is still loading
+MODEL_WAIT_TIMEOUT = float(os.environ.get('TRANSHLA_MODEL_WAIT_TIMEOUT', 120))
+
+# orjson-backed JSON for every response, and compressed request bodies
+app.json = WireJSONProvider(app)
+app.wsgi_app = DecompressRequests(app.wsgi_app, app.config['MAX_CONTENT_LENGTH'])
+
+# Background jobs for long predictions, run on threads with the loaded models
+job_manager = JobManager(os.path.join(CACHE_DIR, 'jobs'))
+
+# Persistent score store shared by all workers
+score_store = open_score_store(os.path.join(CACHE_DIR, 'scores.sqlite3'))
+
+# Fast lane and fair-share queue in front of /predict
+admission = AdmissionController()
+
+# Epitope index built by `python -m app.epitope_index build`, opened on first query
+EPITOPE_INDEX_PATH = os.environ.get('TRANSHLA_EPITOPE_INDEX', os.path.join(CACHE_DIR, 'epitope_index'))
+epitope_index = None
+epitope_index_mtime = None
+epitope_index_lock = threading.Lock()
+
+# Structure backend behind the structure cache and the on-disk PDB store
+structure_service = create_structure_service(structure_cache, os.path.join(CACHE_DIR, 'structures'))
+
+
+def client_id():
+    """Identify the client for fair sharing: X-Client-ID if sent, else its address."""
+    return request.headers.get('X-Client-ID') or request.remote_addr or 'unknown'
+
+def admit_request(cost):
+    """Admit a request of the given cost in windows, or return a 429 response.
+
+    The slot is held until the response has been sent.
+    """
+    lane = admission.lane(cost)
     try:
-        from .model_loader import load_models
-        models_loaded = load_models()
-        if models_loaded:
-            print("Models loaded successfully on startup")
-        else:
-            print("Failed to load models on startup, will try again when needed")
-    except Exception as e:
-        print(f"Error during startup model loading: {str(e)}")
-        traceback.print_exc()
+        g.admission_ticket = admission.admit(client_id(), cost)
+    except Overloaded as e:
+        ADMISSIONS.inc(lane=lane, outcome='rejected')
+        log_event("rejected", lane=lane, cost=cost, client=client_id(), retry_after=e.retry_after)
+        response = jsonify({"error": str(e), "retry_after": e.retry_after})
+        response.headers['Retry-After'] = str(e.retry_after)
+        return response, 429
+    ADMISSIONS.inc(lane=lane, outcome='admitted')
+    return None
 
-def pad_sequences(sequences, max_length):
-    """Pad sequences to a fixed length."""
-    padded_sequences = []
-    for seq in sequences:
-        padding_length = max_length - len(seq)
-        if padding_length > 0:
-            seq.extend([1] * padding_length)
-        padded_sequences.append(seq)
-    return padded_sequences
+def models_unavailable_response(hla_classes):
+    """Wait for the given class models; return an error response if they are not ready."""
+    if wait_for_models(hla_classes, MODEL_WAIT_TIMEOUT):
+        return None
+    states = model_loader.readiness()["models"]
+    if any(states[c]["status"] == "failed" for c in hla_classes):
+        return jsonify({'error': 'Models could not be loaded. Please check server logs.'}), 500
+    response = jsonify({'error': 'Models are still loading. Please retry shortly.'})
+    response.headers['Retry-After'] = '10'
+    return response, 503
 
 def is_valid_peptide(peptide):
     """Check if a peptide contains only valid amino acid letters."""
     valid_aa = set("ACDEFGHIKLMNPQRSTVWY")
     return set(peptide.upper()).issubset(valid_aa)
 
-def generate_peptides(sequence, hla_class, fixed_window_size=None):
-    """Generate all possible peptides from a sequence based on HLA class.
-    If fixed_window_size is provided, only generate peptides of that exact length."""
-    sequence = sequence.upper()
-    peptides = []
-    
-    # Define peptide length range based on HLA class
-    if hla_class == "I":
-        if fixed_window_size:
-            length_range = [fixed_window_size]
-        else:
-            length_range = range(8, 15)  # 8-14 amino acids for Class I
-    else:  # Class II
-        if fixed_window_size:
-            length_range = [fixed_window_size]
-        else:
-            length_range = range(13, 22)  # 13-21 amino acids for Class II
+def get_inference_pool():
+    """Return the CPU inference pool, or None when inference runs in-process.
+
+    The pool is started once both models are loaded. Call this before the
+    process starts any other thread (gunicorn's post_fork, run.py) so the
+    workers are forked and inherit the models; see app/inference_pool.py.
+    """
+    global inference_pool
+    if INFERENCE_WORKERS <= 0 or device.type != 'cpu':
+        return None
+    with inference_pool_lock:
+        if inference_pool is None or inference_pool.broken:
+            if not load_models():
+                return None
+            inference_pool = InferencePool(INFERENCE_WORKERS, CORES_PER_WORKER, device)
+    return inference_pool
+
+def get_batching_engine(hla_class):
+    """Return the batching engine for the model of the given HLA class."""
+    pool = get_inference_pool()
+    if pool is not None:
+        engine = batching_engines.get(hla_class)
+        if not isinstance(engine, PoolEngine) or engine.pool is not pool:
+            engine = PoolEngine(pool, hla_class)
+            batching_engines[hla_class] = engine
+        return engine
+    model = model_loader.get_model(hla_class)
+    engine = batching_engines.get(hla_class)
+    if engine is None or engine.model is not model:
+        engine = BatchingEngine(model, hla_class, device)
+        batching_engines[hla_class] = engine
+    return engine
+
+def get_micro_batcher(hla_class):
+    """Return the micro-batch scheduler that feeds the model of an HLA class."""
+    batcher = micro_batchers.get(hla_class)
+    if batcher is None:
+        batcher = MicroBatcher(
+            f"class_{hla_class}",
+            lambda peptides: get_batching_engine(hla_class).predict(peptides)
+        )
+        micro_batchers[hla_class] = batcher
+    return batcher
+
+def get_model_version(hla_class):
+    """Return the version tag of the model serving an HLA class."""
+    return model_version(model_loader.get_model(hla_class))
+
+def lookup_scores(peptides, hla_class, version):
+    """Look peptides up in the memory cache, then the persistent store.
+
+    Returns a list with the cached probability or None for each peptide.
+    """
+    keys = [(peptide, hla_class, version) for peptide in peptides]
+    cached = score_cache.get_many(keys)
+    if score_store is None:
+        return cached
+    missing = [i for i, value in enumerate(cached) if value is None]
+    if missing:
+        stored = score_store.get_many([peptides[i] for i in missing], hla_class, version)
+        if stored:
+            for i in missing:
+                cached[i] = stored.get(peptides[i])
+            score_cache.put_many(((p, hla_class, version), v) for p, v in stored.items())
+    return cached
+
+def save_scores(peptides, probabilities, hla_class, version):
+    """Write freshly computed scores to the memory cache and persistent store."""
+    score_cache.put_many(zip(((p, hla_class, version) for p in peptides), probabilities))
+    if score_store is not None:
+        try:
+            score_store.put_many(peptides, probabilities, hla_class, version)
+        except Exception as e:
+            print(f"Warning: could not write to score store: {str(e)}")
+
+def score_peptides(peptides, hla_class, score_all=None):
+    """Return float32 epitope probabilities, running inference only on cache misses.
+
+    score_all, if given, is called instead of the batching engine when no
+    peptide is cached and must return probabilities for all of them.
+    """
+    version = get_model_version(hla_class)
+    cached = lookup_scores(peptides, hla_class, version)
+    missing = [i for i, value in enumerate(cached) if value is None]
+    if not missing:
+        return np.array(cached, dtype=np.float32)
     
-    # Generate all possible peptides within the length range
-    for length in length_range:
-        for i in range(len(sequence) - length + 1):
-            peptide = sequence[i:i+length]
-            if is_valid_peptide(peptide):
-                peptides.append({
-                    "peptide": peptide,
-                    "position": i + 1,  # 1-indexed position
-                    "length": length,
-                    "class": hla_class
-                })
+    if score_all is not None and len(missing) == len(peptides):
+        probabilities = score_all()
+        save_scores(peptides, probabilities.tolist(), hla_class, version)
+        return probabilities
     
-    return peptides
+    probabilities = np.array([0.0 if value is None else value for value in cached], dtype=np.float32)
+    missing_peptides = [peptides[i] for i in missing]
+    scored = get_batching_engine(hla_class).predict(missing_peptides)
+    probabilities[missing] = scored
+    save_scores(missing_peptides, scored.tolist(), hla_class, version)
+    return probabilities
+
+def run_single_prediction(peptide, hla_class, threshold=EPITOPE_THRESHOLD):
+    """Predict one peptide, sharing a forward pass with concurrent requests.
 
-def run_prediction(peptides, hla_class):
-    """Run prediction for each peptide and return results."""
+    With hla_class "both", every class whose length range covers the
+    peptide is scored.
+    """
     results = []
+    for length, classes in length_classes(hla_class, len(peptide)):
+        for peptide_class in classes:
+            version = get_model_version(peptide_class)
+            probability = lookup_scores([peptide], peptide_class, version)[0]
+            if probability is None:
+                probability = get_micro_batcher(peptide_class).predict(peptide)
+                save_scores([peptide], [probability], peptide_class, version)
+            results.append({
+                "peptide": peptide,
+                "position": 1,
+                "length": length,
+                "class": peptide_class,
+                "probability": probability,
+                "is_epitope": probability > threshold
+            })
+    return results
+
+def score_window_chunk(peptides, residue_ids, length, starts, classes, saliency=None):
+    """Score one chunk of same-length windows for each HLA class in classes.
+
+    Returns a dict of class -> probabilities. When both classes score the
+    chunk and the models share a backbone, the class II pass keeps its
+    backbone outputs so the class I pass reuses them instead of embedding
+    the same peptides again. With a SaliencyProfile, every window is run
+    through the model, skipping the score cache, and its per-residue
+    importance is added to the profile.
+    """
+    shared_backbone = model_loader.shared_backbone
+    reuse = shared_backbone is not None and len(classes) > 1
+    scores = {}
+    # Widest inputs first, so narrower ones can be cropped from them
+    for hla_class in sorted(classes, key=MAX_TOKEN_LENGTH.get, reverse=True):
+        engine = get_batching_engine(hla_class)
+        context = nullcontext()
+        if reuse:
+            context = shared_backbone.capture() if hla_class == "II" else shared_backbone.replay()
+        with context:
+            if saliency is None:
+                scores[hla_class] = score_peptides(
+                    peptides, hla_class,
+                    score_all=lambda: engine.predict_windows(residue_ids, length, starts=starts)[1]
+                )
+                continue
+            recorder = SaliencyRecorder(model_loader.get_model(hla_class))
+            scores[hla_class] = engine.predict_windows(residue_ids, length, starts=starts, recorder=recorder)[1]
+        saliency.add(hla_class, starts, length, scores[hla_class], recorder.importance(length))
+        save_scores(peptides, scores[hla_class].tolist(), hla_class, get_model_version(hla_class))
+    return scores
+
+def iter_sliding_predictions(sequence, hla_class, fixed_window_size=None, chunk_size=None, saliency=None):
+    """Yield WindowResults for every window of a sequence, one batch at a time.
+
+    Only windows missing from the score cache are run through the model.
+    When none of a batch is cached, its windows are scored from strided
+    views of the protein, which is tokenized once.
+    """
+    sequence = sequence.upper()
+    # One chunk must fit a single batch of every engine for embeddings to be reused
+    chunk_size = chunk_size or min(get_batching_engine(c).batch_size for c in HLA_CLASSES[hla_class])
+    residue_ids = encode_sequence(sequence)
+    valid = valid_residues(sequence)
     
-    # Choose the appropriate model based on HLA class
-    model = transHLA_I_model if hla_class == "I" else transHLA_II_model
+    for length, classes in length_classes(hla_class, fixed_window_size):
+        with stage('windows'):
+            all_starts = valid_window_starts(valid, length)
+        for begin in range(0, len(all_starts), chunk_size):
+            starts = all_starts[begin:begin + chunk_size]
+            with stage('windows'):
+                peptides = [sequence[start:start + length] for start in starts.tolist()]
+            scores = score_window_chunk(peptides, residue_ids, length, starts, classes, saliency)
+            yield WindowResults.concat(sequence, HLA_CLASSES[hla_class], (
+                WindowResults.for_windows(sequence, HLA_CLASSES[hla_class], peptide_class,
+                                          starts, length, scores[peptide_class])
+                for peptide_class in classes
+            ))
+
+def run_sliding_prediction(sequence, hla_class, fixed_window_size=None, saliency=None):
+    """Run prediction over every window of a sequence and return WindowResults.
+
+    Pass a SaliencyProfile to also aggregate per-residue importance.
+    """
+    return WindowResults.concat(sequence.upper(), HLA_CLASSES[hla_class],
+                                iter_sliding_predictions(sequence, hla_class, fixed_window_size, saliency=saliency))
+
+def parse_window_size(window_size, hla_class):
+    """Return a requested window size as an int (None if not given); raises ValueError if out of range."""
+    if window_size is None or window_size == '':
+        return None
+    try:
+        window_size = int(window_size)
+    except (TypeError, ValueError):
+        raise ValueError("Window size must be an integer")
     
-    # Process peptides in batches for better performance
-    batch_size = 32
-    for i in range(0, len(peptides), batch_size):
-        batch_peptides = peptides[i:i + batch_size]
-        
-        # Tokenize the batch
-        batch_encoding = tokenizer([p["peptide"] for p in batch_peptides])['input_ids']
-        
-        # Pad sequences to appropriate length
-        max_length = 16 if hla_class == "I" else 23
-        padded_encoding = pad_sequences(batch_encoding, max_length)
+    if hla_class == 'I' and not (8 <= window_size <= 14):
+        raise ValueError("HLA class I window size should be 8-14 amino acids")
+    if hla_class == 'II' and not (13 <= window_size <= 21):
+        raise ValueError("HLA class II window size should be 13-21 amino acids")
+    if hla_class == 'both' and not (8 <= window_size <= 21):
+        raise ValueError("Window size for both HLA classes should be 8-21 amino acids")
+    return window_size
+
+def count_windows(sequence, hla_class, fixed_window_size=None):
+    """Count the windows a sliding-window scan of sequence will score."""
+    valid = valid_residues(sequence)
+    return sum(len(valid_window_starts(valid, length)) * len(classes)
+               for length, classes in length_classes(hla_class, fixed_window_size))
+
+def format_stream_record(record, stream_format):
+    """Encode one streamed record as an NDJSON line, a server-sent event or a MessagePack object."""
+    if stream_format == 'msgpack':
+        return packb(record)
+    payload = dumps(record)
+    if stream_format == 'sse':
+        return f"event: {record['type']}\ndata: {payload.decode()}\n\n"
+    return payload + b"\n"
+
+def stream_sliding_prediction(sequence, hla_class, window_size, stream_format, layout='columns', selection=None):
+    """Stream a sliding-window scan, flushing each batch as soon as it is scored.
+
+    Records are typed: a 'start' record with the total window count, one
+    'results' record per batch in the requested layout, and a final
+    'summary' record (or 'error'). The threshold and epitopes_only of a
+    selection are applied to every batch.
+    """
+    threshold = selection["threshold"] if selection else EPITOPE_THRESHOLD
+    epitopes_only = bool(selection and selection["epitopes_only"])
+    start_time = time.time()
+    
+    def generate():
+        total_windows = count_windows(sequence, hla_class, window_size)
+        yield format_stream_record({
+            "type": "start",
+            "original_sequence": sequence,
+            "hla_class": hla_class,
+            "layout": layout,
+            "total_windows": total_windows
+        }, stream_format)
         
-        # Convert to tensor and move to device
-        input_tensor = torch.tensor(padded_encoding).to(device)
+        total_peptides = 0
+        epitope_count = 0
+        try:
+            for batch in iter_sliding_predictions(sequence, hla_class, window_size):
+                batch = batch.with_threshold(threshold)
+                total_peptides += len(batch)
+                epitope_count += batch.epitope_count
+                if epitopes_only:
+                    batch = batch.take(np.flatnonzero(batch.is_epitope))
+                    if not len(batch):
+                        continue
+                with stage('serialize'):
+                    record = format_stream_record({"type": "results", "results": batch.serialize(layout)}, stream_format)
+                yield record
+        except Exception as e:
+            print(f"Error in streamed prediction: {str(e)}")
+            traceback.print_exc()
+            yield format_stream_record({"type": "error", "error": str(e)}, stream_format)
+            return
         
-        # Run the model
-        with torch.no_grad():
-            outputs, _ = model(input_tensor)
-            
-            # Process each prediction in the batch
-            for j, peptide_data in enumerate(batch_peptides):
-                probability = outputs[j][1].item()
-                is_epitope = probability > 0.5
-                
-                results.append({
-                    "peptide": peptide_data["peptide"],
-                    "position": peptide_data["position"],
-                    "length": peptide_data["length"],
-                    "class": peptide_data["class"],
-                    "probability": probability,
-                    "is_epitope": is_epitope
-                })
+        yield format_stream_record({
+            "type": "summary",
+            "total_peptides": total_peptides,
+            "epitope_count": epitope_count,
+            "epitope_density": epitope_count / total_peptides if total_peptides else 0
+        }, stream_format)
+        log_event("prediction", mode="sliding", stream=stream_format, hla_class=hla_class,
+                  sequence_length=len(sequence), windows=total_peptides,
+                  seconds=round(time.time() - start_time, 4))
     
-    return results
+    return Response(
+        stream_with_context(generate()),
+        mimetype=STREAM_FORMATS[stream_format],
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
 @app.route('/predict', methods=['POST'])
 def predict():
     if request.method == 'POST':
         start_time = time.time()
         try:
-            data = request.get_json()
-            
-            # Extract parameters
-            sequence = data.get('sequence', '').strip().upper()
-            mode = data.get('mode', 'single')
-            hla_class = data.get('hla_class', 'I')
-            use_fixed_window_size = data.get('useFixedWindowSize', False)
-            window_size = data.get('windowSize') if use_fixed_window_size else None
+            with stage('parse'):
+                data = request.get_json()
             
-            # Check if models are loaded
-            global models_loaded, tokenizer, transHLA_I_model, transHLA_II_model
-            if not models_loaded or tokenizer is None or transHLA_I_model is None or transHLA_II_model is None:
-                # Try loading models one more time
-                models_loaded = load_models()
-                if not models_loaded:
-                    return jsonify({'error': 'Models could not be loaded. Please check server logs.'}), 500
-            
-            # Validate sequence
-            if not sequence:
-                return jsonify({"error": "No peptide sequence provided"}), 400
+            with stage('validate'):
+                # Extract parameters
+                sequence = data.get('sequence', '').strip().upper()
+                mode = data.get('mode', 'single')
+                hla_class = data.get('hla_class', 'I')
+                use_fixed_window_size = data.get('useFixedWindowSize', False)
+                window_size = data.get('windowSize') if use_fixed_window_size else None
+                layout = data.get('layout', 'columns')
+                
+                if hla_class not in HLA_CLASSES:
+                    return jsonify({"error": "hla_class must be 'I', 'II' or 'both'"}), 400
+                
+                if layout not in RESULT_LAYOUTS:
+                    return jsonify({"error": f"Unsupported layout. Use one of: {', '.join(RESULT_LAYOUTS)}"}), 400
+                
+                try:
+                    selection = parse_selection(data, EPITOPE_THRESHOLD)
+                except (TypeError, ValueError) as e:
+                    return jsonify({"error": str(e)}), 400
+                
+                # Validate sequence
+                if not sequence:
+                    return jsonify({"error": "No peptide sequence provided"}), 400
+                
+                if not is_valid_peptide(sequence):
+                    return jsonify({"error": "Peptide contains invalid amino acid letters"}), 400
             
-            if not is_valid_peptide(sequence):
-                return jsonify({"error": "Peptide contains invalid amino acid letters"}), 400
+            # Wait for the models this request needs; background jobs wait in their thread
+            if not data.get('async'):
+                unavailable = models_unavailable_response(HLA_CLASSES[hla_class])
+                if unavailable is not None:
+                    return unavailable
             
             # Single peptide mode
             if mode == 'single':
-                # Generate cache key
-                cache_key = f"single_{sequence}_{hla_class}"
-                
-                # Check if result is in cache
-                if cache_key in prediction_cache:
-                    print(f"Cache hit for {cache_key}")
-                    return jsonify(prediction_cache[cache_key])
-                
                 # Validate peptide length
                 if hla_class == 'I' and not (8 <= len(sequence) <= 14):
                     return jsonify({"error": "HLA class I peptides should be 8-14 amino acids long"}), 400
@@ -189,92 +502,508 @@ def predict():
                 if hla_class == 'II' and not (13 <= len(sequence) <= 21):
                     return jsonify({"error": "HLA class II peptides should be 13-21 amino acids long"}), 400
                 
+                if hla_class == 'both' and not (8 <= len(sequence) <= 21):
+                    return jsonify({"error": "Peptides scored for both HLA classes should be 8-21 amino acids long"}), 400
+                
+                rejected = admit_request(1)
+                if rejected is not None:
+                    return rejected
+                
                 # Run prediction
-                peptides = [{"peptide": sequence, "position": 1, "length": len(sequence), "class": hla_class}]
-                results = run_prediction(peptides, hla_class)
+                results = run_single_prediction(sequence, hla_class, selection["threshold"])
                 
                 response = {
                     "peptide": sequence,
                     "results": results
                 }
                 
-                # Cache the result
-                prediction_cache[cache_key] = response
-                # Remove oldest entry if cache is full
-                if len(prediction_cache) > MAX_CACHE_SIZE:
-                    oldest_key = next(iter(prediction_cache))
-                    del prediction_cache[oldest_key]
-                
-                print(f"Prediction completed in {time.time() - start_time:.2f} seconds")
-                return jsonify(response)
+                log_event("prediction", mode="single", hla_class=hla_class,
+                          seconds=round(time.time() - start_time, 4))
+                with stage('serialize'):
+                    return encode_response(response)
             
             # Sliding window mode
             else:
-                # Check sequence length for sliding window mode
-                MAX_SLIDING_WINDOW_LENGTH = 1000  # Set a reasonable maximum length
-                if len(sequence) > MAX_SLIDING_WINDOW_LENGTH:
+                # Check sequence length for sliding window mode; streamed
+                # responses and background jobs hold one batch at a time so
+                # are not capped
+                stream_format = data.get('stream')
+                if not stream_format and not data.get('async') and len(sequence) > MAX_SLIDING_WINDOW_LENGTH:
                     return jsonify({
-                        "error": f"Sequence too long for sliding window analysis. Maximum allowed length is {MAX_SLIDING_WINDOW_LENGTH} amino acids. Please use a shorter sequence or select a specific region of interest."
+                        "error": f"Sequence too long for sliding window analysis. Maximum allowed length is {MAX_SLIDING_WINDOW_LENGTH} amino acids. Please use a shorter sequence, request a streamed response, or submit it as a background job."
                     }), 400
                 
-                # Generate cache key, including window size if used
-                cache_key = f"sliding_{sequence}_{hla_class}_{window_size if window_size else 'all'}"
-                
-                # Check if result is in cache
-                if cache_key in prediction_cache:
-                    print(f"Cache hit for {cache_key}")
-                    return jsonify(prediction_cache[cache_key])
-                
                 # Process window_size if provided
-                if window_size is not None:
-                    window_size = int(window_size)
-                    
-                    # Validate window size
-                    if hla_class == 'I' and not (8 <= window_size <= 14):
-                        return jsonify({"error": "HLA class I window size should be 8-14 amino acids"}), 400
-                    
-                    if hla_class == 'II' and not (13 <= window_size <= 21):
-                        return jsonify({"error": "HLA class II window size should be 13-21 amino acids"}), 400
+                try:
+                    window_size = parse_window_size(window_size, hla_class)
+                except ValueError as e:
+                    return jsonify({"error": str(e)}), 400
                 
-                # Generate all peptides
-                peptides = generate_peptides(sequence, hla_class, window_size)
+                # Run as a background job if requested
+                if data.get('async'):
+                    if count_windows(sequence, hla_class, window_size) == 0:
+                        return jsonify({"error": "No valid peptides could be generated from the input sequence"}), 400
+                    return jsonify({"job_id": submit_sliding_job(sequence, hla_class, window_size)}), 202
                 
-                if not peptides:
-                    return jsonify({"error": "No valid peptides could be generated from the input sequence"}), 400
+                # Large scans queue behind each other, never in front of cheap requests
+                rejected = admit_request(count_windows(sequence, hla_class, window_size))
+                if rejected is not None:
+                    return rejected
                 
-                # Run prediction
-                results = run_prediction(peptides, hla_class)
+                # Stream results batch by batch if requested
+                if stream_format:
+                    if stream_format not in STREAM_FORMATS:
+                        return jsonify({"error": f"Unsupported stream format. Use one of: {', '.join(STREAM_FORMATS)}"}), 400
+                    if stream_format == 'msgpack' and not installed('msgpack'):
+                        return jsonify({"error": "MessagePack streams require msgpack on the server"}), 400
+                    if is_ranked(selection):
+                        return jsonify({"error": "top_k, min_distance and hotspots need the whole scan and cannot be streamed"}), 400
+                    if data.get('saliency'):
+                        return jsonify({"error": "saliency needs the whole scan and cannot be streamed"}), 400
+                    if count_windows(sequence, hla_class, window_size) == 0:
+                        return jsonify({"error": "No valid peptides could be generated from the input sequence"}), 400
+                    return stream_sliding_prediction(sequence, hla_class, window_size, stream_format, layout, selection)
                 
-                # Count epitopes
-                epitope_count = sum(1 for r in results if r["is_epitope"])
+                # Per-residue saliency needs every window run in this process
+                saliency = None
+                if data.get('saliency'):
+                    if get_inference_pool() is not None:
+                        return jsonify({"error": "saliency is not available with the inference pool"}), 400
+                    saliency = SaliencyProfile(sequence, HLA_CLASSES[hla_class])
                 
-                response = {
-                    "original_sequence": sequence,
-                    "hla_class": hla_class,
-                    "results": results,
-                    "total_peptides": len(results),
-                    "epitope_count": epitope_count,
-                    "epitope_density": epitope_count / len(results) if results else 0
-                }
+                # Run prediction over all windows
+                results = run_sliding_prediction(sequence, hla_class, window_size, saliency)
+                
+                if not len(results):
+                    return jsonify({"error": "No valid peptides could be generated from the input sequence"}), 400
                 
-                # Cache the result
-                prediction_cache[cache_key] = response
-                # Remove oldest entry if cache is full
-                if len(prediction_cache) > MAX_CACHE_SIZE:
-                    oldest_key = next(iter(prediction_cache))
-                    del prediction_cache[oldest_key]
+                with stage('postprocess'):
+                    # Count epitopes
+                    results = results.with_threshold(selection["threshold"])
+                    epitope_count = results.epitope_count
+                    
+                    selected = results.take(select_windows(
+                        results, selection["top"], selection["per_length"],
+                        selection["min_distance"], selection["epitopes_only"]
+                    ))
+                    
+                    response = {
+                        "original_sequence": sequence,
+                        "hla_class": hla_class,
+                        "results": selected.serialize(layout),
+                        "total_peptides": len(results),
+                        "returned_peptides": len(selected),
+                        "threshold": selection["threshold"],
+                        "epitope_count": epitope_count,
+                        "epitope_density": epitope_count / len(results) if results else 0
+                    }
+                    if selection["hotspots"]:
+                        response["hotspots"] = hotspots(results)
+                    if saliency is not None:
+                        response["saliency"] = saliency.to_dict()
                 
-                print(f"Sliding window analysis completed in {time.time() - start_time:.2f} seconds")
-                return jsonify(response)
+                log_event("prediction", mode="sliding", hla_class=hla_class, sequence_length=len(sequence),
+                          windows=len(results), seconds=round(time.time() - start_time, 4))
+                with stage('serialize'):
+                    return encode_response(response)
         except Exception as e:
             print(f"Error in prediction: {str(e)}")
             traceback.print_exc()
             return jsonify({"error": str(e)}), 500
 
+@app.route('/predict/batch', methods=['POST'])
+def predict_batch():
+    """
+    Score many peptides in one request. Peptides are given as a JSON array
+    (the body itself, or 'peptides' with 'ids' optional) or as an uploaded
+    FASTA or CSV file in multipart field 'file' (CSV peptides are read from
+    a 'peptide' or 'sequence' column, ids from 'id'). With hla_class 'both'
+    (the default) each peptide is scored by every class covering its length.
+    Results are returned as one array per field; format 'arrow' or 'parquet'
+    returns the same columns as Arrow stream or Parquet bytes.
+    """
+    start_time = time.time()
+    try:
+        if request.files:
+            data = request.form
+            if 'file' not in request.files:
+                return jsonify({"error": "No file provided in field 'file'"}), 400
+            upload = request.files['file']
+            ids, peptides = read_upload(upload.stream, secure_filename(upload.filename or ''))
+        else:
+            data = request.get_json(silent=True)
+            if isinstance(data, list):
+                data = {"peptides": data}
+            data = data or {}
+            peptides = data.get('peptides')
+            ids = data.get('ids')
+            if not isinstance(peptides, list):
+                return jsonify({"error": "Provide 'peptides' as a JSON array or upload a FASTA/CSV file"}), 400
+            if ids is not None and len(ids) != len(peptides):
+                return jsonify({"error": "'ids' must have one entry per peptide"}), 400
+        
+        hla_class = data.get('hla_class', 'both')
+        output_format = data.get('format', 'json')
+        if hla_class not in HLA_CLASSES:
+            return jsonify({"error": "hla_class must be 'I', 'II' or 'both'"}), 400
+        if output_format != 'json' and output_format not in ARROW_FORMATS:
+            return jsonify({"error": f"Unsupported format. Use one of: json, {', '.join(ARROW_FORMATS)}"}), 400
+        if not peptides:
+            return jsonify({"error": "No peptides provided"}), 400
+        if len(peptides) > MAX_BULK_PEPTIDES:
+            return jsonify({"error": f"Too many peptides ({len(peptides)}). Maximum allowed is {MAX_BULK_PEPTIDES}; submit larger sets as a scan job."}), 400
+        
+        peptides, valid, errors = validate_peptides(peptides, hla_class)
+        invalid = np.flatnonzero(~valid)
+        
+        unavailable = models_unavailable_response(HLA_CLASSES[hla_class])
+        if unavailable is not None:
+            return unavailable
+        
+        scored, unique_scored = score_bulk(peptides, valid, hla_class, score_peptides)
+        columns = columnar_results(peptides, ids, scored)
+        log_event("bulk_prediction", hla_class=hla_class, peptides=len(peptides), invalid=len(invalid),
+                  unique_scored=unique_scored, format=output_format, seconds=round(time.time() - start_time, 4))
+        
+        if output_format in ARROW_FORMATS:
+            try:
+                payload = columns_to_arrow(columns, output_format)
+            except RuntimeError as e:
+                return jsonify({"error": str(e)}), 400
+            return Response(payload, mimetype=ARROW_FORMATS[output_format],
+                            headers={"X-Invalid-Peptides": str(len(invalid))})
+        
+        return encode_response({
+            "hla_class": hla_class,
+            "total_peptides": len(peptides),
+            "unique_scored": unique_scored,
+            "epitope_count": int(columns["is_epitope"].sum()),
+            "columns": columns_to_json(columns),
+            "invalid": {
+                "index": invalid.tolist(),
+                "peptide": [peptides[i] for i in invalid.tolist()],
+                "error": errors[invalid].tolist()
+            }
+        })
+    except Exception as e:
+        log_event("error", endpoint="bulk", error=str(e))
+        traceback.print_exc()
+        return jsonify({"error": str(e)}), 500
+
+def collect_variants(reference, data):
+    """Return (name, sequence) pairs for the variants described by a request.
+
+    Raises ValueError for malformed variants.
+    """
+    variants = []
+    for spec in data.get('mutations') or []:
+        mutations = parse_mutations(spec, reference)
+        variants.append((mutation_name(mutations), apply_mutations(reference, mutations)))
+    for index, entry in enumerate(data.get('variants') or []):
+        name, sequence = f"variant_{index + 1}", entry
+        if isinstance(entry, dict):
+            name, sequence = entry.get('name') or name, entry.get('sequence', '')
+        sequence = str(sequence).strip().upper()
+        if not sequence or not is_valid_peptide(sequence):
+            raise ValueError(f"Variant '{name}' is empty or contains invalid amino acid letters")
+        variants.append((name, sequence))
+    saturation = data.get('saturation')
+    if saturation:
+        bounds = saturation if isinstance(saturation, dict) else {}
+        for mutations in saturation_mutations(reference, int(bounds.get('start', 1)),
+                                              int(bounds['end']) if bounds.get('end') else None):
+            variants.append((mutation_name(mutations), apply_mutations(reference, mutations)))
+    for name, sequence in variants:
+        if len(sequence) > MAX_SLIDING_WINDOW_LENGTH:
+            raise ValueError(f"Variant '{name}' is too long for variant scanning. Maximum allowed length is {MAX_SLIDING_WINDOW_LENGTH} amino acids.")
+    return variants
+
+@app.route('/api/variants', methods=['POST'])
+def predict_variants():
+    """
+    Score variants of a reference sequence, re-running the model only on
+    windows that overlap each variant's changes. Variants are given as
+    'mutations' (e.g. ["A12V", "K45R,L46P"]), 'variants' (full sequences,
+    or {name, sequence} objects) and/or 'saturation' (true, or {start, end}
+    to try every substitution at those 1-indexed positions). Returns
+    per-variant score deltas against the reference, with the changed
+    windows unless include_windows is false (the default for saturation).
+    """
+    start_time = time.time()
+    try:
+        data = request.get_json(silent=True) or {}
+        reference = (data.get('reference') or data.get('sequence') or '').strip().upper()
+        hla_class = data.get('hla_class', 'I')
+        window_size = data.get('windowSize') if data.get('useFixedWindowSize') else None
+        include_windows = bool(data.get('include_windows', not data.get('saturation')))
+        
+        if hla_class not in HLA_CLASSES:
+            return jsonify({"error": "hla_class must be 'I', 'II' or 'both'"}), 400
+        if not reference:
+            return jsonify({"error": "No reference sequence provided"}), 400
+        if not is_valid_peptide(reference):
+            return jsonify({"error": "Reference sequence contains invalid amino acid letters"}), 400
+        if len(reference) > MAX_SLIDING_WINDOW_LENGTH:
+            return jsonify({"error": f"Reference sequence too long for variant scanning. Maximum allowed length is {MAX_SLIDING_WINDOW_LENGTH} amino acids."}), 400
+        
+        try:
+            window_size = parse_window_size(window_size, hla_class)
+            variants = collect_variants(reference, data)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        if not variants:
+            return jsonify({"error": "No variants provided. Give mutations, variant sequences or a saturation range."}), 400
+        if len(variants) > MAX_VARIANTS:
+            return jsonify({"error": f"Too many variants ({len(variants)}). Maximum allowed is {MAX_VARIANTS}."}), 400
+        
+        unavailable = models_unavailable_response(HLA_CLASSES[hla_class])
+        if unavailable is not None:
+            return unavailable
+        
+        summary, results, stats = scan_variants(
+            reference, variants, hla_class, score_peptides, window_size, include_windows
+        )
+        
+        log_event("variant_scan", hla_class=hla_class, sequence_length=len(reference), variants=len(variants),
+                  windows_scored=stats['windows_scored'], windows_reused=stats['windows_reused'],
+                  seconds=round(time.time() - start_time, 4))
+        return encode_response({
+            "reference": dict(summary, sequence=reference),
+            "hla_class": hla_class,
+            "variants": results,
+            **stats
+        })
+    except Exception as e:
+        log_event("error", endpoint="variants", error=str(e))
+        traceback.print_exc()
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/jobs', methods=['POST'])
+def submit_job():
+    """
+    Submit a background job and return its ID. Job types:
+    'sliding' (sequence, hla_class, windowSize), 'scan' (FASTA upload in
+    multipart field 'file' or FASTA text in 'fasta'; hla_class may be 'both')
+    and 'structure' (sequence).
+    """
+    try:
+        data = request.form if request.files else (request.get_json(silent=True) or {})
+        job_type = data.get('type', 'sliding')
+        
+        if job_type in ('sliding', 'structure'):
+            sequence = data.get('sequence', '').strip().upper()
+            if not sequence:
+                return jsonify({"error": "No sequence provided"}), 400
+            if not is_valid_peptide(sequence):
+                return jsonify({"error": "Sequence contains invalid amino acid letters"}), 400
+            if job_type == 'structure':
+                return jsonify({"job_id": job_manager.submit('structure', {"sequence": sequence})}), 202
+            
+            hla_class = data.get('hla_class', 'I')
+            if hla_class not in HLA_CLASSES:
+                return jsonify({"error": "hla_class must be 'I', 'II' or 'both'"}), 400
+            try:
+                window_size = parse_window_size(data.get('windowSize'), hla_class)
+            except ValueError as e:
+                return jsonify({"error": str(e)}), 400
+            if count_windows(sequence, hla_class, window_size) == 0:
+                return jsonify({"error": "No valid peptides could be generated from the input sequence"}), 400
+            return jsonify({"job_id": submit_sliding_job(sequence, hla_class, window_size)}), 202
+        
+        if job_type == 'scan':
+            hla_classes = data.get('hla_class', 'both')
+            hla_classes = ['I', 'II'] if hla_classes == 'both' else [hla_classes]
+            if any(c not in ('I', 'II') for c in hla_classes):
+                return jsonify({"error": "hla_class must be 'I', 'II' or 'both'"}), 400
+            if 'file' not in request.files and not data.get('fasta'):
+                return jsonify({"error": "No FASTA file or text provided"}), 400
+            
+            try:
+                window_size = parse_window_size(data.get('windowSize'), 'both' if len(hla_classes) == 2 else hla_classes[0])
+            except ValueError as e:
+                return jsonify({"error": str(e)}), 400
+            params = {
+                "hla_classes": hla_classes,
+                "window_size": window_size,
+                "epitopes_only": str(data.get('epitopes_only', '')).lower() in ('1', 'true'),
+            }
+            job_id, job_dir = job_manager.create('scan', params)
+            params["fasta_path"] = os.path.join(job_dir, 'input.fasta')
+            if 'file' in request.files:
+                request.files['file'].save(params["fasta_path"])
+            else:
+                with open(params["fasta_path"], 'w') as handle:
+                    handle.write(data['fasta'])
+            return jsonify({"job_id": job_manager.start(job_id, 'scan', params)}), 202
+        
+        return jsonify({"error": f"Unknown job type '{job_type}'"}), 400
+    except Exception as e:
+        print(f"Error submitting job: {str(e)}")
+        traceback.print_exc()
+        return jsonify({"error": str(e)}), 500
+
+def submit_sliding_job(sequence, hla_class, window_size=None):
+    """Queue a sliding-window scan as a background job and return its ID."""
+    return job_manager.submit('sliding', {
+        "sequence": sequence,
+        "hla_class": hla_class,
+        "window_size": window_size
+    })
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    """
+    Report a job's status and progress (windows done / total)
+    """
+    status = job_manager.status(job_id)
+    if status is None:
+        return jsonify({"error": "Unknown job"}), 404
+    return jsonify(status)
+
+@app.route('/api/jobs/<job_id>/results', methods=['GET'])
+def job_results(job_id):
+    """
+    Return one page of a job's results (query parameters offset and limit)
+    """
+    try:
+        offset = max(0, int(request.args.get('offset', 0)))
+        limit = int(request.args.get('limit', 1000))
+    except ValueError:
+        return jsonify({"error": "offset and limit must be integers"}), 400
+    
+    records, available = job_manager.results(job_id, offset, limit)
+    if records is None:
+        return jsonify({"error": "Unknown job"}), 404
+    status = job_manager.status(job_id)
+    return jsonify({
+        "job_id": job_id,
+        "status": status["status"],
+        "offset": offset,
+        "count": len(records),
+        "available": available,
+        "results": records
+    })
+
+@app.route('/api/jobs/<job_id>', methods=['DELETE'])
+@app.route('/api/jobs/<job_id>/cancel', methods=['POST'])
+def cancel_job(job_id):
+    """
+    Cancel a queued or running job
+    """
+    status = job_manager.cancel(job_id)
+    if status is None:
+        return jsonify({"error": "Unknown job"}), 404
+    return jsonify(status)
+
+def get_epitope_index():
+    """Return the epitope index, reopening it after a rebuild, or None if there is none."""
+    global epitope_index, epitope_index_mtime
+    try:
+        mtime = os.path.getmtime(os.path.join(EPITOPE_INDEX_PATH, 'meta.json'))
+    except OSError:
+        return None
+    with epitope_index_lock:
+        if epitope_index is None or mtime != epitope_index_mtime:
+            epitope_index = open_index(EPITOPE_INDEX_PATH)
+            epitope_index_mtime = mtime
+        return epitope_index
+
+def index_query_args():
+    """Parse hla_class, length, min_score, max_score and limit from the query string."""
+    hla_class = request.args.get('hla_class', 'I')
+    if hla_class not in PEPTIDE_LENGTHS:
+        raise ValueError(f"hla_class must be one of: {', '.join(PEPTIDE_LENGTHS)}")
+    length = request.args.get('length')
+    return {
+        "hla_class": hla_class,
+        "length": int(length) if length else None,
+        "min_score": float(request.args.get('min_score', EPITOPE_THRESHOLD)),
+        "max_score": float(request.args.get('max_score', 1.0)),
+        "limit": max(0, int(request.args.get('limit', INDEX_LIMIT))),
+    }
+
+@app.route('/api/index', methods=['GET'])
+def index_info():
+    """
+    Describe the epitope index: proteins, residues and windows per (class, length)
+    """
+    index = get_epitope_index()
+    if index is None:
+        return jsonify({"error": "No epitope index has been built"}), 404
+    return jsonify(index.meta)
+
+@app.route('/api/index/peptide/<peptide>', methods=['GET'])
+def index_peptide(peptide):
+    """
+    Find every scanned protein and position containing a peptide, with its indexed scores
+    """
+    index = get_epitope_index()
+    if index is None:
+        return jsonify({"error": "No epitope index has been built"}), 404
+    try:
+        limit = max(0, int(request.args.get('limit', INDEX_LIMIT)))
+    except ValueError:
+        return jsonify({"error": "limit must be an integer"}), 400
+    with stage("index_query"):
+        return jsonify(index.find_peptide(peptide, limit))
+
+@app.route('/api/index/windows', methods=['GET'])
+def index_windows():
+    """
+    Return indexed windows scoring between min_score and max_score, best first (offset pages through them)
+    """
+    index = get_epitope_index()
+    if index is None:
+        return jsonify({"error": "No epitope index has been built"}), 404
+    try:
+        query = index_query_args()
+        offset = max(0, int(request.args.get('offset', 0)))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    with stage("index_query"):
+        return jsonify(index.windows(offset=offset, **query))
+
+@app.route('/api/index/proteins', methods=['GET'])
+def index_proteins():
+    """
+    Return proteins with indexed windows between min_score and max_score, most windows first
+    """
+    index = get_epitope_index()
+    if index is None:
+        return jsonify({"error": "No epitope index has been built"}), 404
+    try:
+        query = index_query_args()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    with stage("index_query"):
+        return jsonify(index.proteins(**query))
+
+@app.route('/api/index/proteins/<protein_id>', methods=['GET'])
+def index_protein(protein_id):
+    """
+    Summarize one indexed protein: windows, epitopes and best window per class and length
+    """
+    index = get_epitope_index()
+    if index is None:
+        return jsonify({"error": "No epitope index has been built"}), 404
+    try:
+        threshold = float(request.args.get('threshold', EPITOPE_THRESHOLD))
+    except ValueError:
+        return jsonify({"error": "threshold must be a number"}), 400
+    summary = index.protein_summary(protein_id, threshold)
+    if summary is None:
+        return jsonify({"error": f"Protein {protein_id} is not in the index"}), 404
+    return jsonify(summary)
+
+def fetch_structure(sequence):
+    """Return the PDB structure of a sequence from the cache, the PDB store or the structure backend."""
+    return structure_service.fetch(sequence)
+
 @app.route('/api/predict-structure', methods=['POST'])
 def predict_structure():
     """
-    Endpoint to predict 3D structure of a protein sequence using ESMFold API
+    Endpoint to predict 3D structure of a protein sequence with the
+    configured structure backend
     """
     if request.method == 'POST':
         try:
@@ -288,59 +1017,132 @@ def predict_structure():
             if not is_valid_peptide(sequence):
                 return jsonify({"error": "Protein sequence contains invalid amino acid letters"}), 400
             
-            # Generate cache key
-            cache_key = f"structure_{sequence}"
+            # Run as a background job if requested
+            if data.get('async'):
+                return jsonify({"job_id": job_manager.submit('structure', {"sequence": sequence})}), 202
             
-            # Check if result is in cache
-            if cache_key in prediction_cache:
-                print(f"Cache hit for {cache_key}")
-                return jsonify(prediction_cache[cache_key])
-            
-            # Call ESMFold API
             try:
-                api_url = "https://api.esmatlas.com/foldSequence/v1/pdb/"
-                response = requests.post(api_url, data=sequence)
-                
-                if response.status_code != 200:
-                    return jsonify({"error": f"ESMFold API error: {response.text}"}), 500
-                
-                # Get the PDB structure
-                pdb_structure = response.text
-                
-                # Create response
-                result = {
-                    "sequence": sequence,
-                    "pdb_structure": pdb_structure
-                }
-                
-                # Cache the result
-                prediction_cache[cache_key] = result
-                # Remove oldest entry if cache is full
-                if len(prediction_cache) > MAX_CACHE_SIZE:
-                    oldest_key = next(iter(prediction_cache))
-                    del prediction_cache[oldest_key]
-                
-                return jsonify(result)
-                
+                pdb_structure = fetch_structure(sequence)
+            except StructureNotFound as e:
+                return jsonify({"error": str(e)}), 404
+            except StructureAPIError as e:
+                return jsonify({"error": str(e)}), 500
             except Exception as e:
-                return jsonify({"error": f"Error calling ESMFold API: {str(e)}"}), 500
+                return jsonify({"error": f"Error predicting structure: {str(e)}"}), 500
+            
+            return encode_response({
+                "sequence": sequence,
+                "pdb_structure": pdb_structure
+            })
                 
         except Exception as e:
             return jsonify({"error": f"Server error: {str(e)}"}), 500
 
+def process_memory():
+    """Resident, proportional and shared memory of this worker process (Linux only)."""
+    try:
+        with open('/proc/self/smaps_rollup') as handle:
+            sizes = {}
+            for line in handle:
+                parts = line.split()
+                if len(parts) == 3 and parts[0].endswith(':') and parts[2] == 'kB':
+                    sizes[parts[0][:-1]] = int(parts[1]) * 1024
+    except OSError:
+        return {"pid": os.getpid()}
+    return {
+        "pid": os.getpid(),
+        "rss_bytes": sizes.get("Rss"),
+        "pss_bytes": sizes.get("Pss"),
+        "shared_bytes": sizes.get("Shared_Clean", 0) + sizes.get("Shared_Dirty", 0),
+        "private_bytes": sizes.get("Private_Clean", 0) + sizes.get("Private_Dirty", 0),
+    }
+
+@app.route('/api/stats', methods=['GET'])
+def stats():
+    """
+    Report inference scheduler and cache statistics
+    """
+    return jsonify({
+        "micro_batching": {name: batcher.stats() for name, batcher in micro_batchers.items()},
+        "caches": {cache.name: cache.stats() for cache in (score_cache, structure_cache)},
+        "score_store": score_store.stats() if score_store is not None else None,
+        "structures": structure_service.stats(),
+        "shared_backbone": model_loader.shared_backbone.stats() if model_loader.shared_backbone is not None else None,
+        "precision": model_loader.precision_reports,
+        "compiled": model_loader.compile_reports,
+        "inference_pool": inference_pool.stats() if inference_pool is not None else None,
+        "jobs": job_manager.stats(),
+        "admission": admission.stats(),
+        "process": process_memory()
+    })
+
+def collect_metrics():
+    """Cache, queue, model load and memory values for /metrics, read at scrape time."""
+    caches = [(cache.name, cache.stats()) for cache in (score_cache, structure_cache)]
+    if score_store is not None:
+        caches.append(("score_store", score_store.stats()))
+    if structure_service.store is not None:
+        caches.append(("structure_store", structure_service.store.stats()))
+    queues = [(name, batcher.stats()) for name, batcher in micro_batchers.items()]
+    models = model_loader.readiness()["models"]
+    memory = process_memory()
+    admission_stats = admission.stats()
+    return [
+        ("transhla_cache_hits_total", "counter", "Cache lookups that found a value",
+         [({"cache": name}, stats["hits"]) for name, stats in caches]),
+        ("transhla_cache_misses_total", "counter", "Cache lookups that found nothing",
+         [({"cache": name}, stats["misses"]) for name, stats in caches]),
+        ("transhla_queue_depth", "gauge", "Peptides waiting in a micro-batch queue",
+         [({"queue": name}, stats["queue_depth"]) for name, stats in queues]),
+        ("transhla_admission_running", "gauge", "Heavy-lane requests running",
+         [({}, admission_stats["heavy_running"])]),
+        ("transhla_admission_waiting", "gauge", "Heavy-lane requests waiting for a slot",
+         [({}, admission_stats["heavy_waiting"])]),
+        ("transhla_model_ready", "gauge", "1 once the model is loaded and warmed up",
+         [({"hla_class": c}, int(state.get("status") == "ready")) for c, state in models.items()]),
+        ("transhla_model_load_seconds", "gauge", "Time taken to load the model",
+         [({"hla_class": c}, state.get("load_seconds")) for c, state in models.items()]),
+        ("transhla_model_warmup_seconds", "gauge", "Time taken to warm up the model",
+         [({"hla_class": c}, state.get("warmup_seconds")) for c, state in models.items()]),
+        ("transhla_process_resident_memory_bytes", "gauge", "Resident memory of this worker process",
+         [({}, memory.get("rss_bytes"))]),
+        ("transhla_process_proportional_memory_bytes", "gauge", "Proportional set size of this worker process",
+         [({}, memory.get("pss_bytes"))]),
+    ]
+
+register_collector(collect_metrics)
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """
+    Prometheus scrape endpoint; values are for this worker process only
+    """
+    return Response(render_metrics(), mimetype='text/plain; version=0.0.4')
+
 @app.route('/health', methods=['GET'])
 def health_check():
     """
-    Simple health check endpoint for the container
+    Liveness check for the container; model readiness is reported but
+    never fails it
     """
     try:
-        return jsonify({"status": "healthy"}), 200
+        return jsonify({"status": "healthy", "ready": model_loader.readiness()["ready"]}), 200
     except Exception as e:
         print(f"Health check failed: {str(e)}")
         # Still return 200 to keep the container running, 
         # but log the error for investigation
         return jsonify({"status": "degraded", "error": str(e)}), 200
 
+@app.route('/health/ready', methods=['GET'])
+def readiness_check():
+    """
+    Readiness check: 200 once both models are loaded and warmed up, 503
+    before that. Starts loading any model that is not loaded yet.
+    """
+    model_loader.start_loading()
+    state = model_loader.readiness()
+    return jsonify(state), 200 if state["ready"] else 503
+
 # Serve static frontend files in production
 @app.route('/', defaults={'path': ''})
 @app.route('/<path:path>')
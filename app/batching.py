@@ -0,0 +1,205 @@
+import os
+import threading
+
+import numpy as np
+import torch
+
+from .tokenizer import NativeTokenizer, PAD_TOKEN_ID, window_view, valid_window_starts, frame_windows
+from .metrics import BATCH_SIZE, stage
+
+# Padded token width expected by each model (max peptide length + CLS/EOS)
+MAX_TOKEN_LENGTH = {"I": 16, "II": 23}
+
+# Peptide lengths scanned for each HLA class
+PEPTIDE_LENGTHS = {
+    "I": range(8, 15),  # 8-14 amino acids for Class I
+    "II": range(13, 22),  # 13-21 amino acids for Class II
+}
+
+# Models scored for each accepted hla_class value
+HLA_CLASSES = {"I": ("I",), "II": ("II",), "both": ("I", "II")}
+
+# Probability above which a peptide is reported as an epitope
+EPITOPE_THRESHOLD = 0.5
+
+# Batch size limits and the share of free memory a batch may use
+MIN_BATCH_SIZE = 32
+MAX_BATCH_SIZE = 1024
+MEMORY_BUDGET_FRACTION = float(os.environ.get('TRANSHLA_MEMORY_FRACTION', 0.25))
+
+# ESM2-650M backbone dimensions, used to estimate activation memory
+BACKBONE_D_MODEL = 1280
+BACKBONE_LAYERS = 33
+BACKBONE_HEADS = 20
+
+
+def peptide_lengths(hla_class, fixed_window_size=None):
+    """Return the peptide lengths to scan for an HLA class."""
+    if fixed_window_size:
+        return [fixed_window_size]
+    if hla_class == "both":
+        return range(PEPTIDE_LENGTHS["I"].start, PEPTIDE_LENGTHS["II"].stop)
+    return PEPTIDE_LENGTHS["I" if hla_class == "I" else "II"]
+
+
+def length_classes(hla_class, fixed_window_size=None):
+    """Return (length, HLA classes scoring that length) pairs for a scan.
+
+    With hla_class "both", lengths 13-14 are scored by both models.
+    """
+    classes = HLA_CLASSES.get(hla_class, ("II",))
+    if len(classes) == 1:
+        return [(length, classes) for length in peptide_lengths(hla_class, fixed_window_size)]
+    plan = []
+    for length in peptide_lengths(hla_class, fixed_window_size):
+        scoring = tuple(c for c in classes if length in PEPTIDE_LENGTHS[c])
+        if scoring:
+            plan.append((length, scoring))
+    return plan
+
+
+def estimate_sample_bytes(max_length):
+    """Rough peak activation memory of one padded peptide in a forward pass."""
+    # Hidden states for a handful of live layers plus the attention maps that
+    # the contact head keeps for every layer.
+    hidden = max_length * BACKBONE_D_MODEL * 4 * 16
+    attention = BACKBONE_LAYERS * BACKBONE_HEADS * max_length * max_length * 4
+    return hidden + attention
+
+
+def available_memory(device):
+    """Return the number of bytes currently free on the given device."""
+    if device.type == 'cuda':
+        free, _ = torch.cuda.mem_get_info(device)
+        return free
+    try:
+        return os.sysconf('SC_AVPHYS_PAGES') * os.sysconf('SC_PAGE_SIZE')
+    except (ValueError, OSError, AttributeError):
+        return 2 * 1024 ** 3
+
+
+def pick_batch_size(device, max_length):
+    """Pick a batch size from the device memory budget.
+
+    TRANSHLA_BATCH_SIZE overrides the estimate when set.
+    """
+    override = os.environ.get('TRANSHLA_BATCH_SIZE')
+    if override:
+        return max(1, int(override))
+    budget = available_memory(device) * MEMORY_BUDGET_FRACTION
+    batch_size = int(budget // estimate_sample_bytes(max_length))
+    return max(MIN_BATCH_SIZE, min(MAX_BATCH_SIZE, batch_size))
+
+
+def bucket_by_length(sequences):
+    """Group sequence indices by peptide length.
+
+    Returns a dict mapping length to an int64 array of indices into sequences.
+    """
+    lengths = np.fromiter((len(s) for s in sequences), dtype=np.int64, count=len(sequences))
+    buckets = {}
+    for length in np.unique(lengths):
+        buckets[int(length)] = np.flatnonzero(lengths == length)
+    return buckets
+
+
+def encode_bucket(tokenizer, sequences, max_length):
+    """Tokenize same-length peptides into a padded int64 array."""
+    if hasattr(tokenizer, 'encode_batch'):
+        return tokenizer.encode_batch(list(sequences), max_length)
+    token_ids = np.full((len(sequences), max_length), PAD_TOKEN_ID, dtype=np.int64)
+    if not sequences:
+        return token_ids
+    encoded = np.asarray(tokenizer(list(sequences))['input_ids'], dtype=np.int64)
+    token_ids[:, :encoded.shape[1]] = encoded
+    return token_ids
+
+
+class BatchingEngine:
+    """Run a TransHLA model over many peptides in length-bucketed batches.
+
+    Peptides are grouped by length so each bucket tokenizes into a dense
+    array, then copied batch by batch into a reusable int64 input tensor.
+    Probabilities come back with a single device-to-host copy per batch.
+    """
+
+    def __init__(self, model, hla_class, device, tokenizer=None, batch_size=None):
+        self.model = model
+        self.hla_class = hla_class
+        self.device = device
+        self.tokenizer = tokenizer or NativeTokenizer()
+        self.max_length = MAX_TOKEN_LENGTH[hla_class]
+        self.batch_size = batch_size or pick_batch_size(device, self.max_length)
+        self._input_buffer = torch.empty(
+            (self.batch_size, self.max_length),
+            dtype=torch.int64,
+            pin_memory=device.type == 'cuda'
+        )
+        self._input_array = self._input_buffer.numpy()
+        # Guards the shared input buffer between concurrent request threads
+        self._lock = threading.Lock()
+
+    def forward_batch(self, token_ids):
+        """Run one batch of token ids and return epitope probabilities."""
+        n = token_ids.shape[0]
+        with self._lock:
+            self._input_array[:n] = token_ids
+            return self._forward_buffer(n)
+
+    def _forward_buffer(self, n, recorder=None):
+        """Run the model on the first n rows of the input buffer.
+
+        With a SaliencyRecorder, the batch is run through it so per-residue
+        importance is kept from the same pass.
+        """
+        BATCH_SIZE.observe(n, hla_class=self.hla_class)
+        with stage('forward'):
+            input_tensor = self._input_buffer[:n].to(self.device, non_blocking=True)
+            with torch.no_grad():
+                outputs, _ = (recorder.run if recorder is not None else self.model)(input_tensor)
+            return outputs[:, 1].float().cpu().numpy()
+
+    def predict(self, sequences):
+        """Return a float32 array of epitope probabilities for sequences."""
+        probabilities = np.empty(len(sequences), dtype=np.float32)
+        for length, indices in bucket_by_length(sequences).items():
+            with stage('tokenize'):
+                token_ids = encode_bucket(
+                    self.tokenizer, [sequences[i] for i in indices], self.max_length
+                )
+            for start in range(0, len(indices), self.batch_size):
+                stop = start + self.batch_size
+                probabilities[indices[start:stop]] = self.forward_batch(token_ids[start:stop])
+        return probabilities
+
+    def predict_windows(self, residue_ids, length, valid=None, starts=None, recorder=None):
+        """Score windows of one length over a tokenized protein.
+
+        residue_ids comes from tokenizer.encode. Either pass the 0-indexed
+        window starts to score, or a boolean mask of usable residues (all
+        windows are scored when neither is given). Windows are framed batch
+        by batch straight from a strided view into the input buffer, so no
+        peptide strings or per-window arrays are created. A SaliencyRecorder
+        keeps per-residue importance of every batch. Returns (0-indexed
+        starts, probabilities).
+        """
+        windows = window_view(residue_ids, length)
+        if starts is None:
+            if valid is None:
+                starts = np.arange(windows.shape[0])
+            else:
+                starts = valid_window_starts(valid, length)
+        starts = np.asarray(starts, dtype=np.int64)
+        contiguous = len(starts) > 0 and starts[-1] - starts[0] == len(starts) - 1
+        probabilities = np.empty(len(starts), dtype=np.float32)
+        for begin in range(0, len(starts), self.batch_size):
+            end = min(begin + self.batch_size, len(starts))
+            if contiguous:
+                batch = windows[starts[begin]:starts[begin] + end - begin]
+            else:
+                batch = windows[starts[begin:end]]
+            with self._lock:
+                with stage('tokenize'):
+                    frame_windows(batch, self.max_length, out=self._input_array[:end - begin])
+                probabilities[begin:end] = self._forward_buffer(end - begin, recorder)
+        return starts, probabilities
@@ -0,0 +1,140 @@
+"""Bulk peptide scoring: parsing, vectorized validation and columnar output.
+
+A bulk request carries thousands of peptides as a JSON array or an uploaded
+FASTA/CSV file. All peptides are checked in one pass over a single byte
+buffer, identical peptides are scored once per class, and results are
+returned as one array per field (or as Arrow/Parquet bytes when pyarrow is
+installed) rather than one object per peptide.
+"""
+import io
+
+import numpy as np
+import pandas as pd
+
+from .batching import EPITOPE_THRESHOLD, HLA_CLASSES, PEPTIDE_LENGTHS, peptide_lengths
+from .fasta import parse_fasta
+from .proteome_scan import protein_id
+from .tokenizer import VALID_LOOKUP, sequence_bytes
+
+# Columns checked, in order, for the peptides of an uploaded CSV
+PEPTIDE_COLUMNS = ("peptide", "sequence", "Peptide", "Sequence")
+
+ARROW_FORMATS = {
+    "arrow": "application/vnd.apache.arrow.stream",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+
+def read_upload(stream, filename):
+    """Return (ids or None, peptides) from an uploaded FASTA or CSV/TSV file."""
+    text = stream.read()
+    if isinstance(text, bytes):
+        text = text.decode('utf-8', 'replace')
+    if text.lstrip().startswith('>'):
+        records = list(parse_fasta(text.splitlines()))
+        return [protein_id(header) for header, _ in records], [sequence for _, sequence in records]
+    frame = pd.read_csv(io.StringIO(text), sep='\t' if filename.lower().endswith('.tsv') else ',', dtype=str)
+    column = next((c for c in PEPTIDE_COLUMNS if c in frame.columns), frame.columns[0])
+    ids = frame["id"].fillna('').tolist() if "id" in frame.columns else None
+    return ids, frame[column].fillna('').tolist()
+
+
+def validate_peptides(peptides, hla_class):
+    """Upper-case and check every peptide at once.
+
+    Returns (cleaned peptides, boolean mask of valid ones, error per peptide
+    or None). A peptide is valid when it only holds the 20 standard residues
+    and its length is scored by hla_class.
+    """
+    peptides = [str(p).strip().upper() for p in peptides]
+    lengths = np.fromiter(map(len, peptides), dtype=np.int64, count=len(peptides))
+    invalid_count = np.concatenate(([0], np.cumsum(~VALID_LOOKUP[sequence_bytes(''.join(peptides))])))
+    ends = np.cumsum(lengths)
+    residues_ok = invalid_count[ends] == invalid_count[ends - lengths]
+    lengths_range = peptide_lengths(hla_class)
+    lengths_ok = (lengths >= lengths_range[0]) & (lengths <= lengths_range[-1])
+    errors = np.full(len(peptides), None, dtype=object)
+    errors[~lengths_ok] = f"Length must be {lengths_range[0]}-{lengths_range[-1]} amino acids"
+    errors[~residues_ok] = "Contains invalid amino acid letters"
+    return peptides, residues_ok & lengths_ok, errors
+
+
+def score_bulk(peptides, valid, hla_class, score):
+    """Score the valid peptides with every class covering their length.
+
+    score(unique peptides, class) returns float32 probabilities. Returns
+    (columns with one row per input index and class, distinct peptides scored).
+    """
+    peptides = np.asarray(peptides, dtype=object)
+    lengths = np.fromiter(map(len, peptides), dtype=np.int64, count=len(peptides))
+    columns = {"index": [], "class": [], "probability": []}
+    scored = 0
+    for peptide_class in HLA_CLASSES[hla_class]:
+        lengths_range = PEPTIDE_LENGTHS[peptide_class]
+        rows = np.flatnonzero(valid & (lengths >= lengths_range.start) & (lengths < lengths_range.stop))
+        if not len(rows):
+            continue
+        # Score each distinct peptide once
+        codes, unique = pd.factorize(peptides[rows])
+        probabilities = np.asarray(score(list(unique), peptide_class), dtype=np.float32)[codes]
+        scored += len(unique)
+        columns["index"].append(rows)
+        columns["class"].append(np.full(len(rows), peptide_class, dtype=object))
+        columns["probability"].append(probabilities)
+    if not columns["index"]:
+        return {"index": np.empty(0, dtype=np.int64), "class": np.empty(0, dtype=object),
+                "probability": np.empty(0, dtype=np.float32)}, 0
+    merged = {key: np.concatenate(value) for key, value in columns.items()}
+    # Input order, with both classes of a peptide next to each other
+    order = np.argsort(merged["index"], kind='stable')
+    return {key: value[order] for key, value in merged.items()}, scored
+
+
+def columnar_results(peptides, ids, scored):
+    """Build the output columns for scored rows, in input order."""
+    index = scored["index"]
+    probability = scored["probability"]
+    peptide_column = np.asarray(peptides, dtype=object)[index]
+    columns = {
+        "index": index.astype(np.int64),
+        "peptide": peptide_column,
+        "length": np.fromiter(map(len, peptide_column), dtype=np.int64, count=len(index)),
+        "class": scored["class"],
+        "probability": probability,
+        "is_epitope": probability > EPITOPE_THRESHOLD,
+    }
+    if ids is not None:
+        columns = {"id": np.asarray(ids, dtype=object)[index], **columns}
+    return columns
+
+
+def columns_to_json(columns):
+    """Columns for a JSON response; numeric arrays are left for the encoder."""
+    return {name: values.tolist() if values.dtype == object else values for name, values in columns.items()}
+
+
+def columns_to_arrow(columns, output_format):
+    """Serialize columns as an Arrow IPC stream or a Parquet file.
+
+    Raises RuntimeError when pyarrow is not installed.
+    """
+    try:
+        import pyarrow
+        import pyarrow.ipc
+        import pyarrow.parquet
+    except ImportError:
+        raise RuntimeError(f"{output_format.capitalize()} output requires pyarrow (pip install pyarrow)")
+    table = pyarrow.table({
+        name: values.astype(np.int32) if name == "index"
+        else values.astype(np.uint8) if name == "length"
+        else values.tolist() if values.dtype == object
+        else values
+        for name, values in columns.items()
+    })
+    sink = io.BytesIO()
+    if output_format == 'parquet':
+        pyarrow.parquet.write_table(table, sink)
+    else:
+        with pyarrow.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+    return sink.getvalue()
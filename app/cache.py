@@ -0,0 +1,186 @@
+import os
+import sys
+import time
+import hashlib
+import weakref
+import threading
+from collections import OrderedDict
+
+import torch
+
+# Byte budgets and optional time-to-live (seconds) for the cache pools
+SCORE_CACHE_MAX_BYTES = int(os.environ.get('TRANSHLA_SCORE_CACHE_BYTES', 64 * 1024 * 1024))
+STRUCTURE_CACHE_MAX_BYTES = int(os.environ.get('TRANSHLA_STRUCTURE_CACHE_BYTES', 256 * 1024 * 1024))
+CACHE_TTL = float(os.environ['TRANSHLA_CACHE_TTL']) if os.environ.get('TRANSHLA_CACHE_TTL') else None
+
+# Approximate per-entry bookkeeping cost: key tuple, value, OrderedDict node
+ENTRY_OVERHEAD_BYTES = 200
+
+_MISSING = object()
+
+
+def score_entry_size(key, value):
+    """Approximate memory held by one (peptide, class, version) -> score entry."""
+    return sys.getsizeof(key[0]) + ENTRY_OVERHEAD_BYTES
+
+
+def text_entry_size(key, value):
+    """Approximate memory held by an entry with a string value."""
+    return sys.getsizeof(key) + sys.getsizeof(value) + ENTRY_OVERHEAD_BYTES
+
+
+class LRUCache:
+    """Thread-safe LRU cache bounded by an approximate byte budget.
+
+    Entries optionally expire ttl seconds after they were stored. Hits,
+    misses, evictions and expirations are counted for reporting.
+    """
+
+    def __init__(self, name, max_bytes, ttl=None, size_fn=text_entry_size, clock=time.monotonic):
+        self.name = name
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.size_fn = size_fn
+        self.clock = clock
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def _lookup(self, key, now):
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return _MISSING
+        value, size, expires_at = entry
+        if expires_at is not None and expires_at <= now:
+            del self._entries[key]
+            self._bytes -= size
+            self.expirations += 1
+            self.misses += 1
+            return _MISSING
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def _store(self, key, value, now):
+        size = self.size_fn(key, value)
+        if size > self.max_bytes:
+            return
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self._bytes -= old[1]
+        expires_at = now + self.ttl if self.ttl else None
+        self._entries[key] = (value, size, expires_at)
+        self._bytes += size
+        while self._bytes > self.max_bytes:
+            _, (_, evicted_size, _) = self._entries.popitem(last=False)
+            self._bytes -= evicted_size
+            self.evictions += 1
+
+    def get(self, key, default=None):
+        with self._lock:
+            value = self._lookup(key, self.clock())
+        return default if value is _MISSING else value
+
+    def put(self, key, value):
+        with self._lock:
+            self._store(key, value, self.clock())
+
+    def get_many(self, keys):
+        """Return a list of cached values, with None for every miss."""
+        with self._lock:
+            now = self.clock()
+            values = [self._lookup(key, now) for key in keys]
+        return [None if value is _MISSING else value for value in values]
+
+    def put_many(self, items):
+        with self._lock:
+            now = self.clock()
+            for key, value in items:
+                self._store(key, value, now)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else 0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
+
+
+_model_versions = weakref.WeakKeyDictionary()
+
+
+def state_tensors(state_dict, dequantize=True):
+    """Yield (name, tensor) for every tensor in a state dict.
+
+    Dynamically quantized layers store packed (weight, bias) tuples and
+    quantized tensors; these are unpacked and, by default, dequantized so
+    every model precision can be hashed and compared the same way.
+    """
+    for name, value in state_dict.items():
+        values = value if isinstance(value, tuple) else (value,)
+        for index, item in enumerate(values):
+            if not isinstance(item, torch.Tensor):
+                continue
+            if dequantize and item.is_quantized:
+                item = item.dequantize()
+            yield (f"{name}.{index}" if isinstance(value, tuple) else name), item
+
+
+def checkpoint_fingerprint(model):
+    """Deterministic SHA-256 digest of a model's weights.
+
+    Models loaded from a snapshot carry the digest of their checkpoint
+    files, computed once at load (config.checkpoint_sha256). Otherwise every
+    parameter's name, shape and bytes are hashed. Either way the same weights
+    give the same digest in every worker, across restarts and wherever the
+    snapshot is stored.
+    """
+    config = getattr(model, 'config', None)
+    digest = getattr(config, 'checkpoint_sha256', None) if config is not None else None
+    if digest:
+        return digest
+    digest = hashlib.sha256()
+    for name, tensor in state_tensors(model.state_dict()):
+        digest.update(name.encode())
+        digest.update(str(tuple(tensor.shape)).encode())
+        digest.update(tensor.detach().float().cpu().contiguous().numpy().tobytes())
+    return digest.hexdigest()
+
+
+def model_version(model):
+    """Identify a loaded checkpoint so scores from different weights never mix."""
+    version = _model_versions.get(model)
+    if version is None:
+        version = f"sha256:{checkpoint_fingerprint(model)[:16]}"
+        # Reduced-precision models score slightly differently from fp32
+        precision = getattr(model, 'inference_precision', 'fp32')
+        if precision != 'fp32':
+            version += f"+{precision}"
+        _model_versions[model] = version
+    return version
+
+
+# Separate pools so large PDB strings never push out epitope scores
+score_cache = LRUCache("scores", SCORE_CACHE_MAX_BYTES, CACHE_TTL, size_fn=score_entry_size)
+structure_cache = LRUCache("structures", STRUCTURE_CACHE_MAX_BYTES, CACHE_TTL)
@@ -0,0 +1,249 @@
+"""Compiled fixed-shape inference graphs for the TransHLA models.
+
+Inputs are always padded to the same token width per class (16 for class I,
+23 for class II), so the only shape that varies is the batch size. With
+TRANSHLA_COMPILE=trace, each model is traced with TorchScript and every
+batch is padded up to the nearest size in TRANSHLA_COMPILE_BUCKETS, so the
+graph executor only ever sees a handful of fixed shapes and keeps one
+optimized plan per (class, bucket). Batches larger than the largest bucket
+are run in chunks of it.
+
+Traced graphs are saved under .cache/compiled, keyed by checkpoint version,
+precision and torch version, so later starts load them instead of tracing
+again. A loaded graph is pointed at the weights of the already loaded model,
+so the weights stay resident once.
+
+A graph is only served after a parity check on reference peptides at every
+bucket: if any bucket fails, differs from eager mode by more than
+COMPILE_TOLERANCE, or tracing fails altogether, the eager model is kept.
+A graph that fails at runtime also falls back to eager mode for good.
+
+Compare eager and compiled per-batch latency on the loaded checkpoints with:
+
+    python -m app.compiled
+"""
+import os
+import sys
+import time
+import hashlib
+import warnings
+
+import numpy as np
+import torch
+import torch.nn as nn
+
+from .batching import MAX_TOKEN_LENGTH, bucket_by_length, encode_bucket
+from .cache import model_version
+from .precision import reference_peptides
+from .tokenizer import NativeTokenizer
+
+COMPILE_MODES = ("off", "trace")
+
+# Compilation requested for inference
+COMPILE_MODE = os.environ.get('TRANSHLA_COMPILE', 'off')
+
+# Batch sizes a graph is specialized for; batches are padded up to the next one
+COMPILE_BUCKETS = tuple(sorted(int(size) for size in
+                               os.environ.get('TRANSHLA_COMPILE_BUCKETS', '8,32,128,512').split(',')))
+
+# Largest probability difference accepted between the graph and eager mode
+COMPILE_TOLERANCE = float(os.environ.get('TRANSHLA_COMPILE_TOLERANCE', 1e-4))
+
+# Runs per bucket during the parity check; the graph executor optimizes a
+# shape's plan after profiling its first runs
+PARITY_RUNS = 3
+
+
+class CompiledModel(nn.Module):
+    """Serve a model through a traced graph, padding each batch to a fixed bucket size."""
+
+    def __init__(self, model, graph, buckets):
+        super().__init__()
+        self.model = model
+        self.graph = graph
+        self.buckets = tuple(buckets)
+        self.config = getattr(model, 'config', None)
+        self.inference_precision = getattr(model, 'inference_precision', 'fp32')
+        self.failed = None
+
+    def tie_weights(self):
+        """Point the graph's parameters and buffers at the eager model's current tensors."""
+        return tie_weights(self.graph, self.model)
+
+    def _run_graph(self, input_ids):
+        n = input_ids.shape[0]
+        bucket = next(size for size in self.buckets if size >= n)
+        if bucket > n:
+            # Repeat the first row as padding; rows are scored independently
+            input_ids = torch.cat([input_ids, input_ids[:1].expand(bucket - n, -1)])
+        outputs = self.graph(input_ids)
+        return tuple(output[:n] for output in outputs)
+
+    def forward(self, input_ids):
+        if self.failed is None:
+            try:
+                largest = self.buckets[-1]
+                if input_ids.shape[0] <= largest:
+                    return self._run_graph(input_ids)
+                chunks = [self._run_graph(input_ids[start:start + largest])
+                          for start in range(0, input_ids.shape[0], largest)]
+                return tuple(torch.cat(parts) for parts in zip(*chunks))
+            except Exception as e:
+                print(f"Compiled graph failed, falling back to eager mode: {str(e)}")
+                self.failed = str(e)
+        return self.model(input_ids)
+
+
+def tie_weights(graph, model):
+    """Replace the graph's copies of parameters and buffers by the model's tensors.
+
+    Returns the number of tensors tied.
+    """
+    state = model.state_dict(keep_vars=True)
+    tied = 0
+    for name, tensor in list(graph.named_parameters()) + list(graph.named_buffers()):
+        source = state.get(name)
+        if source is not None and source.shape == tensor.shape and source.dtype == tensor.dtype:
+            tensor.data = source.data
+            tied += 1
+    return tied
+
+
+def graph_path(model, hla_class, device, cache_dir):
+    key = f"{model_version(model)}|{torch.__version__}|{device.type}"
+    digest = hashlib.sha256(key.encode()).hexdigest()[:16]
+    return os.path.join(cache_dir, f"TransHLA_{hla_class}-{digest}.pt")
+
+
+def encode_reference(hla_class, count):
+    """Token ids of count reference peptides, padded to the class's token width."""
+    peptides = reference_peptides(hla_class, count)
+    token_ids = np.empty((count, MAX_TOKEN_LENGTH[hla_class]), dtype=np.int64)
+    tokenizer = NativeTokenizer()
+    for _, indices in bucket_by_length(peptides).items():
+        token_ids[indices] = encode_bucket(tokenizer, [peptides[i] for i in indices], MAX_TOKEN_LENGTH[hla_class])
+    return torch.from_numpy(token_ids)
+
+
+def trace(model, hla_class, device):
+    """Trace a model on one bucket of reference inputs."""
+    if not torch.jit._state._enabled.enabled:
+        raise ValueError("TorchScript is disabled by PYTORCH_JIT=0")
+    example = encode_reference(hla_class, COMPILE_BUCKETS[0]).to(device)
+    with warnings.catch_warnings(), torch.no_grad():
+        # Tracer warnings about Python values baked into the graph are
+        # expected: every shape the graph sees is fixed
+        warnings.simplefilter('ignore')
+        return torch.jit.trace(model, (example,), check_trace=False)
+
+
+def parity(model, compiled, hla_class, device):
+    """Compare graph and eager probabilities at every bucket; returns a report per bucket."""
+    buckets = {}
+    with torch.no_grad():
+        for bucket in compiled.buckets:
+            input_ids = encode_reference(hla_class, bucket).to(device)
+            reference, _ = model(input_ids)
+            start_time = time.perf_counter()
+            for _ in range(PARITY_RUNS):
+                candidate, _ = compiled._run_graph(input_ids)
+            buckets[bucket] = {
+                "max_drift": float((reference[:, 1].float() - candidate[:, 1].float()).abs().max()),
+                "mean_ms": (time.perf_counter() - start_time) / PARITY_RUNS * 1000,
+            }
+    return buckets
+
+
+def apply_compilation(model, hla_class, device, cache_dir, mode=None):
+    """Return (model to serve, report) for the requested compile mode.
+
+    The eager model is returned unchanged when compilation is off, fails,
+    or the graph fails the parity check.
+    """
+    mode = mode or COMPILE_MODE
+    report = {"requested": mode, "mode": "eager"}
+    if mode == 'off':
+        return model, report
+    if mode not in COMPILE_MODES:
+        print(f"Unknown compile mode '{mode}'; running class {hla_class} in eager mode")
+        report["reason"] = f"Unknown compile mode '{mode}'"
+        return model, report
+
+    start_time = time.time()
+    path = graph_path(model, hla_class, device, cache_dir)
+    try:
+        if os.path.exists(path):
+            with warnings.catch_warnings():
+                # TorchScript serialization is deprecated in favour of torch.export
+                warnings.simplefilter('ignore', FutureWarning)
+                graph = torch.jit.load(path, map_location=device)
+            report["tied_tensors"] = tie_weights(graph, model)
+            report["source"] = "cache"
+        else:
+            graph = trace(model, hla_class, device)
+            report["source"] = "traced"
+        compiled = CompiledModel(model, graph, COMPILE_BUCKETS)
+        report["buckets"] = parity(model, compiled, hla_class, device)
+    except Exception as e:
+        print(f"Compiling class {hla_class} failed, running in eager mode: {str(e)}")
+        report["reason"] = str(e)
+        return model, report
+
+    report["compile_seconds"] = round(time.time() - start_time, 2)
+    drift = max(bucket["max_drift"] for bucket in report["buckets"].values())
+    if drift > COMPILE_TOLERANCE:
+        print(f"Running class {hla_class} in eager mode: compiled graph drifts by {drift:.2e}")
+        report["reason"] = f"max drift {drift:.2e} > {COMPILE_TOLERANCE}"
+        return model, report
+
+    if report["source"] == "traced":
+        try:
+            os.makedirs(cache_dir, exist_ok=True)
+            temp_path = f"{path}.{os.getpid()}.tmp"
+            with warnings.catch_warnings():
+                warnings.simplefilter('ignore', FutureWarning)
+                torch.jit.save(graph, temp_path)
+            os.replace(temp_path, path)
+        except (OSError, RuntimeError) as e:
+            print(f"Warning: could not save compiled graph to {path}: {e}")
+    print(f"Class {hla_class} compiled ({report['source']}) for batch sizes "
+          f"{', '.join(str(size) for size in COMPILE_BUCKETS)} in {report['compile_seconds']:.2f} seconds, "
+          f"max drift {drift:.2e}")
+    report["mode"] = mode
+    return compiled, report
+
+
+def main():
+    os.environ['TRANSHLA_COMPILE'] = 'off'
+    from app import model_loader
+
+    if not model_loader.load_models():
+        print("Models could not be loaded")
+        sys.exit(1)
+    device = model_loader.device
+    for hla_class in ("I", "II"):
+        model = model_loader.get_model(hla_class)
+        try:
+            compiled = CompiledModel(model, trace(model, hla_class, device), COMPILE_BUCKETS)
+        except Exception as e:
+            print(f"Class {hla_class}: tracing failed: {str(e)}")
+            continue
+        with torch.no_grad():
+            for bucket in COMPILE_BUCKETS:
+                input_ids = encode_reference(hla_class, bucket).to(device)
+                timings = {}
+                for name, run in (("eager", model), ("compiled", compiled._run_graph)):
+                    for _ in range(PARITY_RUNS):
+                        run(input_ids)
+                    start_time = time.perf_counter()
+                    for _ in range(PARITY_RUNS):
+                        outputs, _ = run(input_ids)
+                    timings[name] = (time.perf_counter() - start_time) / PARITY_RUNS * 1000
+                    timings[f"{name}_outputs"] = outputs[:, 1].float()
+                drift = float((timings["eager_outputs"] - timings["compiled_outputs"]).abs().max())
+                print(f"Class {hla_class} batch {bucket:5d}: eager {timings['eager']:9.2f} ms, "
+                      f"compiled {timings['compiled']:9.2f} ms, max drift {drift:.2e}")
+
+
+if __name__ == '__main__':
+    main()
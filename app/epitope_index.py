@@ -0,0 +1,482 @@
+"""Persistent epitope index over scanned proteins.
+
+An index directory holds the scanned sequences and their window scores:
+
+    meta.json             proteins, residues, classes and lengths indexed
+    proteins.json         protein ids, in FASTA order
+    text.bin              every sequence, separated by newlines
+    offsets.npy           start of each protein in text.bin (one extra end offset)
+    suffix_array.npy      text positions sorted by the (up to SUFFIX_PREFIX
+                          residue) peptide starting there
+    windows/I-9.*.npy     per (class, length): window starts in text.bin,
+                          ascending, their probabilities, and the window
+                          order by increasing probability
+
+Every peptide occurrence is a contiguous range of the suffix array, found
+by binary search. Score range queries are a binary search over the
+probability-sorted order of one (class, length), and a protein's windows
+are a binary search over the sorted starts. Arrays are memory-mapped, so
+queries touch only the rows they return.
+
+Build an index by scanning a FASTA file (scores come from the score cache
+and store where available), or from the CSV written by scan.py:
+
+    python -m app.epitope_index build proteome.fasta -o proteome.index --hla-class I II
+    python -m app.epitope_index build proteome.fasta -o proteome.index --scan results.csv
+
+and query it with:
+
+    python -m app.epitope_index query proteome.index --peptide SIINFEKL
+    python -m app.epitope_index query proteome.index --hla-class I --length 9 --min-score 0.9 --proteins
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+
+import numpy as np
+
+from .fasta import read_fasta
+from .batching import EPITOPE_THRESHOLD, PEPTIDE_LENGTHS
+from .proteome_scan import ProteomeScanner, protein_id
+
+# Longest prefix the suffix array is sorted by; longer peptides are
+# narrowed to that prefix and then checked one by one
+SUFFIX_PREFIX = 32
+
+SEPARATOR = ord('\n')
+
+# Rows returned by a query unless a limit is given
+DEFAULT_LIMIT = 100
+
+
+def suffix_array(text, prefix=SUFFIX_PREFIX):
+    """Positions of text (uint8) sorted by the prefix residues starting there.
+
+    Prefix doubling: each round sorts by (rank of the first k residues,
+    rank of the next k), so log2(prefix) vectorized sorts are needed.
+    Positions of separators are left out.
+    """
+    n = len(text)
+    rank = text.astype(np.int64)
+    order = np.argsort(rank, kind='stable')
+    k = 1
+    while k < prefix:
+        following = np.zeros(n, dtype=np.int64)
+        following[:n - k] = rank[k:]
+        order = np.lexsort((following, rank))
+        sorted_rank, sorted_following = rank[order], following[order]
+        changed = np.empty(n, dtype=bool)
+        changed[:1] = True
+        changed[1:] = (sorted_rank[1:] != sorted_rank[:-1]) | (sorted_following[1:] != sorted_following[:-1])
+        rank = np.empty(n, dtype=np.int64)
+        rank[order] = np.cumsum(changed)
+        k *= 2
+    order = order[text[order] != SEPARATOR]
+    return order.astype(np.int32 if n < 2 ** 31 else np.int64)
+
+
+class IndexBuilder:
+    """Collect scan results for the proteins of a FASTA file and write an index.
+
+    Used as a ProteomeScanner sink: write(columns) takes scan columns, and
+    close() sorts and writes everything under path.
+    """
+
+    def __init__(self, fasta_path, path):
+        self.fasta_path = fasta_path
+        self.path = path
+        self._temp_path = path.rstrip('/') + '.building'
+        shutil.rmtree(self._temp_path, ignore_errors=True)
+        os.makedirs(os.path.join(self._temp_path, 'windows'))
+
+        ids, parts, offsets = [], [], [0]
+        for header, sequence in read_fasta(fasta_path):
+            ids.append(protein_id(header))
+            parts.append(sequence.upper())
+            offsets.append(offsets[-1] + len(sequence) + 1)
+        self.protein_ids = ids
+        self.offsets = np.array(offsets, dtype=np.int64)
+        self.text = np.frombuffer(('\n'.join(parts) + '\n').encode(), dtype=np.uint8)
+        self._offset_of = {}
+        for index, pid in enumerate(ids):
+            self._offset_of.setdefault(pid, self.offsets[index])
+        if len(self._offset_of) < len(ids):
+            print(f"Warning: {len(ids) - len(self._offset_of)} duplicate protein ids; "
+                  f"scan rows are matched to the first protein with each id")
+        # Chunks are appended to raw files per (class, length) and sorted on close
+        self._files = {}
+        self.rows = 0
+
+    def _append(self, key, starts, probabilities):
+        files = self._files.get(key)
+        if files is None:
+            base = os.path.join(self._temp_path, 'windows', f"{key[0]}-{key[1]}")
+            files = self._files[key] = (open(base + '.starts.raw', 'wb'), open(base + '.probability.raw', 'wb'))
+        starts.astype(np.int64).tofile(files[0])
+        probabilities.astype(np.float32).tofile(files[1])
+
+    def write(self, columns):
+        missing = next((pid for pid in columns["protein_id"] if pid not in self._offset_of), None)
+        if missing is not None:
+            raise ValueError(f"Scan results name protein '{missing}', which is not in {self.fasta_path}")
+        offsets = np.array([self._offset_of[pid] for pid in columns["protein_id"]], dtype=np.int64)
+        starts = offsets + np.asarray(columns["position"], dtype=np.int64) - 1
+        lengths = np.asarray(columns["length"])
+        probabilities = np.asarray(columns["probability"], dtype=np.float32)
+        classes = np.asarray(columns["hla_class"])
+        for hla_class in np.unique(classes).tolist():
+            for length in np.unique(lengths[classes == hla_class]).tolist():
+                rows = np.flatnonzero((classes == hla_class) & (lengths == length))
+                self._append((hla_class, int(length)), starts[rows], probabilities[rows])
+        self.rows += len(starts)
+
+    def flush(self):
+        return {"rows": self.rows}
+
+    def close(self):
+        for files in self._files.values():
+            for handle in files:
+                handle.close()
+
+    def finish(self, stats=None):
+        """Sort the collected windows, build the suffix array and move the index into place."""
+        start_time = time.time()
+        tables = {}
+        for (hla_class, length) in sorted(self._files):
+            base = os.path.join(self._temp_path, 'windows', f"{hla_class}-{length}")
+            starts = np.fromfile(base + '.starts.raw', dtype=np.int64)
+            probabilities = np.fromfile(base + '.probability.raw', dtype=np.float32)
+            os.remove(base + '.starts.raw')
+            os.remove(base + '.probability.raw')
+            # Scans write proteins and windows in order, so this is usually a no-op
+            if len(starts) > 1 and (np.diff(starts) < 0).any():
+                order = np.argsort(starts, kind='stable')
+                starts, probabilities = starts[order], probabilities[order]
+            starts = starts.astype(np.int32 if len(self.text) < 2 ** 31 else np.int64)
+            np.save(base + '.starts.npy', starts)
+            np.save(base + '.probability.npy', probabilities)
+            np.save(base + '.by_score.npy', np.argsort(probabilities, kind='stable').astype(starts.dtype))
+            tables[f"{hla_class}-{length}"] = len(starts)
+
+        np.save(os.path.join(self._temp_path, 'suffix_array.npy'), suffix_array(self.text))
+        np.save(os.path.join(self._temp_path, 'offsets.npy'), self.offsets)
+        self.text.tofile(os.path.join(self._temp_path, 'text.bin'))
+        with open(os.path.join(self._temp_path, 'proteins.json'), 'w') as handle:
+            json.dump(self.protein_ids, handle)
+        with open(os.path.join(self._temp_path, 'meta.json'), 'w') as handle:
+            json.dump({
+                "proteins": len(self.protein_ids),
+                "residues": int(len(self.text) - len(self.protein_ids)),
+                "windows": int(sum(tables.values())),
+                "tables": tables,
+                "built": time.strftime('%Y-%m-%dT%H:%M:%S'),
+                "scan": stats,
+            }, handle, indent=2)
+
+        shutil.rmtree(self.path, ignore_errors=True)
+        os.replace(self._temp_path, self.path)
+        print(f"Indexed {sum(tables.values())} windows of {len(self.protein_ids)} proteins "
+              f"into {self.path} in {time.time() - start_time:.1f} seconds")
+
+
+class EpitopeIndex:
+    """Read-only queries over an index directory."""
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, 'meta.json')) as handle:
+            self.meta = json.load(handle)
+        with open(os.path.join(path, 'proteins.json')) as handle:
+            self.protein_ids = json.load(handle)
+        self._protein_index = {}
+        for index, pid in enumerate(self.protein_ids):
+            self._protein_index.setdefault(pid, index)
+        self.offsets = np.load(os.path.join(path, 'offsets.npy'))
+        self.text = np.memmap(os.path.join(path, 'text.bin'), dtype=np.uint8, mode='r')
+        self.suffix_array = np.load(os.path.join(path, 'suffix_array.npy'), mmap_mode='r')
+        self.tables = {}
+        for key in self.meta["tables"]:
+            hla_class, length = key.split('-')
+            base = os.path.join(path, 'windows', key)
+            self.tables[(hla_class, int(length))] = {
+                name: np.load(f"{base}.{name}.npy", mmap_mode='r')
+                for name in ("starts", "probability", "by_score")
+            }
+
+    def _peptide_at(self, start, length):
+        return self.text[start:start + length].tobytes().decode()
+
+    def _locate(self, start):
+        """(protein index, 1-indexed position) of a text position."""
+        protein = int(np.searchsorted(self.offsets, start, side='right')) - 1
+        return protein, int(start - self.offsets[protein]) + 1
+
+    def _suffix_range(self, query):
+        """[lo, hi) of suffix array entries starting with query (at most SUFFIX_PREFIX long)."""
+        sa, text, m = self.suffix_array, self.text, len(query)
+
+        def prefix(i):
+            start = int(sa[i])
+            return text[start:start + m].tobytes()
+
+        lo, hi = 0, len(sa)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if prefix(mid) < query:
+                lo = mid + 1
+            else:
+                hi = mid
+        first, hi = lo, len(sa)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if prefix(mid) <= query:
+                lo = mid + 1
+            else:
+                hi = mid
+        return first, lo
+
+    def occurrences(self, peptide):
+        """Text positions where peptide occurs, ascending."""
+        query = peptide.upper().encode()
+        lo, hi = self._suffix_range(query[:SUFFIX_PREFIX])
+        starts = np.sort(np.asarray(self.suffix_array[lo:hi], dtype=np.int64))
+        if len(query) > SUFFIX_PREFIX:
+            starts = np.array([s for s in starts.tolist() if self.text[s:s + len(query)].tobytes() == query],
+                              dtype=np.int64)
+        return starts
+
+    def score_at(self, hla_class, length, start):
+        """Probability of the window at a text position, or None if it was not indexed."""
+        table = self.tables.get((hla_class, length))
+        if table is None:
+            return None
+        row = int(np.searchsorted(table["starts"], start))
+        if row < len(table["starts"]) and int(table["starts"][row]) == start:
+            return float(table["probability"][row])
+        return None
+
+    def find_peptide(self, peptide, limit=None):
+        """Every protein and position where a peptide occurs, with its indexed scores."""
+        starts = self.occurrences(peptide)
+        scores = {}
+        if len(starts):
+            for hla_class, length in self.tables:
+                if length == len(peptide):
+                    score = self.score_at(hla_class, length, int(starts[0]))
+                    if score is not None:
+                        scores[hla_class] = score
+        occurrences = []
+        for start in starts[:limit].tolist():
+            protein, position = self._locate(start)
+            occurrences.append({"protein_id": self.protein_ids[protein], "position": position})
+        return {"peptide": peptide.upper(), "count": len(starts), "scores": scores, "occurrences": occurrences}
+
+    def _score_bounds(self, table, min_score, max_score):
+        """[lo, hi) of by_score rows with min_score <= probability <= max_score."""
+        by_score, probability = table["by_score"], table["probability"]
+
+        def first(predicate):
+            lo, hi = 0, len(by_score)
+            while lo < hi:
+                mid = (lo + hi) // 2
+                if predicate(float(probability[by_score[mid]])):
+                    hi = mid
+                else:
+                    lo = mid + 1
+            return lo
+
+        # float32 scores compared with float32 bounds, so 0.9 matches a stored 0.9
+        low, high = float(np.float32(min_score)), float(np.float32(max_score))
+        return first(lambda p: p >= low), first(lambda p: p > high)
+
+    def _class_tables(self, hla_class, length=None):
+        keys = [key for key in self.tables if key[0] == hla_class and (length is None or key[1] == length)]
+        return sorted(keys, key=lambda key: key[1])
+
+    def windows(self, hla_class, length=None, min_score=EPITOPE_THRESHOLD, max_score=1.0, limit=DEFAULT_LIMIT, offset=0):
+        """Windows scoring between min_score and max_score, best first."""
+        total = 0
+        candidates = []
+        for key in self._class_tables(hla_class, length):
+            table = self.tables[key]
+            lo, hi = self._score_bounds(table, min_score, max_score)
+            total += hi - lo
+            # The best offset + limit rows of each length can hold every returned row
+            rows = np.asarray(table["by_score"][max(lo, hi - offset - limit):hi])[::-1]
+            for row in rows.tolist():
+                candidates.append((float(table["probability"][row]), key[1], int(table["starts"][row])))
+        candidates.sort(key=lambda candidate: -candidate[0])
+        results = []
+        for probability, window_length, start in candidates[offset:offset + limit]:
+            protein, position = self._locate(start)
+            results.append({
+                "protein_id": self.protein_ids[protein],
+                "position": position,
+                "length": window_length,
+                "peptide": self._peptide_at(start, window_length),
+                "probability": probability,
+            })
+        return {"hla_class": hla_class, "length": length, "min_score": min_score, "max_score": max_score,
+                "total": total, "results": results}
+
+    def proteins(self, hla_class, length=None, min_score=EPITOPE_THRESHOLD, max_score=1.0, limit=DEFAULT_LIMIT):
+        """Proteins with windows between min_score and max_score, most windows first."""
+        proteins, probabilities = [], []
+        for key in self._class_tables(hla_class, length):
+            table = self.tables[key]
+            lo, hi = self._score_bounds(table, min_score, max_score)
+            rows = np.sort(np.asarray(table["by_score"][lo:hi]))
+            starts = np.asarray(table["starts"][rows], dtype=np.int64)
+            proteins.append(np.searchsorted(self.offsets, starts, side='right') - 1)
+            probabilities.append(np.asarray(table["probability"][rows]))
+        if not proteins:
+            return {"hla_class": hla_class, "length": length, "total": 0, "results": []}
+        proteins, probabilities = np.concatenate(proteins), np.concatenate(probabilities)
+        unique, inverse, counts = np.unique(proteins, return_inverse=True, return_counts=True)
+        best = np.full(len(unique), -1.0, dtype=np.float32)
+        np.maximum.at(best, inverse, probabilities)
+        order = np.lexsort((-best, -counts))[:limit]
+        return {
+            "hla_class": hla_class,
+            "length": length,
+            "min_score": min_score,
+            "max_score": max_score,
+            "total": len(unique),
+            "results": [{"protein_id": self.protein_ids[int(unique[i])], "windows": int(counts[i]),
+                         "max_probability": float(best[i])} for i in order.tolist()],
+        }
+
+    def protein_summary(self, pid, threshold=EPITOPE_THRESHOLD):
+        """Per class and length: windows, epitopes above threshold and the best window of a protein."""
+        index = self._protein_index.get(pid)
+        if index is None:
+            return None
+        begin, end = int(self.offsets[index]), int(self.offsets[index + 1])
+        classes = {}
+        for (hla_class, length), table in sorted(self.tables.items()):
+            lo, hi = np.searchsorted(table["starts"], [begin, end])
+            if lo == hi:
+                continue
+            probabilities = np.asarray(table["probability"][lo:hi])
+            best = int(np.argmax(probabilities))
+            start = int(table["starts"][lo + best])
+            classes.setdefault(hla_class, []).append({
+                "length": length,
+                "windows": int(hi - lo),
+                "epitopes": int((probabilities > threshold).sum()),
+                "best_position": start - begin + 1,
+                "best_peptide": self._peptide_at(start, length),
+                "max_probability": float(probabilities[best]),
+            })
+        return {"protein_id": pid, "length": end - begin - 1, "threshold": threshold, "classes": classes}
+
+
+def open_index(path):
+    """Open the index at path, or return None if there is none."""
+    if not os.path.exists(os.path.join(path, 'meta.json')):
+        return None
+    try:
+        index = EpitopeIndex(path)
+        print(f"Epitope index opened at {path} ({index.meta['windows']} windows)")
+        return index
+    except (OSError, ValueError, KeyError) as e:
+        print(f"Warning: could not open epitope index at {path}: {e}")
+        return None
+
+
+def read_scan_csv(path, chunk_rows=1000000):
+    """Yield scan.py CSV output as scan columns, chunk by chunk."""
+    import pandas as pd
+    for frame in pd.read_csv(path, chunksize=chunk_rows, dtype={"protein_id": str, "hla_class": str}):
+        yield {
+            "protein_id": frame["protein_id"].tolist(),
+            "hla_class": frame["hla_class"].to_numpy(),
+            "position": frame["position"].to_numpy(),
+            "length": frame["length"].to_numpy(),
+            "probability": frame["probability"].to_numpy(dtype=np.float32),
+        }
+
+
+def build(args):
+    builder = IndexBuilder(args.fasta, args.output)
+    stats = None
+    try:
+        if args.scan:
+            for columns in read_scan_csv(args.scan):
+                builder.write(columns)
+        else:
+            from app import app as server
+            if not server.load_models():
+                print("Models could not be loaded")
+                sys.exit(1)
+
+            def report(progress):
+                print(f"{progress['proteins_done']} proteins, {progress['windows_done']} windows "
+                      f"in {progress['elapsed']:.1f}s")
+
+            scanner = ProteomeScanner(server.score_peptides, hla_classes=args.hla_class,
+                                      fixed_window_size=args.window_size, progress_fn=report)
+            stats = scanner.run(args.fasta, sink=builder)
+    finally:
+        builder.close()
+    builder.finish(stats)
+
+
+def query(args):
+    index = EpitopeIndex(args.index)
+    start_time = time.perf_counter()
+    if args.peptide:
+        result = index.find_peptide(args.peptide, args.limit)
+    elif args.protein:
+        result = index.protein_summary(args.protein)
+        if result is None:
+            print(f"No protein {args.protein} in the index")
+            sys.exit(1)
+    elif args.hla_class:
+        method = index.proteins if args.proteins else index.windows
+        result = method(args.hla_class, args.length, args.min_score, args.max_score, args.limit)
+    else:
+        result = index.meta
+    print(json.dumps(result, indent=2))
+    print(f"Query took {(time.perf_counter() - start_time) * 1000:.2f} ms", file=sys.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Build or query a TransHLA epitope index')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    build_parser = commands.add_parser('build', help='Build an index from a FASTA file')
+    build_parser.add_argument('fasta', help='FASTA file (optionally .gz) of the proteins to index')
+    build_parser.add_argument('-o', '--output', required=True, help='Index directory to write')
+    build_parser.add_argument('--hla-class', nargs='+', choices=['I', 'II'], default=['I', 'II'],
+                              help='HLA classes to scan (default: both)')
+    build_parser.add_argument('--window-size', type=int, default=None, help='Only index peptides of this length')
+    build_parser.add_argument('--scan', help='Index the scores in this scan.py CSV instead of scanning')
+
+    query_parser = commands.add_parser('query', help='Query an index')
+    query_parser.add_argument('index', help='Index directory')
+    query_parser.add_argument('--peptide', help='Find every occurrence of a peptide')
+    query_parser.add_argument('--protein', help='Summarize the windows of a protein')
+    query_parser.add_argument('--hla-class', choices=sorted(PEPTIDE_LENGTHS), help='Query windows of this class')
+    query_parser.add_argument('--length', type=int, default=None, help='Only windows of this length')
+    query_parser.add_argument('--min-score', type=float, default=EPITOPE_THRESHOLD)
+    query_parser.add_argument('--max-score', type=float, default=1.0)
+    query_parser.add_argument('--proteins', action='store_true', help='Group matching windows by protein')
+    query_parser.add_argument('--limit', type=int, default=DEFAULT_LIMIT)
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        try:
+            build(args)
+        except ValueError as e:
+            print(f"Error: {e}", file=sys.stderr)
+            sys.exit(1)
+    else:
+        query(args)
+
+
+if __name__ == '__main__':
+    main()
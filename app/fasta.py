@@ -0,0 +1,40 @@
+import gzip
+
+
+def open_text(path):
+    """Open a plain or gzip-compressed text file for reading."""
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rt')
+    return open(path, 'r')
+
+
+def parse_fasta(lines):
+    """Yield (header, sequence) records from an iterable of FASTA lines.
+
+    Records are streamed one at a time, so arbitrarily large files can be
+    processed in bounded memory. Sequences are upper-cased with whitespace
+    removed; text before the first header is ignored.
+    """
+    header = None
+    parts = []
+    for line in lines:
+        if isinstance(line, bytes):
+            line = line.decode('utf-8', 'replace')
+        line = line.strip()
+        if not line or line.startswith(';'):
+            continue
+        if line.startswith('>'):
+            if header is not None:
+                yield header, ''.join(parts).upper()
+            header = line[1:].strip()
+            parts = []
+        elif header is not None:
+            parts.append(''.join(line.split()))
+    if header is not None:
+        yield header, ''.join(parts).upper()
+
+
+def read_fasta(path):
+    """Yield (header, sequence) records from a FASTA file on disk."""
+    with open_text(path) as handle:
+        yield from parse_fasta(handle)
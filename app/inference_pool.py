@@ -0,0 +1,246 @@
+"""Multi-process CPU inference pool with per-worker core affinity.
+
+With TRANSHLA_INFERENCE_WORKERS=N, the server forks N inference processes
+once both models are loaded. Worker i is pinned to its own disjoint set of
+cores with os.sched_setaffinity and runs torch with exactly that many
+intra-op threads, so concurrent batches never compete for cores. Forked
+workers share the parent's model weights copy-on-write.
+
+PoolEngine has the same predict/predict_windows interface as
+BatchingEngine. Each call buckets peptides by length, splits every bucket
+into sub-batches and queues them on a shared task queue, so all workers
+stay busy on one large scan and idle workers pick up the next bucket.
+
+Workers return the rows and seconds of each forward pass with their
+results, and the parent records them in transhla_batch_size and the forward
+stage of transhla_stage_seconds, since only the parent's metrics are
+scraped. Tokenizing happens in the parent.
+
+A forked child inherits every lock held by the parent's other threads and
+hangs in its first multi-threaded torch op if the parent already ran one, so
+workers are only forked while the parent has a single thread, Python and
+torch alike. Under gunicorn the pool is started in post_fork, before the
+worker starts any thread. A pool started later (the development server, or
+a restart after a worker died) uses the forkserver start method instead, and
+each of its workers loads its own copy of the models.
+"""
+import os
+import time
+import queue
+import itertools
+import threading
+import traceback
+import multiprocessing
+from concurrent.futures import Future
+
+import numpy as np
+import torch
+
+from .metrics import BATCH_SIZE, STAGE_SECONDS, stage
+from .batching import MAX_TOKEN_LENGTH, MIN_BATCH_SIZE, BatchingEngine, bucket_by_length, encode_bucket, pick_batch_size
+from .tokenizer import NativeTokenizer, frame_windows, valid_window_starts, window_view
+
+# Number of inference processes; 0 runs inference in the request thread
+INFERENCE_WORKERS = int(os.environ.get('TRANSHLA_INFERENCE_WORKERS', 0))
+
+# Cores given to each worker; by default the available cores are split evenly
+CORES_PER_WORKER = int(os.environ.get('TRANSHLA_CORES_PER_WORKER', 0))
+
+
+def assign_cores(n_workers, cores_per_worker=None):
+    """Split the cores this process may use into disjoint per-worker sets."""
+    cores = sorted(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else list(range(os.cpu_count() or 1))
+    per_worker = cores_per_worker or max(1, len(cores) // n_workers)
+    assigned = []
+    for i in range(n_workers):
+        # Sets only overlap when more cores are requested than available
+        begin = (i * per_worker) % len(cores)
+        assigned.append(cores[begin:begin + per_worker])
+    return assigned
+
+
+def start_method():
+    """'fork' while this process runs a single thread, otherwise 'forkserver'."""
+    if threading.active_count() == 1 and torch.get_num_threads() == 1:
+        return 'fork'
+    return 'forkserver'
+
+
+def _worker_main(worker_id, cores, batch_sizes, task_queue, result_queue):
+    """Inference loop of one pinned worker process."""
+    from . import model_loader
+
+    if hasattr(os, 'sched_setaffinity'):
+        os.sched_setaffinity(0, cores)
+    # Forked workers inherit the parent's models; forkserver workers load their own
+    model_loader.load_models()
+    torch.set_num_threads(len(cores))
+    engines = {}
+    while True:
+        task = task_queue.get()
+        if task is None:
+            break
+        task_id, hla_class, token_ids = task
+        started_at = time.perf_counter()
+        try:
+            engine = engines.get(hla_class)
+            if engine is None:
+                engine = BatchingEngine(model_loader.get_model(hla_class), hla_class,
+                                        model_loader.device, batch_size=batch_sizes[hla_class])
+                engines[hla_class] = engine
+            # (rows, seconds) of each forward pass, for the parent's metrics
+            passes = []
+            outputs = []
+            for begin in range(0, len(token_ids), engine.batch_size):
+                batch = token_ids[begin:begin + engine.batch_size]
+                pass_started_at = time.perf_counter()
+                outputs.append(engine.forward_batch(batch))
+                passes.append((len(batch), time.perf_counter() - pass_started_at))
+            probabilities = np.concatenate(outputs) if outputs else np.empty(0, dtype=np.float32)
+            result_queue.put((task_id, worker_id, probabilities, None, time.perf_counter() - started_at, passes))
+        except Exception as e:
+            traceback.print_exc()
+            result_queue.put((task_id, worker_id, None, str(e), time.perf_counter() - started_at, []))
+
+
+class InferencePool:
+    """N inference processes, each pinned to its own cores."""
+
+    def __init__(self, n_workers, cores_per_worker=None, device=None):
+        self.n_workers = n_workers
+        self.device = device or torch.device('cpu')
+        self.cores = assign_cores(n_workers, cores_per_worker)
+        # The memory budget is shared by all workers
+        self.batch_sizes = {
+            hla_class: max(MIN_BATCH_SIZE, pick_batch_size(self.device, max_length) // n_workers)
+            for hla_class, max_length in MAX_TOKEN_LENGTH.items()
+        }
+        self.start_method = start_method()
+        context = multiprocessing.get_context(self.start_method)
+        self._tasks = context.Queue()
+        self._results = context.Queue()
+        self._pending = {}
+        self._ids = itertools.count()
+        self._lock = threading.Lock()
+        self.broken = False
+        self._worker_stats = [{"cores": cores, "tasks": 0, "rows": 0, "busy_seconds": 0.0} for cores in self.cores]
+        self._processes = [
+            context.Process(target=_worker_main, name=f"inference-{i}",
+                            args=(i, cores, self.batch_sizes, self._tasks, self._results), daemon=True)
+            for i, cores in enumerate(self.cores)
+        ]
+        for process in self._processes:
+            process.start()
+        self._collector = threading.Thread(target=self._collect, name="inference-results", daemon=True)
+        self._collector.start()
+        print(f"Inference pool started: {n_workers} {self.start_method} workers on cores {self.cores}")
+
+    def submit(self, hla_class, token_ids):
+        """Queue one (n, max_length) token array; returns a Future of its probabilities."""
+        future = Future()
+        with self._lock:
+            if self.broken:
+                raise RuntimeError("Inference pool is not running")
+            task_id = next(self._ids)
+            self._pending[task_id] = (future, hla_class, len(token_ids))
+        self._tasks.put((task_id, hla_class, np.ascontiguousarray(token_ids)))
+        return future
+
+    def _collect(self):
+        while True:
+            try:
+                task_id, worker_id, probabilities, error, seconds, passes = self._results.get(timeout=1.0)
+            except queue.Empty:
+                if not all(p.is_alive() for p in self._processes):
+                    self._fail_pending(RuntimeError("An inference worker exited unexpectedly"))
+                    return
+                continue
+            with self._lock:
+                future, hla_class, rows = self._pending.pop(task_id)
+                stats = self._worker_stats[worker_id]
+                stats["tasks"] += 1
+                stats["rows"] += rows
+                stats["busy_seconds"] += seconds
+            for pass_rows, pass_seconds in passes:
+                BATCH_SIZE.observe(pass_rows, hla_class=hla_class)
+                STAGE_SECONDS.observe(pass_seconds, stage='forward')
+            if error is None:
+                future.set_result(probabilities)
+            else:
+                future.set_exception(RuntimeError(error))
+
+    def _fail_pending(self, error):
+        with self._lock:
+            self.broken = True
+            pending, self._pending = self._pending, {}
+        for future, _, _ in pending.values():
+            future.set_exception(error)
+
+    def close(self):
+        for _ in self._processes:
+            self._tasks.put(None)
+        for process in self._processes:
+            process.join(timeout=5)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "workers": self.n_workers,
+                "start_method": self.start_method,
+                "batch_sizes": dict(self.batch_sizes),
+                "pending_tasks": len(self._pending),
+                "broken": self.broken,
+                "per_worker": [dict(s, busy_seconds=round(s["busy_seconds"], 3)) for s in self._worker_stats],
+            }
+
+
+class PoolEngine:
+    """BatchingEngine interface backed by an InferencePool."""
+
+    def __init__(self, pool, hla_class):
+        self.pool = pool
+        self.hla_class = hla_class
+        self.max_length = MAX_TOKEN_LENGTH[hla_class]
+        self.tokenizer = NativeTokenizer()
+        # Large enough that one chunk of a scan keeps every worker busy
+        self.batch_size = pool.batch_sizes[hla_class] * pool.n_workers
+
+    def _split(self, n):
+        """Sub-batch size that spreads n rows evenly over the workers."""
+        per_worker = -(-n // self.pool.n_workers)
+        return max(1, min(per_worker, self.pool.batch_sizes[self.hla_class]))
+
+    def _run(self, token_ids):
+        step = self._split(len(token_ids))
+        futures = [self.pool.submit(self.hla_class, token_ids[begin:begin + step])
+                   for begin in range(0, len(token_ids), step)]
+        if not futures:
+            return np.empty(0, dtype=np.float32)
+        return np.concatenate([future.result() for future in futures])
+
+    def predict(self, sequences):
+        """Return a float32 array of epitope probabilities for sequences."""
+        probabilities = np.empty(len(sequences), dtype=np.float32)
+        buckets = bucket_by_length(sequences)
+        # Queue every length bucket before waiting on any of them
+        futures = []
+        for length, indices in buckets.items():
+            with stage('tokenize'):
+                token_ids = encode_bucket(self.tokenizer, [sequences[i] for i in indices], self.max_length)
+            step = self._split(len(indices))
+            for begin in range(0, len(indices), step):
+                futures.append((indices[begin:begin + step],
+                                self.pool.submit(self.hla_class, token_ids[begin:begin + step])))
+        for indices, future in futures:
+            probabilities[indices] = future.result()
+        return probabilities
+
+    def predict_windows(self, residue_ids, length, valid=None, starts=None):
+        """Score windows of one length over a tokenized protein; returns (starts, probabilities)."""
+        windows = window_view(residue_ids, length)
+        if starts is None:
+            starts = np.arange(windows.shape[0]) if valid is None else valid_window_starts(valid, length)
+        starts = np.asarray(starts, dtype=np.int64)
+        with stage('tokenize'):
+            token_ids = frame_windows(windows[starts], self.max_length)
+        return starts, self._run(token_ids)
@@ -0,0 +1,400 @@
+"""Asynchronous job subsystem for long predictions.
+
+Jobs run on background threads of the server process, with the models it
+already loaded (shared copy-on-write with the other gunicorn workers), so
+large sliding-window, proteome or structure jobs never tie up the HTTP
+threads. At most MAX_CONCURRENT_JOBS run at once across every worker: a
+running job holds an exclusive lock on one of that many slot files, which
+the kernel releases if its worker dies. All job state lives on disk under
+the jobs directory:
+
+    <job_id>/status.json    status, progress and summary (replaced atomically)
+    <job_id>/results.ndjson one JSON record per line
+    <job_id>/results.idx    int64 byte offset of every results line
+    <job_id>/cancel         present once cancellation was requested
+
+so any HTTP worker can report status, page through results or cancel a
+job, whichever process happens to run it. Finished jobs are deleted
+JOB_TTL seconds after they finish.
+"""
+import os
+import json
+import time
+import uuid
+import fcntl
+import shutil
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+# Number of jobs allowed to run at once across all workers; more are queued
+MAX_CONCURRENT_JOBS = int(os.environ.get('TRANSHLA_MAX_JOBS', 2))
+
+# Seconds a finished job's status and results are kept
+JOB_TTL = float(os.environ.get('TRANSHLA_JOB_TTL', 7 * 24 * 3600))
+
+# Seconds a queued job waits between attempts to take a slot
+SLOT_POLL_SECONDS = 0.5
+
+# Largest page of results returned by one request
+MAX_PAGE_SIZE = 10000
+
+JOB_TYPES = ("sliding", "scan", "structure")
+FINISHED_STATES = ("completed", "failed", "cancelled")
+
+
+class JobCancelled(Exception):
+    pass
+
+
+def _write_json(path, payload):
+    temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(temp_path, 'w') as handle:
+        json.dump(payload, handle)
+    os.replace(temp_path, path)
+
+
+def _read_json(path):
+    with open(path) as handle:
+        return json.load(handle)
+
+
+class JobWriter:
+    """Worker-side handle: appends results, reports progress, checks for cancellation."""
+
+    def __init__(self, job_dir):
+        self.job_dir = job_dir
+        self.status_path = os.path.join(job_dir, 'status.json')
+        self.cancel_path = os.path.join(job_dir, 'cancel')
+        self.status = _read_json(self.status_path)
+        self._results = open(os.path.join(job_dir, 'results.ndjson'), 'ab')
+        self._index = open(os.path.join(job_dir, 'results.idx'), 'ab')
+        self._last_report = 0.0
+
+    def update(self, force=False, **fields):
+        self.status.update(fields)
+        now = time.time()
+        # Progress is written at most a few times a second
+        if force or now - self._last_report > 0.25:
+            _write_json(self.status_path, self.status)
+            self._last_report = now
+
+    def check_cancelled(self):
+        if os.path.exists(self.cancel_path):
+            raise JobCancelled()
+
+    def progress(self, done, total=None):
+        self.check_cancelled()
+        progress = dict(self.status.get("progress") or {}, done=done)
+        if total is not None:
+            progress["total"] = total
+        self.update(progress=progress)
+
+    def append(self, records):
+        """Append result records; the index is written after the data it points to."""
+        offset = self._results.tell()
+        offsets = []
+        lines = []
+        for record in records:
+            line = (json.dumps(record) + "\n").encode()
+            offsets.append(offset)
+            offset += len(line)
+            lines.append(line)
+        self._results.write(b"".join(lines))
+        self._results.flush()
+        self._index.write(np.asarray(offsets, dtype=np.int64).tobytes())
+        self._index.flush()
+        self.status["results_count"] = self.status.get("results_count", 0) + len(offsets)
+
+    def close(self):
+        self._results.close()
+        self._index.close()
+
+
+class _ResultSink:
+    """Adapts ProteomeScanner column output to job result records."""
+
+    def __init__(self, writer):
+        self.writer = writer
+
+    def write(self, columns):
+        self.writer.append(
+            {
+                "protein_id": protein_id,
+                "hla_class": hla_class,
+                "position": position,
+                "length": length,
+                "peptide": peptide,
+                "probability": probability,
+                "is_epitope": is_epitope,
+            }
+            for protein_id, hla_class, position, length, peptide, probability, is_epitope in zip(
+                columns["protein_id"], columns["hla_class"], columns["position"].tolist(),
+                columns["length"].tolist(), columns["peptide"], columns["probability"].tolist(),
+                columns["is_epitope"].tolist())
+        )
+
+    def flush(self):
+        return {"results_count": self.writer.status.get("results_count", 0)}
+
+    def close(self):
+        pass
+
+
+def _run_sliding(server, writer, params):
+    sequence = params["sequence"]
+    hla_class = params.get("hla_class", "I")
+    window_size = params.get("window_size")
+    total = server.count_windows(sequence, hla_class, window_size)
+    writer.progress(0, total)
+    done = 0
+    epitope_count = 0
+    for batch in server.iter_sliding_predictions(sequence, hla_class, window_size):
+        writer.append(batch.to_rows())
+        done += len(batch)
+        epitope_count += batch.epitope_count
+        writer.progress(done)
+    return {
+        "original_sequence": sequence,
+        "hla_class": hla_class,
+        "total_peptides": done,
+        "epitope_count": epitope_count,
+        "epitope_density": epitope_count / done if done else 0
+    }
+
+
+def _run_scan(server, writer, params):
+    from .fasta import read_fasta
+    from .proteome_scan import ProteomeScanner, count_windows
+
+    hla_classes = params.get("hla_classes", ["I", "II"])
+    window_size = params.get("window_size")
+    total = sum(count_windows(sequence, hla_classes, window_size)
+                for _, sequence in read_fasta(params["fasta_path"]))
+    writer.progress(0, total)
+
+    def progress(stats):
+        writer.progress(stats["windows_done"])
+
+    scanner = ProteomeScanner(
+        server.score_peptides,
+        hla_classes=hla_classes,
+        fixed_window_size=window_size,
+        epitopes_only=params.get("epitopes_only", False),
+        progress_fn=progress
+    )
+    stats = scanner.run(params["fasta_path"], None, sink=_ResultSink(writer))
+    return {key: stats[key] for key in ("proteins_done", "windows_done", "unique_peptides_scored", "rows_written")}
+
+
+def _run_structure(server, writer, params):
+    writer.progress(0, 1)
+    pdb_structure = server.fetch_structure(params["sequence"])
+    writer.append([{"sequence": params["sequence"], "pdb_structure": pdb_structure}])
+    writer.progress(1)
+    return {"sequence_length": len(params["sequence"])}
+
+
+JOB_RUNNERS = {
+    "sliding": _run_sliding,
+    "scan": _run_scan,
+    "structure": _run_structure,
+}
+
+
+class JobSlots:
+    """At most count jobs at once across all processes sharing slots_dir."""
+
+    def __init__(self, slots_dir, count):
+        self.paths = [os.path.join(slots_dir, f"{i}.lock") for i in range(count)]
+        os.makedirs(slots_dir, exist_ok=True)
+
+    def try_acquire(self):
+        """Lock a free slot and return its open file, or None if all are taken."""
+        for path in self.paths:
+            handle = open(path, 'a')
+            try:
+                fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return handle
+            except BlockingIOError:
+                handle.close()
+        return None
+
+    def acquire(self, writer):
+        """Wait for a free slot, giving up if the job is cancelled meanwhile."""
+        while True:
+            writer.check_cancelled()
+            handle = self.try_acquire()
+            if handle is not None:
+                return handle
+            time.sleep(SLOT_POLL_SECONDS)
+
+    @staticmethod
+    def release(handle):
+        fcntl.flock(handle, fcntl.LOCK_UN)
+        handle.close()
+
+
+def run_job(job_dir, job_type, params, slots):
+    """Run one job on the calling thread once a slot is free."""
+    from . import app as server
+
+    writer = JobWriter(job_dir)
+    slot = None
+    try:
+        slot = slots.acquire(writer)
+        writer.update(force=True, status="running", started_at=time.time())
+        if job_type != "structure" and not server.load_models():
+            raise RuntimeError("Models could not be loaded")
+        summary = JOB_RUNNERS[job_type](server, writer, params)
+        writer.update(force=True, status="completed", summary=summary, finished_at=time.time())
+    except JobCancelled:
+        writer.update(force=True, status="cancelled", finished_at=time.time())
+    except Exception as e:
+        print(f"Error in job {os.path.basename(job_dir)}: {str(e)}")
+        traceback.print_exc()
+        writer.update(force=True, status="failed", error=str(e), finished_at=time.time())
+    finally:
+        if slot is not None:
+            slots.release(slot)
+        writer.close()
+
+
+class JobManager:
+    """Submit, inspect, page and cancel jobs stored under jobs_dir."""
+
+    def __init__(self, jobs_dir, max_workers=None, ttl=None):
+        self.jobs_dir = jobs_dir
+        self.max_workers = max_workers or MAX_CONCURRENT_JOBS
+        self.ttl = JOB_TTL if ttl is None else ttl
+        self.slots = JobSlots(os.path.join(jobs_dir, 'slots'), self.max_workers)
+        self._executor = None
+        self._futures = {}
+        self._lock = threading.Lock()
+        self._last_cleanup = 0.0
+        os.makedirs(jobs_dir, exist_ok=True)
+
+    def _get_executor(self):
+        # Created on first use so pre-forking servers do not inherit its threads
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='job')
+            return self._executor
+
+    def job_dir(self, job_id):
+        # Job IDs are hex UUIDs; anything else cannot name a job directory
+        if not job_id or not all(c in '0123456789abcdef' for c in job_id):
+            return None
+        path = os.path.join(self.jobs_dir, job_id)
+        return path if os.path.isdir(path) else None
+
+    def create(self, job_type, params):
+        """Create a job directory and return (job_id, job_dir) without starting it."""
+        if job_type not in JOB_TYPES:
+            raise ValueError(f"Unknown job type '{job_type}'")
+        self.remove_expired()
+        job_id = uuid.uuid4().hex
+        job_dir = os.path.join(self.jobs_dir, job_id)
+        os.makedirs(job_dir)
+        _write_json(os.path.join(job_dir, 'status.json'), {
+            "job_id": job_id,
+            "type": job_type,
+            "status": "queued",
+            "progress": {"done": 0, "total": None},
+            "results_count": 0,
+            "created_at": time.time(),
+        })
+        return job_id, job_dir
+
+    def start(self, job_id, job_type, params):
+        future = self._get_executor().submit(run_job, os.path.join(self.jobs_dir, job_id), job_type, params, self.slots)
+        with self._lock:
+            self._futures[job_id] = future
+        future.add_done_callback(lambda f: self._futures.pop(job_id, None))
+        return job_id
+
+    def submit(self, job_type, params):
+        """Queue a job and return its ID."""
+        job_id, _ = self.create(job_type, params)
+        return self.start(job_id, job_type, params)
+
+    def status(self, job_id):
+        job_dir = self.job_dir(job_id)
+        if job_dir is None:
+            return None
+        status = _read_json(os.path.join(job_dir, 'status.json'))
+        progress = status.get("progress") or {}
+        if progress.get("total"):
+            progress["fraction"] = progress["done"] / progress["total"]
+        return status
+
+    def results(self, job_id, offset=0, limit=1000):
+        """Return (records, total available) for one page of a job's results."""
+        job_dir = self.job_dir(job_id)
+        if job_dir is None:
+            return None, 0
+        limit = max(0, min(limit, MAX_PAGE_SIZE))
+        index_path = os.path.join(job_dir, 'results.idx')
+        if not os.path.exists(index_path):
+            return [], 0
+        available = os.path.getsize(index_path) // 8
+        if offset >= available or limit == 0:
+            return [], available
+        count = min(limit, available - offset)
+        with open(index_path, 'rb') as handle:
+            handle.seek(offset * 8)
+            start = int(np.frombuffer(handle.read(8), dtype=np.int64)[0])
+        records = []
+        with open(os.path.join(job_dir, 'results.ndjson'), 'rb') as handle:
+            handle.seek(start)
+            for _ in range(count):
+                records.append(json.loads(handle.readline()))
+        return records, available
+
+    def cancel(self, job_id):
+        """Request cancellation; returns the resulting status or None if unknown."""
+        job_dir = self.job_dir(job_id)
+        if job_dir is None:
+            return None
+        status = self.status(job_id)
+        if status["status"] in FINISHED_STATES:
+            return status
+        open(os.path.join(job_dir, 'cancel'), 'w').close()
+        with self._lock:
+            future = self._futures.get(job_id)
+        if future is not None and future.cancel():
+            status.update(status="cancelled", finished_at=time.time())
+            _write_json(os.path.join(job_dir, 'status.json'), status)
+        return self.status(job_id)
+
+    def remove_expired(self, now=None):
+        """Delete jobs that finished more than ttl seconds ago; returns how many.
+
+        Runs at most once a minute unless a time is given.
+        """
+        if now is None:
+            now = time.time()
+            if now - self._last_cleanup < 60:
+                return 0
+        self._last_cleanup = now
+        removed = 0
+        for job_id in os.listdir(self.jobs_dir):
+            job_dir = self.job_dir(job_id)
+            if job_dir is None:
+                continue
+            try:
+                status = _read_json(os.path.join(job_dir, 'status.json'))
+            except (OSError, ValueError):
+                continue
+            if status.get("status") in FINISHED_STATES and now - status.get("finished_at", now) > self.ttl:
+                shutil.rmtree(job_dir, ignore_errors=True)
+                removed += 1
+        return removed
+
+    def stats(self):
+        with self._lock:
+            active = len(self._futures)
+        return {"max_concurrent_jobs": self.max_workers, "ttl_seconds": self.ttl,
+                "active_in_this_worker": active}
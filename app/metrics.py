@@ -0,0 +1,169 @@
+"""Prometheus-style metrics, per-stage timing and trace-tagged logs.
+
+Metrics are kept in process and rendered in the Prometheus text format by
+the /metrics endpoint. Each gunicorn worker and inference pool process
+keeps its own values, so scrape each worker rather than the load balancer
+when running several.
+
+Request handling is timed stage by stage:
+
+    with stage('forward'):
+        outputs = model(input_tensor)
+
+Every request gets a trace ID (taken from an X-Request-ID header when the
+client sends one); log_event writes one JSON line per event tagged with the
+trace ID of the request being handled by the current thread.
+"""
+import json
+import time
+import threading
+from contextlib import contextmanager
+
+# Seconds; covers sub-millisecond stages up to long sliding-window scans
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+# Rows per model forward pass
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024, 2048)
+
+_metrics = []
+_collectors = []
+_local = threading.local()
+
+
+def _label_text(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{value}"' for name, value in labels) + '}'
+
+
+def _format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """Monotonically increasing count, optionally split by labels."""
+
+    kind = 'counter'
+
+    def __init__(self, name, description):
+        self.name = name
+        self.description = description
+        self._values = {}
+        self._lock = threading.Lock()
+        _metrics.append(self)
+
+    def inc(self, amount=1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            return [(self.name, key, value) for key, value in self._values.items()]
+
+
+class Histogram:
+    """Distribution of observed values over fixed buckets, optionally split by labels."""
+
+    kind = 'histogram'
+
+    def __init__(self, name, description, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.description = description
+        self.buckets = tuple(buckets)
+        self._values = {}
+        self._lock = threading.Lock()
+        _metrics.append(self)
+
+    def observe(self, value, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            counts = self._values.get(key)
+            if counts is None:
+                counts = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[0][i] += 1
+                    break
+            counts[1] += value
+            counts[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        started_at = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started_at, **labels)
+
+    def samples(self):
+        samples = []
+        with self._lock:
+            for key, (counts, total, count) in self._values.items():
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets, counts):
+                    cumulative += bucket_count
+                    samples.append((f"{self.name}_bucket", key + (('le', _format_value(float(bound))),), cumulative))
+                samples.append((f"{self.name}_bucket", key + (('le', '+Inf'),), count))
+                samples.append((f"{self.name}_sum", key, total))
+                samples.append((f"{self.name}_count", key, count))
+        return samples
+
+
+def register_collector(collect):
+    """Add a callable returning [(name, kind, description, [(labels dict, value)])] at scrape time.
+
+    Used to expose values already tracked elsewhere, such as cache statistics.
+    """
+    _collectors.append(collect)
+
+
+def render():
+    """All metrics in the Prometheus text exposition format."""
+    lines = []
+    for metric in _metrics:
+        lines.append(f"# HELP {metric.name} {metric.description}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        for name, labels, value in metric.samples():
+            lines.append(f"{name}{_label_text(labels)} {_format_value(value)}")
+    for collect in _collectors:
+        try:
+            families = collect()
+        except Exception as e:
+            print(f"Warning: metrics collector failed: {str(e)}")
+            continue
+        for name, kind, description, samples in families:
+            lines.append(f"# HELP {name} {description}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in samples:
+                if value is not None:
+                    lines.append(f"{name}{_label_text(sorted(labels.items()))} {_format_value(value)}")
+    return '\n'.join(lines) + '\n'
+
+
+STAGE_SECONDS = Histogram('transhla_stage_seconds', 'Time spent in each request handling stage')
+REQUEST_SECONDS = Histogram('transhla_request_seconds', 'HTTP request latency by endpoint')
+REQUESTS = Counter('transhla_requests_total', 'HTTP requests by endpoint and status')
+BATCH_SIZE = Histogram('transhla_batch_size', 'Rows per model forward pass', BATCH_SIZE_BUCKETS)
+QUEUE_WAIT_SECONDS = Histogram('transhla_queue_wait_seconds', 'Time a peptide waited in a micro-batch queue')
+ADMISSIONS = Counter('transhla_admissions_total', 'Prediction requests admitted or rejected by lane')
+
+
+def stage(name):
+    """Time a block as one request handling stage."""
+    return STAGE_SECONDS.time(stage=name)
+
+
+def set_trace_id(trace_id):
+    _local.trace_id = trace_id
+
+
+def current_trace_id():
+    return getattr(_local, 'trace_id', None)
+
+
+def log_event(event, **fields):
+    """Print one JSON log line tagged with the current trace ID."""
+    record = {"time": round(time.time(), 3), "event": event, "trace_id": current_trace_id()}
+    record.update(fields)
+    print(json.dumps(record, default=str), flush=True)
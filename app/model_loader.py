@@ -1,13 +1,19 @@
 import traceback
 import os
 import sys
+import time
+import argparse
+import threading
 
 # Get the project root directory (parent of the app directory)
 PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
 sys.path.append(PROJECT_ROOT)
 
-# Apply JIT environment variables directly
-os.environ['PYTORCH_JIT'] = '0'
+# Apply JIT environment variables directly; TorchScript stays enabled for compiled inference.
+# They only take effect when torch is not imported yet (python -m app.model_loader);
+# run.py, scan.py and gunicorn.conf.py set them before their first torch import
+if os.environ.get('TRANSHLA_COMPILE', 'off') == 'off':
+    os.environ['PYTORCH_JIT'] = '0'
 os.environ['PYTORCH_DISABLE_JIT_PROFILING'] = '1'
 
 # Try to apply JIT fix if available
@@ -26,12 +32,21 @@ device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
 print(f"Model loader using device: {device}")
 
 # Import transformers
-from transformers import AutoTokenizer, AutoModel
+from transformers import AutoModel
+
+from .tokenizer import NativeTokenizer
+from .batching import BatchingEngine
+from .shared_backbone import share_backbones
+from .precision import apply_precision, reference_peptides
+from .compiled import CompiledModel, apply_compilation
+from .weights import checkpoint_digest, checkpoint_files, load_mmap_model, remap_to_mmap
+from .inference_pool import INFERENCE_WORKERS
 
 # Set cache directory paths
 CACHE_DIR = os.path.join(PROJECT_ROOT, '.cache')
 HF_CACHE_DIR = os.path.join(CACHE_DIR, 'huggingface')
 TORCH_CACHE_DIR = os.path.join(CACHE_DIR, 'torch')
+COMPILED_DIR = os.path.join(CACHE_DIR, 'compiled')
 MODELS_DIR = os.path.join(PROJECT_ROOT, 'models')
 
 # Set environment variables for caching
@@ -61,57 +76,213 @@ except PermissionError as e:
     os.environ["TORCH_HOME"] = TORCH_CACHE_DIR
     print(f"Using temporary directories at {temp_dir}")
 
+# Hub repositories of the TransHLA checkpoints
+MODEL_REPOS = {"I": "SkywalkerLu/TransHLA_I", "II": "SkywalkerLu/TransHLA_II"}
+
+# Directory holding pre-baked snapshots (models/TransHLA_I, models/TransHLA_II)
+SNAPSHOT_DIR = os.environ.get('TRANSHLA_MODEL_DIR', MODELS_DIR)
+
+# Set to 0 to never reach the network; only local snapshots and the hub cache are used
+ALLOW_DOWNLOAD = os.environ.get('TRANSHLA_ALLOW_DOWNLOAD', '1') == '1' and os.environ.get('HF_HUB_OFFLINE', '0') != '1'
+
+# Set to 1 to start loading both models in the background at import
+PRELOAD = os.environ.get('TRANSHLA_PRELOAD', '0') == '1'
+
+# Peptides run through each model after loading so the first request is warm
+WARMUP_BATCH_SIZE = int(os.environ.get('TRANSHLA_WARMUP_BATCH_SIZE', 32))
+
+# Inference pool workers are forked from this process, which must not have
+# run a multi-threaded torch op before they start
+if INFERENCE_WORKERS > 0 and device.type == 'cpu':
+    torch.set_num_threads(1)
+
 # Model instances
-tokenizer = None
+tokenizer = NativeTokenizer()
 transHLA_I_model = None
 transHLA_II_model = None
+shared_backbone = None
 models_loaded = False
 
-def load_models():
-    """Attempt to load the TransHLA models."""
-    global tokenizer, transHLA_I_model, transHLA_II_model, models_loaded
+# Calibration report of the precision mode serving each HLA class
+precision_reports = {}
+
+# Compile report of each HLA class model: graph source, per-bucket parity and timing
+compile_reports = {}
+
+# Load state of each HLA class model, reported by /health/ready
+load_state = {hla_class: {"status": "not_loaded"} for hla_class in MODEL_REPOS}
+
+_ready_events = {hla_class: threading.Event() for hla_class in MODEL_REPOS}
+_loader_threads = {}
+_state_lock = threading.Lock()
+# Loads run one at a time so two checkpoints are never materialized at once
+_load_lock = threading.Lock()
+
+def resolve_snapshot(hla_class):
+    """Return a local directory holding the checkpoint of an HLA class model.
+
+    A pre-baked snapshot under SNAPSHOT_DIR is used first, then the hub
+    cache; the hub is only contacted when ALLOW_DOWNLOAD is set.
+    """
+    from huggingface_hub import snapshot_download
+    from huggingface_hub.errors import LocalEntryNotFoundError
     
+    baked = os.path.join(SNAPSHOT_DIR, os.path.basename(MODEL_REPOS[hla_class]))
+    if os.path.exists(os.path.join(baked, 'config.json')) and checkpoint_files(baked):
+        return baked
     try:
-        print(f"Loading models with device: {device}")
-        print(f"Using cache directory: {HF_CACHE_DIR}")
-        
-        # First load tokenizer
-        print("Loading tokenizer...")
-        tokenizer = AutoTokenizer.from_pretrained(
-            "facebook/esm2_t33_650M_UR50D", 
-            cache_dir=HF_CACHE_DIR,
-            local_files_only=False
-        )
-        
-        # Then load the models
-        print("Loading TransHLA_I model...")
-        transHLA_I_model = AutoModel.from_pretrained(
-            "SkywalkerLu/TransHLA_I", 
-            trust_remote_code=True, 
-            cache_dir=HF_CACHE_DIR,
-            local_files_only=False
-        )
-        transHLA_I_model.to(device)
-        transHLA_I_model.eval()
-        
-        print("Loading TransHLA_II model...")
-        transHLA_II_model = AutoModel.from_pretrained(
-            "SkywalkerLu/TransHLA_II", 
-            trust_remote_code=True, 
-            cache_dir=HF_CACHE_DIR,
-            local_files_only=False
-        )
-        transHLA_II_model.to(device)
-        transHLA_II_model.eval()
-        
-        models_loaded = True
-        print("All models loaded successfully!")
-        return True
-    except Exception as e:
-        print(f"Error loading models: {str(e)}")
-        traceback.print_exc()
-        models_loaded = False
-        return False
-
-# Try to load models when this module is imported
-load_models() 
\ No newline at end of file
+        return snapshot_download(MODEL_REPOS[hla_class], cache_dir=HF_CACHE_DIR, local_files_only=True)
+    except LocalEntryNotFoundError:
+        if not ALLOW_DOWNLOAD:
+            raise RuntimeError(f"No local snapshot of {MODEL_REPOS[hla_class]} and downloads are disabled")
+    print(f"Downloading {MODEL_REPOS[hla_class]}...")
+    return snapshot_download(MODEL_REPOS[hla_class], cache_dir=HF_CACHE_DIR)
+
+def warm_up(model, hla_class):
+    """Run one batch through a model to settle allocator and kernel choices."""
+    if WARMUP_BATCH_SIZE <= 0:
+        return 0.0
+    start_time = time.time()
+    engine = BatchingEngine(model, hla_class, device, batch_size=WARMUP_BATCH_SIZE)
+    engine.predict(reference_peptides(hla_class, WARMUP_BATCH_SIZE))
+    return time.time() - start_time
+
+def install_model(hla_class, model):
+    """Make a loaded model the one serving an HLA class."""
+    global transHLA_I_model, transHLA_II_model, shared_backbone, models_loaded
+    
+    other = transHLA_II_model if hla_class == "I" else transHLA_I_model
+    if other is not None:
+        # Keep a single copy of the ESM backbone when both models carry the same one
+        model_i, model_ii = (model, other) if hla_class == "I" else (other, model)
+        shared_backbone = share_backbones(model_i, model_ii)
+        # Compiled graphs still hold the tensors of the backbone that was dropped
+        compiled_classes = [c for c, m in (("I", model_i), ("II", model_ii)) if isinstance(m, CompiledModel)]
+        for compiled in (model_i, model_ii):
+            if isinstance(compiled, CompiledModel):
+                compiled.tie_weights()
+        # A traced graph never calls the shared backbone's forward, so
+        # captured embeddings could not be replayed into it
+        if shared_backbone is not None and compiled_classes:
+            shared_backbone.reuse_enabled = False
+            for compiled_class in compiled_classes:
+                compile_reports.setdefault(compiled_class, {})["embedding_reuse"] = (
+                    "disabled: compiled graphs bypass the shared backbone's capture and replay")
+            print("Embedding reuse disabled: compiled graphs bypass the shared backbone")
+    if hla_class == "I":
+        transHLA_I_model = model
+    else:
+        transHLA_II_model = model
+    with _state_lock:
+        load_state[hla_class]["status"] = "ready"
+        models_loaded = transHLA_I_model is not None and transHLA_II_model is not None
+    _ready_events[hla_class].set()
+
+def load_model(hla_class):
+    """Load, convert and warm up the model of one HLA class."""
+    with _load_lock:
+        if _ready_events[hla_class].is_set():
+            return True
+        try:
+            start_time = time.time()
+            snapshot = resolve_snapshot(hla_class)
+            print(f"Loading TransHLA_{hla_class} model from {snapshot}...")
+            # On CPU the weights are assigned straight from the memory-mapped checkpoint
+            model, mapped = load_mmap_model(snapshot) if device.type == 'cpu' else (None, 0)
+            if model is None:
+                model = AutoModel.from_pretrained(snapshot, trust_remote_code=True, low_cpu_mem_usage=True)
+                model.to(device)
+                model.eval()
+                mapped = remap_to_mmap(model, snapshot) if device.type == 'cpu' else 0
+            # Scores are stored under this digest, so it must follow the weights, not the path
+            model.config.checkpoint_sha256 = checkpoint_digest(snapshot)
+            
+            # Switch to the requested precision where it passes calibration against fp32
+            model, precision_reports[hla_class] = apply_precision(model, hla_class, device)
+            # Serve through a traced fixed-shape graph where it matches eager mode
+            model, compile_reports[hla_class] = apply_compilation(model, hla_class, device, COMPILED_DIR)
+            load_seconds = time.time() - start_time
+            warmup_seconds = warm_up(model, hla_class)
+            with _state_lock:
+                load_state[hla_class].update(
+                    load_seconds=round(load_seconds, 2),
+                    warmup_seconds=round(warmup_seconds, 2),
+                    mmap_bytes=mapped,
+                    error=None
+                )
+            install_model(hla_class, model)
+            print(f"TransHLA_{hla_class} ready in {load_seconds + warmup_seconds:.2f} seconds "
+                  f"({mapped / 1024 ** 2:.0f} MB memory-mapped)")
+            return True
+        except Exception as e:
+            print(f"Error loading TransHLA_{hla_class} model: {str(e)}")
+            traceback.print_exc()
+            with _state_lock:
+                load_state[hla_class].update(status="failed", error=str(e))
+            return False
+
+def start_loading(hla_classes=("I", "II")):
+    """Load the given class models in background threads unless loaded or loading."""
+    with _state_lock:
+        for hla_class in hla_classes:
+            thread = _loader_threads.get(hla_class)
+            if _ready_events[hla_class].is_set() or (thread is not None and thread.is_alive()):
+                continue
+            load_state[hla_class].update(status="loading", error=None)
+            thread = threading.Thread(target=load_model, args=(hla_class,),
+                                      name=f"load-{hla_class}", daemon=True)
+            _loader_threads[hla_class] = thread
+            thread.start()
+
+def wait_for_models(hla_classes=("I", "II"), timeout=None):
+    """Start loading the given class models if needed; True once all are ready."""
+    start_loading(hla_classes)
+    deadline = None if timeout is None else time.time() + timeout
+    for hla_class in hla_classes:
+        thread = _loader_threads.get(hla_class)
+        while not _ready_events[hla_class].is_set() and thread is not None and thread.is_alive():
+            remaining = None if deadline is None else deadline - time.time()
+            if remaining is not None and remaining <= 0:
+                return False
+            thread.join(remaining)
+        if not _ready_events[hla_class].is_set():
+            return False
+    return True
+
+def get_model(hla_class):
+    """Return the model serving an HLA class, or None while it is not loaded."""
+    return transHLA_I_model if hla_class == "I" else transHLA_II_model
+
+def load_models():
+    """Load both TransHLA models, blocking until they are ready."""
+    return wait_for_models(("I", "II"))
+
+def readiness():
+    """Per-class load state, and whether both models are ready."""
+    with _state_lock:
+        return {"ready": models_loaded, "models": {c: dict(state) for c, state in load_state.items()}}
+
+def main():
+    global SNAPSHOT_DIR
+    parser = argparse.ArgumentParser(description='Bake TransHLA model snapshots for offline startup')
+    parser.add_argument('--output', default=SNAPSHOT_DIR,
+                        help=f'Directory to write the snapshots to (default: {SNAPSHOT_DIR})')
+    args = parser.parse_args()
+    from huggingface_hub import snapshot_download
+    
+    SNAPSHOT_DIR = args.output
+    
+    for hla_class, repo in MODEL_REPOS.items():
+        local_dir = os.path.join(args.output, os.path.basename(repo))
+        print(f"Saving {repo} to {local_dir}...")
+        snapshot_download(repo, local_dir=local_dir)
+    # Loading once also fetches anything the model code pulls in itself
+    if not load_models():
+        sys.exit(1)
+    print("Snapshots saved; start the server with TRANSHLA_ALLOW_DOWNLOAD=0 to stay offline")
+
+if PRELOAD:
+    start_loading()
+
+if __name__ == '__main__':
+    main()
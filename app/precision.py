@@ -0,0 +1,206 @@
+"""Reduced-precision inference modes for the TransHLA models.
+
+TRANSHLA_PRECISION selects the mode applied in load_models:
+
+    fp32  full precision (default)
+    int8  dynamic int8 quantization of the Linear layers (CPU only)
+    bf16  bfloat16 autocast, on devices with native bfloat16 support
+
+A reduced-precision mode is only enabled after a calibration run on a
+fixed reference peptide set: if its probabilities drift from fp32 by more
+than MAX_PROBABILITY_DRIFT, or more than MAX_FLIP_RATE of the peptides
+change is_epitope, the fp32 model is kept. Each run reports throughput and
+weight memory for both precisions.
+
+Compare all modes on the loaded checkpoints with:
+
+    python -m app.precision
+"""
+import os
+import sys
+import copy
+import time
+import warnings
+
+import numpy as np
+import torch
+import torch.nn as nn
+
+from .batching import BatchingEngine, EPITOPE_THRESHOLD, PEPTIDE_LENGTHS
+from .cache import state_tensors
+
+PRECISION_MODES = ("fp32", "int8", "bf16")
+
+# Precision requested for inference
+PRECISION_MODE = os.environ.get('TRANSHLA_PRECISION', 'fp32')
+
+# Guardrails a reduced-precision mode must pass against fp32
+MAX_PROBABILITY_DRIFT = float(os.environ.get('TRANSHLA_PRECISION_MAX_DRIFT', 0.02))
+MAX_FLIP_RATE = float(os.environ.get('TRANSHLA_PRECISION_MAX_FLIP_RATE', 0.005))
+
+# Number of reference peptides scored per class during calibration
+CALIBRATION_SIZE = int(os.environ.get('TRANSHLA_CALIBRATION_SIZE', 256))
+CALIBRATION_BATCH_SIZE = 64
+
+AMINO_ACIDS = np.array(list("ACDEFGHIKLMNPQRSTVWY"))
+
+
+class AutocastModel(nn.Module):
+    """Run a model under bfloat16 autocast and return float32 outputs."""
+
+    def __init__(self, model, device_type):
+        super().__init__()
+        self.model = model
+        self.device_type = device_type
+        self.config = getattr(model, 'config', None)
+
+    def forward(self, input_ids):
+        with torch.autocast(self.device_type, dtype=torch.bfloat16):
+            outputs = self.model(input_ids)
+        return tuple(o.float() if torch.is_tensor(o) else o for o in outputs)
+
+
+def reference_peptides(hla_class, count=None):
+    """Deterministic random peptides spanning the class's length range."""
+    count = count or CALIBRATION_SIZE
+    rng = np.random.default_rng(20240517)
+    lengths = rng.choice(np.array(PEPTIDE_LENGTHS[hla_class]), size=count)
+    return [''.join(rng.choice(AMINO_ACIDS, size=length)) for length in lengths]
+
+
+def model_bytes(model):
+    """Bytes held by a model's weights and buffers, at their stored precision."""
+    return sum(tensor.numel() * tensor.element_size()
+               for _, tensor in state_tensors(model.state_dict(), dequantize=False))
+
+
+def score(model, peptides, hla_class, device):
+    """Return (float32 probabilities, seconds) for peptides scored by model."""
+    engine = BatchingEngine(model, hla_class, device, batch_size=CALIBRATION_BATCH_SIZE)
+    start_time = time.perf_counter()
+    probabilities = engine.predict(peptides)
+    return probabilities, time.perf_counter() - start_time
+
+
+def bf16_supported(device):
+    if device.type == 'cuda':
+        return torch.cuda.is_bf16_supported()
+    checks = ('_is_avx512_bf16_supported', '_is_amx_tile_supported')
+    return any(getattr(torch.cpu, name, lambda: False)() for name in checks)
+
+
+def share_tensors_copy(model):
+    """Copy a model's module tree while sharing its parameters and buffers.
+
+    copy.deepcopy, which quantize_dynamic uses unless quantizing in place,
+    would clone every weight into anonymous memory and lose the
+    memory-mapped, copy-on-write checkpoint pages.
+    """
+    memo = {id(tensor): tensor for tensor in model.parameters()}
+    memo.update((id(tensor), tensor) for tensor in model.buffers())
+    return copy.deepcopy(model, memo)
+
+
+def convert(model, mode, device):
+    """Return a copy of model converted to mode; raises ValueError if unsupported."""
+    if mode == 'int8':
+        if device.type != 'cpu':
+            raise ValueError("int8 dynamic quantization only runs on CPU")
+        with warnings.catch_warnings():
+            # Eager-mode quantization is deprecated in favour of torchao
+            warnings.simplefilter('ignore')
+            # Quantize a tensor-sharing copy in place: only the int8 Linear
+            # weights are new memory, everything else stays on the fp32 pages
+            converted = torch.ao.quantization.quantize_dynamic(
+                share_tensors_copy(model), {nn.Linear}, dtype=torch.qint8, inplace=True)
+    elif mode == 'bf16':
+        if not bf16_supported(device):
+            raise ValueError(f"bfloat16 is not natively supported on this {device.type} device")
+        converted = AutocastModel(model, device.type)
+    else:
+        raise ValueError(f"Unknown precision mode '{mode}'")
+    converted.eval()
+    converted.inference_precision = mode
+    return converted
+
+
+def calibrate(model, converted, hla_class, device, peptides=None):
+    """Compare a converted model with fp32 and report drift, flips, speed and memory."""
+    peptides = peptides or reference_peptides(hla_class)
+    reference, reference_time = score(model, peptides, hla_class, device)
+    candidate, candidate_time = score(converted, peptides, hla_class, device)
+    flips = (reference > EPITOPE_THRESHOLD) != (candidate > EPITOPE_THRESHOLD)
+    return {
+        "peptides": len(peptides),
+        "max_drift": float(np.abs(reference - candidate).max()),
+        "mean_drift": float(np.abs(reference - candidate).mean()),
+        "flip_rate": float(flips.mean()),
+        "fp32_peptides_per_sec": len(peptides) / reference_time,
+        "peptides_per_sec": len(peptides) / candidate_time,
+        "fp32_bytes": model_bytes(model),
+        "bytes": model_bytes(converted),
+    }
+
+
+def apply_precision(model, hla_class, device, mode=None):
+    """Return (model to serve, report) for the requested precision mode.
+
+    The fp32 model is returned unchanged when the mode is fp32, is not
+    supported here, or fails the calibration guardrails.
+    """
+    mode = mode or PRECISION_MODE
+    report = {"requested": mode, "mode": "fp32"}
+    if mode == 'fp32':
+        report["bytes"] = model_bytes(model)
+        return model, report
+    try:
+        converted = convert(model, mode, device)
+    except ValueError as e:
+        print(f"Precision mode {mode} unavailable for class {hla_class}: {str(e)}")
+        report["reason"] = str(e)
+        report["bytes"] = model_bytes(model)
+        return model, report
+
+    report.update(calibrate(model, converted, hla_class, device))
+    failures = []
+    if report["max_drift"] > MAX_PROBABILITY_DRIFT:
+        failures.append(f"max drift {report['max_drift']:.4f} > {MAX_PROBABILITY_DRIFT}")
+    if report["flip_rate"] > MAX_FLIP_RATE:
+        failures.append(f"flip rate {report['flip_rate']:.4f} > {MAX_FLIP_RATE}")
+    print(f"Class {hla_class} {mode}: max drift {report['max_drift']:.4f}, flip rate {report['flip_rate']:.4f}, "
+          f"{report['peptides_per_sec']:.0f} vs {report['fp32_peptides_per_sec']:.0f} fp32 peptides/sec, "
+          f"{report['bytes'] / 1024 ** 2:.0f} vs {report['fp32_bytes'] / 1024 ** 2:.0f} MB")
+    if failures:
+        print(f"Keeping fp32 for class {hla_class}: {', '.join(failures)}")
+        report["reason"] = '; '.join(failures)
+        return model, report
+    report["mode"] = mode
+    return converted, report
+
+
+def main():
+    # Compare each precision against its own fp32 model, without backbone sharing
+    os.environ['TRANSHLA_PRECISION'] = 'fp32'
+    os.environ['TRANSHLA_SHARE_BACKBONE'] = '0'
+    from app import model_loader
+
+    if not model_loader.load_models():
+        print("Models could not be loaded")
+        sys.exit(1)
+    models = {"I": model_loader.transHLA_I_model, "II": model_loader.transHLA_II_model}
+    for hla_class, model in models.items():
+        for mode in PRECISION_MODES[1:]:
+            try:
+                converted = convert(model, mode, model_loader.device)
+            except ValueError as e:
+                print(f"Class {hla_class} {mode}: {str(e)}")
+                continue
+            report = calibrate(model, converted, hla_class, model_loader.device)
+            print(f"Class {hla_class} {mode}: max drift {report['max_drift']:.4f}, "
+                  f"flip rate {report['flip_rate']:.4f}, "
+                  f"{report['peptides_per_sec']:.0f} peptides/sec (fp32 {report['fp32_peptides_per_sec']:.0f}), "
+                  f"{report['bytes'] / 1024 ** 2:.1f} MB (fp32 {report['fp32_bytes'] / 1024 ** 2:.1f} MB)")
+
+
+if __name__ == '__main__':
+    main()
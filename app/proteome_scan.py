@@ -0,0 +1,250 @@
+"""Chunked whole-proteome scanning pipeline.
+
+FASTA records are streamed, windows are generated lazily per protein, and
+proteins are grouped into chunks of roughly CHUNK_WINDOWS windows. Within a
+chunk identical peptides are scored once; across chunks the score cache and
+persistent score store dedupe repeated peptides. Results are appended to
+CSV or written as one Parquet part per chunk, and a checkpoint file records
+progress after every chunk so long runs can resume.
+"""
+import os
+import csv
+import json
+import time
+
+import numpy as np
+
+from .fasta import read_fasta
+from .batching import EPITOPE_THRESHOLD, PEPTIDE_LENGTHS, peptide_lengths
+from .tokenizer import valid_residues, valid_window_starts
+
+# Approximate number of windows scored per chunk
+CHUNK_WINDOWS = int(os.environ.get('TRANSHLA_SCAN_CHUNK_WINDOWS', 200000))
+
+OUTPUT_COLUMNS = ["protein_id", "hla_class", "position", "length", "peptide", "probability", "is_epitope"]
+
+
+def protein_id(header):
+    """First word of a FASTA header."""
+    return header.split()[0] if header else ""
+
+
+def iter_windows(sequence, hla_class, fixed_window_size=None):
+    """Yield (length, 0-indexed starts) for the valid windows of a protein."""
+    valid = valid_residues(sequence)
+    for length in peptide_lengths(hla_class, fixed_window_size):
+        # A fixed window size may only fit one of the classes being scanned
+        if length not in PEPTIDE_LENGTHS[hla_class]:
+            continue
+        starts = valid_window_starts(valid, length)
+        if len(starts):
+            yield length, starts
+
+
+def count_windows(sequence, hla_classes, fixed_window_size=None):
+    """Number of windows a protein contributes across the given classes."""
+    return sum(len(starts)
+               for hla_class in hla_classes
+               for _, starts in iter_windows(sequence, hla_class, fixed_window_size))
+
+
+class CsvSink:
+    """Append scan rows to a CSV file; resumable by truncating to a byte offset."""
+
+    def __init__(self, path, resume_offset=None):
+        self.path = path
+        if resume_offset is not None and os.path.exists(path):
+            with open(path, 'r+b') as handle:
+                handle.truncate(resume_offset)
+            self._handle = open(path, 'a', newline='')
+        else:
+            self._handle = open(path, 'w', newline='')
+            csv.writer(self._handle, lineterminator='\n').writerow(OUTPUT_COLUMNS)
+        self._writer = csv.writer(self._handle, lineterminator='\n')
+
+    def write(self, columns):
+        rows = zip(columns["protein_id"], columns["hla_class"], columns["position"].tolist(),
+                   columns["length"].tolist(), columns["peptide"],
+                   np.round(columns["probability"].astype(np.float64), 6).tolist(), columns["is_epitope"].tolist())
+        self._writer.writerows(rows)
+
+    def flush(self):
+        self._handle.flush()
+        os.fsync(self._handle.fileno())
+        return {"offset": self._handle.tell()}
+
+    def close(self):
+        self._handle.close()
+
+
+class ParquetSink:
+    """Write each chunk as a numbered Parquet part inside an output directory."""
+
+    def __init__(self, path, resume_parts=None):
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise RuntimeError("Parquet output requires pyarrow (pip install pyarrow)")
+        self._pa = pyarrow
+        self._pq = pyarrow.parquet
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        self.parts = resume_parts or 0
+        # Drop parts written after the last checkpoint
+        for name in os.listdir(path):
+            if name.startswith('part-') and int(name[5:10]) >= self.parts:
+                os.remove(os.path.join(path, name))
+
+    def write(self, columns):
+        table = self._pa.table({
+            "protein_id": columns["protein_id"],
+            "hla_class": columns["hla_class"],
+            "position": columns["position"].astype(np.int32),
+            "length": columns["length"].astype(np.uint8),
+            "peptide": columns["peptide"],
+            "probability": columns["probability"].astype(np.float32),
+            "is_epitope": columns["is_epitope"],
+        })
+        self._pq.write_table(table, os.path.join(self.path, f"part-{self.parts:05d}.parquet"))
+        self.parts += 1
+
+    def flush(self):
+        return {"parts": self.parts}
+
+    def close(self):
+        pass
+
+
+class ProteomeScanner:
+    """Scan every protein of a FASTA file and stream results to disk.
+
+    score_fn(peptides, hla_class) must return a float32 probability array.
+    progress_fn, if given, is called with a stats dict after every chunk and
+    may return True to stop the scan early.
+    """
+
+    def __init__(self, score_fn, hla_classes=("I", "II"), fixed_window_size=None,
+                 chunk_windows=None, epitopes_only=False, threshold=EPITOPE_THRESHOLD,
+                 progress_fn=None):
+        self.score_fn = score_fn
+        self.hla_classes = list(hla_classes)
+        self.fixed_window_size = fixed_window_size
+        self.chunk_windows = chunk_windows or CHUNK_WINDOWS
+        self.epitopes_only = epitopes_only
+        self.threshold = threshold
+        self.progress_fn = progress_fn
+        self.stats = {
+            "proteins_done": 0,
+            "windows_done": 0,
+            "unique_peptides_scored": 0,
+            "rows_written": 0,
+            "elapsed": 0.0,
+        }
+
+    def _score_chunk(self, proteins, hla_class):
+        """Score one class over a chunk of proteins; return output columns."""
+        ids, positions, lengths, peptides = [], [], [], []
+        for header, sequence in proteins:
+            pid = protein_id(header)
+            for length, starts in iter_windows(sequence, hla_class, self.fixed_window_size):
+                ids.extend([pid] * len(starts))
+                positions.append(starts + 1)
+                lengths.append(np.full(len(starts), length, dtype=np.int64))
+                peptides.extend(sequence[start:start + length] for start in starts.tolist())
+        if not peptides:
+            return None
+
+        # Score each distinct peptide once
+        unique = list(dict.fromkeys(peptides))
+        unique_scores = self.score_fn(unique, hla_class)
+        score_of = dict(zip(unique, unique_scores.tolist()))
+        probabilities = np.fromiter((score_of[p] for p in peptides), dtype=np.float32, count=len(peptides))
+        self.stats["unique_peptides_scored"] += len(unique)
+        self.stats["windows_done"] += len(peptides)
+
+        columns = {
+            "protein_id": ids,
+            "hla_class": [hla_class] * len(peptides),
+            "position": np.concatenate(positions),
+            "length": np.concatenate(lengths),
+            "peptide": peptides,
+            "probability": probabilities,
+            "is_epitope": probabilities > self.threshold,
+        }
+        if self.epitopes_only:
+            keep = np.flatnonzero(columns["is_epitope"])
+            columns = {
+                key: value[keep] if isinstance(value, np.ndarray) else [value[i] for i in keep.tolist()]
+                for key, value in columns.items()
+            }
+        return columns
+
+    def iter_chunks(self, records, skip=0):
+        """Group FASTA records into chunks of about chunk_windows windows."""
+        chunk, windows = [], 0
+        for index, (header, sequence) in enumerate(records):
+            if index < skip:
+                continue
+            chunk.append((header, sequence))
+            windows += count_windows(sequence, self.hla_classes, self.fixed_window_size)
+            if windows >= self.chunk_windows:
+                yield chunk
+                chunk, windows = [], 0
+        if chunk:
+            yield chunk
+
+    def run(self, fasta_path, output_path=None, output_format=None, resume=False, sink=None):
+        """Scan fasta_path into output_path (or a given sink); returns the final stats.
+
+        A sink needs write(columns), flush() and close(). Checkpoints are only
+        kept when writing to output_path.
+        """
+        checkpoint_path = None
+        checkpoint = None
+        if sink is None:
+            output_format = output_format or ('parquet' if output_path.endswith('.parquet') else 'csv')
+            checkpoint_path = output_path.rstrip('/') + '.checkpoint.json'
+            if resume and os.path.exists(checkpoint_path):
+                with open(checkpoint_path) as handle:
+                    checkpoint = json.load(handle)
+                self.stats.update(checkpoint["stats"])
+                print(f"Resuming scan after {checkpoint['proteins_done']} proteins")
+            if output_format == 'parquet':
+                sink = ParquetSink(output_path, checkpoint["sink"]["parts"] if checkpoint else None)
+            else:
+                sink = CsvSink(output_path, checkpoint["sink"]["offset"] if checkpoint else None)
+
+        start_time = time.time() - self.stats["elapsed"]
+        skip = checkpoint["proteins_done"] if checkpoint else 0
+        try:
+            for chunk in self.iter_chunks(read_fasta(fasta_path), skip=skip):
+                for hla_class in self.hla_classes:
+                    columns = self._score_chunk(chunk, hla_class)
+                    if columns is not None and len(columns["peptide"]):
+                        sink.write(columns)
+                        self.stats["rows_written"] += len(columns["peptide"])
+                self.stats["proteins_done"] += len(chunk)
+                self.stats["elapsed"] = time.time() - start_time
+                sink_state = sink.flush()
+                if checkpoint_path is not None:
+                    self._write_checkpoint(checkpoint_path, sink_state)
+                if self.progress_fn is not None and self.progress_fn(dict(self.stats)):
+                    print("Scan stopped before completion")
+                    return dict(self.stats, completed=False)
+        finally:
+            sink.close()
+
+        if checkpoint_path is not None and os.path.exists(checkpoint_path):
+            os.remove(checkpoint_path)
+        return dict(self.stats, completed=True)
+
+    def _write_checkpoint(self, path, sink_state):
+        temp_path = path + '.tmp'
+        with open(temp_path, 'w') as handle:
+            json.dump({
+                "proteins_done": self.stats["proteins_done"],
+                "sink": sink_state,
+                "stats": self.stats,
+            }, handle)
+        os.replace(temp_path, path)
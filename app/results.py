@@ -0,0 +1,120 @@
+"""Columnar container for sliding-window results.
+
+A scan of a long protein produces hundreds of thousands of windows. Instead
+of one dict per window, WindowResults keeps one NumPy array per field
+(start, length, class, probability, epitope mask) next to the scanned
+sequence; peptides are sliced from the sequence only when asked for.
+
+Responses use the columnar layout by default:
+
+    {"layout": "columns", "classes": ["I"], "position": [...], "length": [...],
+     "class": [...], "probability": [...], "is_epitope": [...]}
+
+where "class" holds indices into "classes" and a window's peptide is
+original_sequence[position - 1:position - 1 + length]. The row layout (one
+object per window) is kept for older clients.
+"""
+import numpy as np
+
+from .batching import EPITOPE_THRESHOLD
+
+RESULT_LAYOUTS = ("columns", "rows")
+
+# Decimal places kept for probabilities in columnar JSON
+PROBABILITY_DECIMALS = 6
+
+
+class WindowResults:
+    """Scored windows of one sequence, stored as parallel arrays."""
+
+    def __init__(self, sequence, classes, start, length, class_index, probability, threshold=EPITOPE_THRESHOLD):
+        self.sequence = sequence
+        self.classes = tuple(classes)
+        self.start = np.asarray(start, dtype=np.int32)
+        self.length = np.asarray(length, dtype=np.uint8)
+        self.class_index = np.asarray(class_index, dtype=np.uint8)
+        self.probability = np.asarray(probability, dtype=np.float32)
+        self.threshold = threshold
+        self.is_epitope = self.probability > threshold
+
+    @classmethod
+    def for_windows(cls, sequence, classes, hla_class, starts, length, probability):
+        """Results for windows of one length scored by one class."""
+        return cls(sequence, classes, starts, np.full(len(starts), length),
+                   np.full(len(starts), classes.index(hla_class)), probability)
+
+    @classmethod
+    def concat(cls, sequence, classes, parts):
+        parts = list(parts)
+        if not parts:
+            return cls(sequence, classes, [], [], [], [])
+        return cls(sequence, classes,
+                   np.concatenate([p.start for p in parts]),
+                   np.concatenate([p.length for p in parts]),
+                   np.concatenate([p.class_index for p in parts]),
+                   np.concatenate([p.probability for p in parts]))
+
+    def take(self, indices):
+        """Results for the windows at indices, in that order."""
+        return WindowResults(self.sequence, self.classes, self.start[indices], self.length[indices],
+                             self.class_index[indices], self.probability[indices], self.threshold)
+
+    def with_threshold(self, threshold):
+        """The same windows, with is_epitope recomputed for another threshold."""
+        return WindowResults(self.sequence, self.classes, self.start, self.length,
+                             self.class_index, self.probability, threshold)
+
+    def __len__(self):
+        return len(self.start)
+
+    @property
+    def epitope_count(self):
+        return int(self.is_epitope.sum())
+
+    def peptide(self, i):
+        start = int(self.start[i])
+        return self.sequence[start:start + int(self.length[i])]
+
+    def peptides(self):
+        """All peptides, sliced from the sequence."""
+        return [self.sequence[start:start + length]
+                for start, length in zip(self.start.tolist(), self.length.tolist())]
+
+    def nbytes(self):
+        return sum(a.nbytes for a in (self.start, self.length, self.class_index, self.probability, self.is_epitope))
+
+    def to_columns(self, include_peptides=False):
+        """Columnar dict of arrays, encoded without Python lists by wire; positions are 1-indexed."""
+        columns = {
+            "layout": "columns",
+            "classes": list(self.classes),
+            "position": self.start.astype(np.int64) + 1,
+            "length": self.length,
+            "class": self.class_index,
+            "probability": np.round(self.probability.astype(np.float64), PROBABILITY_DECIMALS),
+            "is_epitope": self.is_epitope,
+        }
+        if include_peptides:
+            columns["peptide"] = self.peptides()
+        return columns
+
+    def to_rows(self):
+        """One dict per window, in the original response format."""
+        classes = self.classes
+        return [
+            {
+                "peptide": self.sequence[start:start + length],
+                "position": start + 1,  # 1-indexed position
+                "length": length,
+                "class": classes[class_index],
+                "probability": probability,
+                "is_epitope": is_epitope
+            }
+            for start, length, class_index, probability, is_epitope in zip(
+                self.start.tolist(), self.length.tolist(), self.class_index.tolist(),
+                self.probability.tolist(), self.is_epitope.tolist())
+        ]
+
+    def serialize(self, layout):
+        """Results in the given layout: a columns dict or a list of rows."""
+        return self.to_rows() if layout == 'rows' else self.to_columns()
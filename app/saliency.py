@@ -0,0 +1,120 @@
+"""Per-residue saliency from the backbone outputs of the scoring forward pass.
+
+With saliency on, every batch of windows is run through the eager model
+with a forward hook on its ESM backbone. The hook reduces the backbone's
+outputs on the device to one importance score per residue of each window:
+
+    attentions  attention each residue receives in the last layer, averaged
+                over heads and summed over the window's residues
+    contacts    summed contact probabilities of each residue (used when the
+                backbone returns no attention maps)
+
+Importances of a window sum to 1. A SaliencyProfile spreads each window's
+epitope probability over its residues in proportion to importance (scaled
+by the window length, so uniform importance gives every residue the
+window's probability) and averages over the windows covering a position.
+Only the reduced (windows, residues) array leaves the device, and no extra
+forward pass is run.
+"""
+import threading
+
+import numpy as np
+import torch
+
+from .compiled import CompiledModel
+from .shared_backbone import find_backbone
+from .tokenizer import CLS_TOKEN_ID, EOS_TOKEN_ID, PAD_TOKEN_ID
+
+# Decimal places kept in the per-position profile
+SALIENCY_DECIMALS = 4
+
+
+def residue_importance(tokens, outputs):
+    """Reduce backbone outputs to a (windows, width - 2) importance tensor.
+
+    Columns follow the token positions between CLS and the last token;
+    special and padding positions score 0 and each row sums to 1.
+    """
+    residues = ~(tokens.eq(CLS_TOKEN_ID) | tokens.eq(EOS_TOKEN_ID) | tokens.eq(PAD_TOKEN_ID))
+    attentions = outputs.get('attentions') if isinstance(outputs, dict) else getattr(outputs, 'attentions', None)
+    contacts = outputs.get('contacts') if isinstance(outputs, dict) else None
+    if torch.is_tensor(attentions) and attentions.dim() == 5:
+        # (windows, layers, heads, queries, keys) -> attention received per key
+        last_layer = attentions[:, -1].float().mean(1)
+        received = (last_layer * residues.unsqueeze(-1)).sum(1)
+        importance = received[:, 1:-1]
+    elif torch.is_tensor(contacts):
+        importance = contacts.float().sum(-1)
+    else:
+        raise RuntimeError("The model's backbone returns neither attention maps nor contacts")
+    importance = importance * residues[:, 1:-1]
+    return importance / importance.sum(-1, keepdim=True).clamp_min(1e-12)
+
+
+class SaliencyRecorder:
+    """Run batches through a model's eager form, keeping per-residue importance.
+
+    Pass one to BatchingEngine.predict_windows; importance(length) then
+    returns the rows of every batch run, in order.
+    """
+
+    def __init__(self, model):
+        # Compiled graphs do not run module hooks, so use the eager model
+        self.model = model.model if isinstance(model, CompiledModel) else model
+        _, self.backbone = find_backbone(self.model)
+        if self.backbone is None:
+            raise RuntimeError("Saliency needs a model with an ESM backbone")
+        self._rows = []
+        self._thread = None
+
+    def _hook(self, module, args, outputs):
+        # The backbone may be shared with another model used by other threads
+        if threading.get_ident() == self._thread:
+            self._rows.append(residue_importance(args[0], outputs).cpu().numpy())
+
+    def run(self, input_tensor):
+        """Run one batch and record its importance; returns the model outputs."""
+        self._thread = threading.get_ident()
+        handle = self.backbone.register_forward_hook(self._hook)
+        try:
+            return self.model(input_tensor)
+        finally:
+            handle.remove()
+
+    def importance(self, length):
+        """(windows, length) float32 importance of every window run so far."""
+        if not self._rows:
+            return np.empty((0, length), dtype=np.float32)
+        return np.concatenate(self._rows)[:, :length].astype(np.float32, copy=False)
+
+
+class SaliencyProfile:
+    """Per-position saliency of a protein, aggregated over overlapping windows per class."""
+
+    def __init__(self, sequence, classes):
+        self.sequence = sequence
+        self.classes = tuple(classes)
+        self._sums = {hla_class: np.zeros(len(sequence)) for hla_class in self.classes}
+        self._counts = {hla_class: np.zeros(len(sequence)) for hla_class in self.classes}
+
+    def add(self, hla_class, starts, length, probabilities, importance):
+        """Add windows of one length starting at 0-indexed starts."""
+        positions = (np.asarray(starts, dtype=np.int64)[:, None] + np.arange(length)).ravel()
+        weights = (importance * (np.asarray(probabilities, dtype=np.float32)[:, None] * length)).ravel()
+        self._sums[hla_class] += np.bincount(positions, weights, minlength=len(self.sequence))
+        self._counts[hla_class] += np.bincount(positions, minlength=len(self.sequence))
+
+    def profile(self, hla_class):
+        counts = self._counts[hla_class]
+        return np.divide(self._sums[hla_class], counts, out=np.zeros_like(counts), where=counts > 0)
+
+    def to_dict(self):
+        """One value per residue for each class, and their maximum as 'combined'."""
+        profiles = {hla_class: self.profile(hla_class) for hla_class in self.classes}
+        combined = np.maximum.reduce(list(profiles.values()))
+        return {
+            "classes": list(self.classes),
+            "profile": {hla_class: np.round(values, SALIENCY_DECIMALS).tolist()
+                        for hla_class, values in profiles.items()},
+            "combined": np.round(combined, SALIENCY_DECIMALS).tolist(),
+        }
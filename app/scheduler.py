@@ -0,0 +1,123 @@
+import os
+import time
+import queue
+import threading
+import traceback
+from concurrent.futures import Future
+
+from .metrics import QUEUE_WAIT_SECONDS
+
+# Limits for coalescing concurrent single-peptide requests into one batch
+MICROBATCH_MAX_SIZE = int(os.environ.get('TRANSHLA_MICROBATCH_MAX_SIZE', 64))
+MICROBATCH_MAX_WAIT_MS = float(os.environ.get('TRANSHLA_MICROBATCH_MAX_WAIT_MS', 5))
+
+
+class _PendingPeptide:
+    __slots__ = ('peptide', 'future', 'enqueued_at')
+
+    def __init__(self, peptide):
+        self.peptide = peptide
+        self.future = Future()
+        self.enqueued_at = time.monotonic()
+
+
+class MicroBatcher:
+    """Coalesce peptides from concurrent requests into shared forward passes.
+
+    A background worker takes the oldest pending peptide, keeps collecting
+    until max_batch_size peptides are waiting or max_wait_ms has passed since
+    that peptide arrived, then scores the batch with predict_fn and resolves
+    each caller's future with its own probability.
+    """
+
+    def __init__(self, name, predict_fn, max_batch_size=None, max_wait_ms=None):
+        self.name = name
+        self.predict_fn = predict_fn
+        self.max_batch_size = max_batch_size or MICROBATCH_MAX_SIZE
+        self.max_wait = (max_wait_ms if max_wait_ms is not None else MICROBATCH_MAX_WAIT_MS) / 1000.0
+        self._queue = queue.Queue()
+        self._worker = None
+        self._start_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._batches = 0
+        self._peptides = 0
+        self._total_wait = 0.0
+        self._max_wait_seen = 0.0
+
+    def submit(self, peptide):
+        """Queue a peptide and return a Future resolving to its probability."""
+        self._ensure_worker()
+        pending = _PendingPeptide(peptide)
+        self._queue.put(pending)
+        return pending.future
+
+    def predict(self, peptide, timeout=None):
+        """Score one peptide through the shared batch queue."""
+        return self.submit(peptide).result(timeout=timeout)
+
+    def _ensure_worker(self):
+        # Started lazily so pre-forking servers do not inherit a dead thread
+        if self._worker is not None and self._worker.is_alive():
+            return
+        with self._start_lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(
+                    target=self._run, name=f"microbatch-{self.name}", daemon=True
+                )
+                self._worker.start()
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        deadline = batch[0].enqueued_at + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining > 0:
+                    batch.append(self._queue.get(timeout=remaining))
+                else:
+                    batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            started_at = time.monotonic()
+            self._record(batch, started_at)
+            try:
+                probabilities = self.predict_fn([p.peptide for p in batch])
+            except Exception as e:
+                print(f"Error in micro-batch for {self.name}: {str(e)}")
+                traceback.print_exc()
+                for pending in batch:
+                    pending.future.set_exception(e)
+                continue
+            for pending, probability in zip(batch, probabilities.tolist()):
+                pending.future.set_result(probability)
+
+    def _record(self, batch, started_at):
+        waits = [started_at - p.enqueued_at for p in batch]
+        for wait in waits:
+            QUEUE_WAIT_SECONDS.observe(wait, queue=self.name)
+        with self._stats_lock:
+            self._batches += 1
+            self._peptides += len(batch)
+            self._total_wait += sum(waits)
+            self._max_wait_seen = max(self._max_wait_seen, max(waits))
+
+    def stats(self):
+        """Return queue depth, batch fill ratio and wait time statistics."""
+        with self._stats_lock:
+            batches, peptides = self._batches, self._peptides
+            return {
+                "queue_depth": self._queue.qsize(),
+                "max_batch_size": self.max_batch_size,
+                "max_wait_ms": self.max_wait * 1000,
+                "batches": batches,
+                "peptides": peptides,
+                "mean_batch_size": peptides / batches if batches else 0,
+                "mean_fill_ratio": peptides / (batches * self.max_batch_size) if batches else 0,
+                "mean_wait_ms": self._total_wait / peptides * 1000 if peptides else 0,
+                "max_wait_seen_ms": self._max_wait_seen * 1000,
+            }
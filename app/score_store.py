@@ -0,0 +1,171 @@
+"""Persistent peptide score store shared by all workers.
+
+Scores live in a SQLite database in WAL mode, so any number of worker
+processes can read concurrently while one writes. Every row is tagged with
+the checkpoint version of the model that produced it, and lookups always
+filter on the current version, so scores from an old checkpoint are never
+served.
+
+Prefill from a FASTA file with:
+
+    python -m app.score_store proteome.fasta --hla-class I II
+"""
+import os
+import sys
+import time
+import sqlite3
+import argparse
+import threading
+import traceback
+
+# Maximum number of host parameters per query (SQLite default limit is 999)
+QUERY_CHUNK_SIZE = 900
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS scores (
+    peptide TEXT NOT NULL,
+    hla_class TEXT NOT NULL,
+    checkpoint TEXT NOT NULL,
+    probability REAL NOT NULL,
+    PRIMARY KEY (checkpoint, hla_class, peptide)
+) WITHOUT ROWID
+"""
+
+
+class ScoreStore:
+    """SQLite-backed (peptide, HLA class, checkpoint) -> probability store."""
+
+    def __init__(self, path, timeout=30.0):
+        self.path = path
+        self.timeout = timeout
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        connection = self._connection()
+        connection.execute(SCHEMA)
+        connection.commit()
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+
+    def _connection(self):
+        # SQLite connections cannot be shared between threads or forked
+        # processes, so each thread of each process opens its own.
+        connection = getattr(self._local, 'connection', None)
+        if connection is None or self._local.pid != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=self.timeout)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
+
+    def get_many(self, peptides, hla_class, checkpoint):
+        """Return a dict of peptide -> probability for the stored peptides."""
+        found = {}
+        unique = list(dict.fromkeys(peptides))
+        connection = self._connection()
+        for start in range(0, len(unique), QUERY_CHUNK_SIZE):
+            chunk = unique[start:start + QUERY_CHUNK_SIZE]
+            placeholders = ','.join('?' * len(chunk))
+            rows = connection.execute(
+                f"SELECT peptide, probability FROM scores "
+                f"WHERE checkpoint = ? AND hla_class = ? AND peptide IN ({placeholders})",
+                [checkpoint, hla_class] + chunk
+            )
+            found.update(rows)
+        self.hits += len(found)
+        self.misses += len(unique) - len(found)
+        return found
+
+    def put_many(self, peptides, probabilities, hla_class, checkpoint):
+        """Store probabilities for peptides scored by the given checkpoint."""
+        connection = self._connection()
+        with connection:
+            connection.executemany(
+                "INSERT OR REPLACE INTO scores (peptide, hla_class, checkpoint, probability) "
+                "VALUES (?, ?, ?, ?)",
+                ((peptide, hla_class, checkpoint, float(probability))
+                 for peptide, probability in zip(peptides, probabilities))
+            )
+        self.writes += len(peptides)
+
+    def count(self, checkpoint=None):
+        """Number of stored scores, optionally for one checkpoint."""
+        connection = self._connection()
+        if checkpoint is None:
+            return connection.execute("SELECT COUNT(*) FROM scores").fetchone()[0]
+        return connection.execute(
+            "SELECT COUNT(*) FROM scores WHERE checkpoint = ?", (checkpoint,)
+        ).fetchone()[0]
+
+    def purge_stale(self, current_checkpoints):
+        """Delete scores from checkpoints other than the current ones."""
+        connection = self._connection()
+        placeholders = ','.join('?' * len(current_checkpoints))
+        with connection:
+            cursor = connection.execute(
+                f"DELETE FROM scores WHERE checkpoint NOT IN ({placeholders})",
+                list(current_checkpoints)
+            )
+        return cursor.rowcount
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "path": self.path,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0,
+            "writes": self.writes,
+        }
+
+
+def open_score_store(path):
+    """Open the score store, or return None if it cannot be used."""
+    if os.environ.get('TRANSHLA_DISABLE_SCORE_STORE', '0') == '1':
+        return None
+    try:
+        store = ScoreStore(path)
+        print(f"Score store opened at {path}")
+        return store
+    except (sqlite3.Error, OSError) as e:
+        print(f"Warning: could not open score store at {path}: {e}")
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Prefill the TransHLA score store from a FASTA file')
+    parser.add_argument('fasta', help='FASTA file (optionally .gz) of proteins to scan')
+    parser.add_argument('--hla-class', nargs='+', choices=['I', 'II'], default=['I', 'II'],
+                        help='HLA classes to score (default: both)')
+    args = parser.parse_args()
+
+    from app import app as server
+    from app.fasta import read_fasta
+
+    if not server.load_models():
+        print("Models could not be loaded")
+        sys.exit(1)
+    if server.score_store is None:
+        print("Score store is disabled or unavailable")
+        sys.exit(1)
+
+    start_time = time.time()
+    proteins = 0
+    windows = 0
+    for header, sequence in read_fasta(args.fasta):
+        for hla_class in args.hla_class:
+            try:
+                windows += len(server.run_sliding_prediction(sequence, hla_class))
+            except Exception as e:
+                print(f"Error scoring {header}: {str(e)}")
+                traceback.print_exc()
+        proteins += 1
+        if proteins % 100 == 0:
+            print(f"{proteins} proteins, {windows} windows scored")
+    print(f"Prefilled {windows} windows from {proteins} proteins in "
+          f"{time.time() - start_time:.2f} seconds ({server.score_store.count()} stored scores)")
+
+
+if __name__ == '__main__':
+    main()
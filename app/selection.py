@@ -0,0 +1,178 @@
+"""Server-side selection of the windows a client asked for.
+
+Selections run over the probability array of a WindowResults:
+
+    epitopes_only  keep windows above the threshold
+    top_k          the k best windows overall, or per length with per_length
+    min_distance   greedy non-overlapping selection: a window is kept only if
+                   it lies at least min_distance residues from every window
+                   already kept (0 forbids overlap only)
+    hotspots       overlapping windows above the threshold merged into regions
+
+The best windows are found with argpartition, so only the candidates that
+can be selected are sorted.
+"""
+import numpy as np
+
+
+def descending(probability, candidates, limit=None):
+    """Yield candidate indices by decreasing probability.
+
+    With a limit, only the best 4 * limit candidates are sorted up front;
+    the rest are sorted only if the caller keeps asking for more.
+    """
+    scores = probability[candidates]
+    if limit is not None and 4 * limit < len(candidates):
+        head = np.argpartition(-scores, 4 * limit)[:4 * limit]
+        head = head[np.argsort(-scores[head], kind='stable')]
+        yield from candidates[head].tolist()
+        rest = np.ones(len(candidates), dtype=bool)
+        rest[head] = False
+        candidates, scores = candidates[rest], scores[rest]
+    yield from candidates[np.argsort(-scores, kind='stable')].tolist()
+
+
+def top_k(probability, candidates, k):
+    """The k best candidates, best first."""
+    if k >= len(candidates):
+        return candidates[np.argsort(-probability[candidates], kind='stable')]
+    best = candidates[np.argpartition(-probability[candidates], k - 1)[:k]]
+    return best[np.argsort(-probability[best], kind='stable')]
+
+
+def spaced(results, candidates, k=None, min_distance=0):
+    """Greedily pick the best candidates at least min_distance residues apart."""
+    occupied = np.zeros(len(results.sequence) + 2 * min_distance + 1, dtype=bool)
+    chosen = []
+    for i in descending(results.probability, candidates, k):
+        # Residues of the window, widened by min_distance on each side
+        begin = int(results.start[i])
+        end = begin + int(results.length[i]) + 2 * min_distance
+        if occupied[begin:end].any():
+            continue
+        occupied[begin + min_distance:end - min_distance] = True
+        chosen.append(i)
+        if k is not None and len(chosen) == k:
+            break
+    return np.array(chosen, dtype=np.int64)
+
+
+def select_windows(results, top=None, per_length=False, min_distance=None, epitopes_only=False):
+    """Indices of the selected windows; best first when ranked, else in scan order."""
+    candidates = np.flatnonzero(results.is_epitope) if epitopes_only else np.arange(len(results))
+    if top is None and min_distance is None:
+        return candidates
+    if not per_length:
+        groups = [candidates]
+    else:
+        lengths = results.length[candidates]
+        groups = [candidates[lengths == length] for length in np.unique(lengths).tolist()]
+    selected = []
+    for group in groups:
+        if min_distance is not None:
+            selected.append(spaced(results, group, top, min_distance))
+        else:
+            selected.append(top_k(results.probability, group, top))
+    return np.concatenate(selected) if selected else np.empty(0, dtype=np.int64)
+
+
+def hotspots(results):
+    """Merge overlapping windows above the threshold into regions, per class.
+
+    Returns a list of regions with 1-indexed inclusive start and end.
+    """
+    regions = []
+    for class_index, hla_class in enumerate(results.classes):
+        windows = np.flatnonzero(results.is_epitope & (results.class_index == class_index))
+        if not len(windows):
+            continue
+        windows = windows[np.argsort(results.start[windows], kind='stable')]
+        starts = results.start[windows].astype(np.int64)
+        ends = starts + results.length[windows]
+        reach = np.maximum.accumulate(ends)
+        # A region ends where the next window starts past everything before it
+        breaks = np.flatnonzero(starts[1:] >= reach[:-1]) + 1
+        firsts = np.concatenate(([0], breaks))
+        lasts = np.concatenate((breaks, [len(windows)])) - 1
+        probability = results.probability[windows]
+        best = np.maximum.reduceat(probability, firsts)
+        total = np.add.reduceat(probability.astype(np.float64), firsts)
+        for first, last, max_probability, probability_sum in zip(
+                firsts.tolist(), lasts.tolist(), best.tolist(), total.tolist()):
+            begin, end = starts[first], reach[last]
+            regions.append({
+                "class": hla_class,
+                "start": int(begin) + 1,
+                "end": int(end),
+                "sequence": results.sequence[begin:end],
+                "windows": last - first + 1,
+                "max_probability": max_probability,
+                "mean_probability": probability_sum / (last - first + 1)
+            })
+    regions.sort(key=lambda region: (region["start"], region["class"]))
+    return regions
+
+
+TRUE_VALUES = ('true', '1', 'yes', 'on')
+FALSE_VALUES = ('false', '0', 'no', 'off', '')
+
+
+def parse_flag(params, name):
+    """Read a boolean option sent as JSON or form text; raises ValueError when invalid."""
+    value = params.get(name, False)
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, int) and value in (0, 1):
+        return bool(value)
+    if isinstance(value, str) and value.strip().lower() in TRUE_VALUES + FALSE_VALUES:
+        return value.strip().lower() in TRUE_VALUES
+    raise ValueError(f"{name} must be true or false")
+
+
+def parse_integer(params, name, minimum, message):
+    """Read an optional integer option of at least minimum; raises ValueError(message) otherwise."""
+    value = params.get(name)
+    if value is None or value == '':
+        return None
+    if isinstance(value, bool):
+        raise ValueError(message)
+    if isinstance(value, float):
+        if not value.is_integer():
+            raise ValueError(message)
+        value = int(value)
+    elif isinstance(value, str):
+        try:
+            value = int(value.strip())
+        except ValueError:
+            raise ValueError(message)
+    elif not isinstance(value, int):
+        raise ValueError(message)
+    if value < minimum:
+        raise ValueError(message)
+    return value
+
+
+def parse_selection(params, default_threshold):
+    """Read selection options from request parameters; raises ValueError when invalid."""
+    threshold = params.get('threshold', default_threshold)
+    try:
+        if isinstance(threshold, bool):
+            raise ValueError
+        threshold = float(threshold)
+    except (TypeError, ValueError):
+        raise ValueError("threshold must be a number between 0 and 1")
+    if not 0 <= threshold <= 1:
+        raise ValueError("threshold must be between 0 and 1")
+    return {
+        "threshold": threshold,
+        "top": parse_integer(params, 'top_k', 1, "top_k must be a positive integer"),
+        "per_length": parse_flag(params, 'top_k_per_length'),
+        "min_distance": parse_integer(params, 'min_distance', 0, "min_distance must be a non-negative integer"),
+        "epitopes_only": parse_flag(params, 'epitopes_only'),
+        "hotspots": parse_flag(params, 'hotspots'),
+    }
+
+
+def is_ranked(selection):
+    """True when the selection needs every window before it can pick any."""
+    return selection["top"] is not None or selection["min_distance"] is not None or selection["hotspots"]
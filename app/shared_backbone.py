@@ -0,0 +1,224 @@
+"""Share one ESM backbone between the class I and class II models.
+
+Both TransHLA checkpoints embed peptides with an ESM2 backbone. When the two
+backbones hold identical weights, share_backbones points both models at a
+single copy, so the backbone is resident once instead of twice.
+
+The shared backbone can also reuse embeddings between the two heads. Inside
+capture(), the outputs of each backbone call are kept; inside replay(), a
+call whose token rows match a captured call (ignoring trailing padding) gets
+the captured outputs cropped to its own width instead of running the
+backbone again. ESM2 masks padding in attention and zeroes padded rows of
+the attention maps before the contact head, so representations, attentions
+and contacts of the real positions do not depend on how much padding
+follows them. Class II inputs are the wider ones, so they are captured and
+class I replays them.
+"""
+import os
+import threading
+from contextlib import contextmanager
+
+import numpy as np
+import torch
+
+from .cache import state_tensors
+from .precision import model_bytes
+from .tokenizer import NativeTokenizer, PAD_TOKEN_ID
+
+# Set to 0 to keep separate backbones even when their weights match
+SHARE_BACKBONE = os.environ.get('TRANSHLA_SHARE_BACKBONE', '1') == '1'
+
+# Largest probability difference accepted between reused and fresh embeddings
+REUSE_TOLERANCE = 1e-4
+
+# Class names of the ESM backbones used by the TransHLA checkpoints
+BACKBONE_CLASS_NAMES = ('ESM2', 'EsmModel')
+
+# Peptides used to check that reused embeddings give the same scores
+PROBE_PEPTIDES = ["SIINFEKLAAGLT", "GILGFVFTLTVPSE", "KLVALGINAVAYYR", "NLVPMVATVQGQN"]
+
+
+def find_backbone(model):
+    """Return (dotted name, module) of the ESM backbone inside a model, or (None, None)."""
+    for name, module in model.named_modules():
+        if name and type(module).__name__.endswith(BACKBONE_CLASS_NAMES):
+            return name, module
+    return None, None
+
+
+def same_weights(first, second):
+    """True when two modules hold parameters and buffers with identical values."""
+    first_state = list(state_tensors(first.state_dict()))
+    second_state = list(state_tensors(second.state_dict()))
+    if [name for name, _ in first_state] != [name for name, _ in second_state]:
+        return False
+    for (_, tensor), (_, other) in zip(first_state, second_state):
+        if tensor.shape != other.shape or tensor.dtype != other.dtype:
+            return False
+        if not torch.equal(tensor, other.to(tensor.device)):
+            return False
+    return True
+
+
+def _install(model, name, module):
+    parent_name, _, attribute = name.rpartition('.')
+    parent = model.get_submodule(parent_name) if parent_name else model
+    setattr(parent, attribute, module)
+
+
+def _encode(peptides, max_length):
+    """Tokenize peptides of mixed lengths into a padded (n, max_length) tensor."""
+    tokenizer = NativeTokenizer()
+    groups = {}
+    for peptide in peptides:
+        groups.setdefault(len(peptide), []).append(peptide)
+    return torch.from_numpy(np.concatenate([tokenizer.encode_batch(group, max_length)
+                                            for group in groups.values()]))
+
+
+def _crop(outputs, width):
+    """Crop ESM outputs computed on wider inputs to a token width of width."""
+    cropped = {}
+    for key, value in outputs.items():
+        if key == 'representations':
+            cropped[key] = {layer: hidden[:, :width] for layer, hidden in value.items()}
+        elif key == 'logits':
+            cropped[key] = value[:, :width]
+        elif key == 'attentions':
+            cropped[key] = value[..., :width, :width]
+        elif key == 'contacts':
+            # Contacts exclude the CLS and final token positions
+            cropped[key] = value[..., :width - 2, :width - 2]
+        else:
+            return None
+    return cropped
+
+
+class SharedBackbone:
+    """One backbone module used by both models, with optional embedding reuse."""
+
+    def __init__(self, module):
+        self.module = module
+        self.reuse_enabled = True
+        self.computed = 0
+        self.reused = 0
+        self._forward = module.forward
+        self._local = threading.local()
+        # Route calls from both models through the capture/replay logic
+        module.forward = self._shared_forward
+
+    def _shared_forward(self, tokens, *args, **kwargs):
+        mode = getattr(self._local, 'mode', None)
+        if mode == 'replay':
+            outputs = self._replay(tokens, args, kwargs)
+            if outputs is not None:
+                self.reused += tokens.shape[0]
+                return outputs
+        outputs = self._forward(tokens, *args, **kwargs)
+        self.computed += tokens.shape[0]
+        if mode == 'capture' and isinstance(outputs, dict):
+            # The engines reuse their input buffers, so keep a copy of the tokens
+            self._local.captured.append((tokens.clone(), args, kwargs, outputs))
+        return outputs
+
+    def _replay(self, tokens, args, kwargs):
+        width = tokens.shape[1]
+        for index, (captured, captured_args, captured_kwargs, outputs) in enumerate(self._local.captured):
+            if (captured.shape[0] != tokens.shape[0] or captured.shape[1] < width
+                    or captured_args != args or captured_kwargs != kwargs):
+                continue
+            if not torch.equal(captured[:, :width], tokens):
+                continue
+            if not bool((captured[:, width:] == PAD_TOKEN_ID).all()):
+                continue
+            cropped = _crop(outputs, width)
+            if cropped is not None:
+                del self._local.captured[index]
+            return cropped
+        return None
+
+    @contextmanager
+    def capture(self):
+        """Keep backbone outputs of calls made in this thread for a later replay()."""
+        if not self.reuse_enabled:
+            yield
+            return
+        self._local.mode = 'capture'
+        self._local.captured = []
+        try:
+            yield
+        finally:
+            self._local.mode = None
+
+    @contextmanager
+    def replay(self):
+        """Answer matching backbone calls in this thread from the last capture()."""
+        if not self.reuse_enabled or not getattr(self._local, 'captured', None):
+            yield
+            return
+        self._local.mode = 'replay'
+        try:
+            yield
+        finally:
+            self._local.mode = None
+            self._local.captured = []
+
+    def verify(self, model_i, model_ii, max_length_i, max_length_ii):
+        """Check that class I scores from reused embeddings match fresh ones.
+
+        Reuse is disabled if they differ by more than REUSE_TOLERANCE.
+        """
+        device = next(self.module.parameters()).device
+        tokens_i = _encode(PROBE_PEPTIDES, max_length_i).to(device)
+        tokens_ii = _encode(PROBE_PEPTIDES, max_length_ii).to(device)
+        with torch.no_grad():
+            fresh, _ = model_i(tokens_i)
+            with self.capture():
+                model_ii(tokens_ii)
+            with self.replay():
+                reused, _ = model_i(tokens_i)
+        drift = float((fresh[:, 1].float() - reused[:, 1].float()).abs().max())
+        self.reuse_enabled = drift <= REUSE_TOLERANCE
+        self.computed = self.reused = 0
+        if not self.reuse_enabled:
+            print(f"Embedding reuse disabled: class I scores drift by {drift:.2e}")
+        return drift
+
+    def stats(self):
+        total = self.computed + self.reused
+        return {
+            "reuse_enabled": self.reuse_enabled,
+            "bytes": model_bytes(self.module),
+            "rows_computed": self.computed,
+            "rows_reused": self.reused,
+            "reuse_ratio": self.reused / total if total else 0,
+        }
+
+
+def share_backbones(model_i, model_ii, max_length_i=16, max_length_ii=23):
+    """Point both models at one backbone when their backbone weights are identical.
+
+    Returns the SharedBackbone, or None when the models cannot share one.
+    """
+    if not SHARE_BACKBONE:
+        return None
+    name_i, backbone_i = find_backbone(model_i)
+    name_ii, backbone_ii = find_backbone(model_ii)
+    if backbone_i is None or backbone_ii is None:
+        print("No ESM backbone found in the models; backbones are not shared")
+        return None
+    if backbone_i is not backbone_ii:
+        if not same_weights(backbone_i, backbone_ii):
+            print("Class I and class II backbones differ; backbones are not shared")
+            return None
+        _install(model_ii, name_ii, backbone_i)
+    shared = getattr(backbone_i, '_shared_backbone', None)
+    if shared is None:
+        shared = SharedBackbone(backbone_i)
+        backbone_i._shared_backbone = shared
+    shared.verify(model_i, model_ii, max_length_i, max_length_ii)
+    saved = model_bytes(backbone_i)
+    print(f"Sharing the ESM backbone between class I and class II models "
+          f"({saved / 1024 ** 2:.0f} MB saved, embedding reuse "
+          f"{'enabled' if shared.reuse_enabled else 'disabled'})")
+    return shared
@@ -0,0 +1,292 @@
+"""Protein structure prediction backends, and the store that keeps their results.
+
+TRANSHLA_STRUCTURE_BACKEND selects where structures come from:
+
+    remote       the ESMFold API at TRANSHLA_ESMFOLD_URL (default)
+    esmfold      ESMFold run in this process (requires fair-esm)
+    precomputed  PDB files in TRANSHLA_PDB_DIR, matched by their sequence
+
+Every backend sits behind a StructureService, which looks a sequence up in
+the in-memory structure cache, then in a compressed on-disk PDB store, and
+only then asks the backend. Concurrent requests for the same sequence share
+one backend call, so a protein is folded at most once.
+"""
+import os
+import gzip
+import hashlib
+import threading
+from concurrent.futures import Future
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+STRUCTURE_BACKEND = os.environ.get('TRANSHLA_STRUCTURE_BACKEND', 'remote')
+ESMFOLD_URL = os.environ.get('TRANSHLA_ESMFOLD_URL', 'https://api.esmatlas.com/foldSequence/v1/pdb/')
+# Seconds to wait for the API to answer one sequence
+STRUCTURE_TIMEOUT = float(os.environ.get('TRANSHLA_STRUCTURE_TIMEOUT', 120))
+STRUCTURE_RETRIES = int(os.environ.get('TRANSHLA_STRUCTURE_RETRIES', 2))
+# Backend calls in flight at once per worker process
+STRUCTURE_CONCURRENCY = int(os.environ.get('TRANSHLA_STRUCTURE_CONCURRENCY', 4))
+PDB_DIR = os.environ.get('TRANSHLA_PDB_DIR')
+
+THREE_TO_ONE = {
+    'ALA': 'A', 'ARG': 'R', 'ASN': 'N', 'ASP': 'D', 'CYS': 'C', 'GLN': 'Q', 'GLU': 'E',
+    'GLY': 'G', 'HIS': 'H', 'ILE': 'I', 'LEU': 'L', 'LYS': 'K', 'MET': 'M', 'PHE': 'F',
+    'PRO': 'P', 'SER': 'S', 'THR': 'T', 'TRP': 'W', 'TYR': 'Y', 'VAL': 'V',
+}
+
+
+class StructureAPIError(Exception):
+    pass
+
+
+class StructureNotFound(StructureAPIError):
+    pass
+
+
+def sequence_key(sequence):
+    return hashlib.sha256(sequence.encode()).hexdigest()
+
+
+class RemoteESMFold:
+    """ESMFold API client with a pooled session, timeouts, retries and bounded concurrency."""
+
+    name = "remote"
+
+    def __init__(self, url=ESMFOLD_URL, timeout=STRUCTURE_TIMEOUT, retries=STRUCTURE_RETRIES,
+                 max_concurrency=STRUCTURE_CONCURRENCY):
+        self.url = url
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        retry = Retry(total=retries, backoff_factor=1, status_forcelist=(429, 500, 502, 503, 504),
+                      allowed_methods=None, raise_on_status=False)
+        self.session = requests.Session()
+        self.session.mount('https://', HTTPAdapter(pool_maxsize=max_concurrency, max_retries=retry))
+        self.session.mount('http://', HTTPAdapter(pool_maxsize=max_concurrency, max_retries=retry))
+
+    def predict(self, sequence):
+        with self._slots:
+            try:
+                response = self.session.post(self.url, data=sequence, timeout=(10, self.timeout))
+            except requests.RequestException as e:
+                raise StructureAPIError(f"Error calling ESMFold API: {str(e)}")
+        if response.status_code != 200:
+            raise StructureAPIError(f"ESMFold API error: {response.text}")
+        return response.text
+
+
+class LocalESMFold:
+    """ESMFold from fair-esm, loaded on first use and run one sequence at a time."""
+
+    name = "esmfold"
+
+    def __init__(self, device='cpu'):
+        self.device = device
+        self._model = None
+        self._lock = threading.Lock()
+
+    def predict(self, sequence):
+        import torch
+        with self._lock:
+            if self._model is None:
+                try:
+                    import esm
+                except ImportError:
+                    raise RuntimeError("The esmfold structure backend requires fair-esm "
+                                       "(pip install 'fair-esm[esmfold]')")
+                print("Loading ESMFold...")
+                model = esm.pretrained.esmfold_v1().eval().to(self.device)
+                # Trades speed for memory on long sequences
+                model.set_chunk_size(128)
+                self._model = model
+            with torch.no_grad():
+                return self._model.infer_pdb(sequence)
+
+
+def pdb_sequence(pdb_structure):
+    """One-letter sequence of the first chain, from its C-alpha atoms."""
+    residues = []
+    chain = None
+    for line in pdb_structure.splitlines():
+        if not line.startswith('ATOM') or line[12:16].strip() != 'CA':
+            continue
+        if chain is None:
+            chain = line[21]
+        elif line[21] != chain:
+            break
+        residues.append(THREE_TO_ONE.get(line[17:20], 'X'))
+    return ''.join(residues)
+
+
+def read_pdb(path):
+    opener = gzip.open if path.endswith('.gz') else open
+    with opener(path, 'rt') as handle:
+        return handle.read()
+
+
+class PrecomputedPDB:
+    """Serves PDB files from a directory, matched to requests by their sequence."""
+
+    name = "precomputed"
+
+    def __init__(self, directory=PDB_DIR):
+        if not directory or not os.path.isdir(directory):
+            raise RuntimeError("The precomputed structure backend requires TRANSHLA_PDB_DIR")
+        self.directory = directory
+        self._paths = None
+        self._lock = threading.Lock()
+
+    def _index(self):
+        with self._lock:
+            if self._paths is None:
+                paths = {}
+                for root, _, files in os.walk(self.directory):
+                    for file_name in files:
+                        if file_name.endswith(('.pdb', '.pdb.gz')):
+                            path = os.path.join(root, file_name)
+                            paths.setdefault(pdb_sequence(read_pdb(path)), path)
+                print(f"Indexed {len(paths)} precomputed structures in {self.directory}")
+                self._paths = paths
+            return self._paths
+
+    def predict(self, sequence):
+        path = self._index().get(sequence)
+        if path is None:
+            raise StructureNotFound("No precomputed structure for this sequence")
+        return read_pdb(path)
+
+
+STRUCTURE_BACKENDS = {
+    "remote": RemoteESMFold,
+    "esmfold": LocalESMFold,
+    "precomputed": PrecomputedPDB,
+}
+
+
+class PDBStore:
+    """Gzip-compressed PDB files on disk, addressed by the SHA-256 of their sequence."""
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+
+    def _path(self, sequence):
+        key = sequence_key(sequence)
+        return os.path.join(self.directory, key[:2], f"{key}.pdb.gz")
+
+    def get(self, sequence):
+        try:
+            pdb_structure = read_pdb(self._path(sequence))
+        except OSError:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return pdb_structure
+
+    def put(self, sequence, pdb_structure):
+        path = self._path(sequence)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write then rename, so other workers never read a partial file
+        temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with gzip.open(temp_path, 'wt', compresslevel=6) as handle:
+            handle.write(pdb_structure)
+        os.replace(temp_path, path)
+        self.writes += 1
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "path": self.directory,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0,
+            "writes": self.writes,
+        }
+
+
+def open_pdb_store(directory):
+    """Open the PDB store, or return None if it cannot be used."""
+    if os.environ.get('TRANSHLA_DISABLE_STRUCTURE_STORE', '0') == '1':
+        return None
+    try:
+        store = PDBStore(directory)
+        print(f"Structure store opened at {directory}")
+        return store
+    except OSError as e:
+        print(f"Warning: could not open structure store at {directory}: {e}")
+        return None
+
+
+class StructureService:
+    """Cache, store and single-flight in front of a structure backend."""
+
+    def __init__(self, backend, cache, store=None):
+        self.backend = backend
+        self.cache = cache
+        self.store = store
+        self._in_flight = {}
+        self._lock = threading.Lock()
+        self.backend_calls = 0
+        self.coalesced = 0
+
+    def fetch(self, sequence):
+        """Return the PDB structure of a sequence, folding it only if no copy is kept."""
+        pdb_structure = self.cache.get(sequence)
+        if pdb_structure is not None:
+            print(f"Structure cache hit for sequence of length {len(sequence)}")
+            return pdb_structure
+
+        with self._lock:
+            future = self._in_flight.get(sequence)
+            leader = future is None
+            if leader:
+                future = self._in_flight[sequence] = Future()
+            else:
+                self.coalesced += 1
+        if not leader:
+            return future.result()
+
+        try:
+            pdb_structure = self.store.get(sequence) if self.store is not None else None
+            if pdb_structure is None:
+                self.backend_calls += 1
+                pdb_structure = self.backend.predict(sequence)
+                if self.store is not None:
+                    try:
+                        self.store.put(sequence, pdb_structure)
+                    except OSError as e:
+                        print(f"Warning: could not store structure: {e}")
+            self.cache.put(sequence, pdb_structure)
+            future.set_result(pdb_structure)
+            return pdb_structure
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                del self._in_flight[sequence]
+
+    def stats(self):
+        with self._lock:
+            in_flight = len(self._in_flight)
+        return {
+            "backend": self.backend.name,
+            "backend_calls": self.backend_calls,
+            "coalesced": self.coalesced,
+            "in_flight": in_flight,
+            "store": self.store.stats() if self.store is not None else None,
+        }
+
+
+def create_structure_service(cache, store_dir):
+    """Build the service for the backend selected by TRANSHLA_STRUCTURE_BACKEND."""
+    backend_type = STRUCTURE_BACKENDS.get(STRUCTURE_BACKEND)
+    if backend_type is None:
+        raise ValueError(f"Unknown structure backend {STRUCTURE_BACKEND!r}; "
+                         f"use one of: {', '.join(STRUCTURE_BACKENDS)}")
+    print(f"Using the {STRUCTURE_BACKEND} structure backend")
+    return StructureService(backend_type(), cache, open_pdb_store(store_dir))
@@ -0,0 +1,126 @@
+"""Native ESM2 tokenizer for peptide and protein sequences.
+
+Produces the same token ids as the ``facebook/esm2_t33_650M_UR50D``
+HuggingFace tokenizer for residue strings, using a 256-entry byte lookup
+table instead of per-character Python work.
+"""
+import sys
+import random
+
+import numpy as np
+from numpy.lib.stride_tricks import as_strided
+
+# ESM2 vocabulary, in token id order
+ESM_VOCAB = [
+    '<cls>', '<pad>', '<eos>', '<unk>',
+    'L', 'A', 'G', 'V', 'S', 'E', 'R', 'T', 'I', 'D', 'P', 'K', 'Q', 'N',
+    'F', 'Y', 'M', 'H', 'W', 'C', 'X', 'B', 'U', 'Z', 'O', '.', '-',
+    '<null_1>', '<mask>'
+]
+
+CLS_TOKEN_ID = 0
+PAD_TOKEN_ID = 1
+EOS_TOKEN_ID = 2
+UNK_TOKEN_ID = 3
+
+VALID_AMINO_ACIDS = "ACDEFGHIKLMNPQRSTVWY"
+
+# Byte -> token id, and byte -> "is one of the 20 standard residues"
+TOKEN_LOOKUP = np.full(256, UNK_TOKEN_ID, dtype=np.int64)
+for _token_id, _token in enumerate(ESM_VOCAB):
+    if len(_token) == 1:
+        TOKEN_LOOKUP[ord(_token)] = _token_id
+VALID_LOOKUP = np.zeros(256, dtype=bool)
+VALID_LOOKUP[np.frombuffer(VALID_AMINO_ACIDS.encode('ascii'), dtype=np.uint8)] = True
+
+
+def sequence_bytes(sequence):
+    """View a sequence as a uint8 array, one byte per residue.
+
+    Non-ASCII characters become '?', which maps to the unknown token.
+    """
+    return np.frombuffer(sequence.encode('ascii', 'replace'), dtype=np.uint8)
+
+
+def encode(sequence):
+    """Map every residue of a sequence to its ESM token id (no CLS/EOS)."""
+    return TOKEN_LOOKUP[sequence_bytes(sequence)]
+
+
+def valid_residues(sequence):
+    """Boolean mask of positions holding one of the 20 standard residues."""
+    return VALID_LOOKUP[sequence_bytes(sequence)]
+
+
+def window_view(residue_ids, length):
+    """Zero-copy (n_windows, length) view of every window of a residue array."""
+    n_windows = max(len(residue_ids) - length + 1, 0)
+    stride = residue_ids.strides[0]
+    return as_strided(residue_ids, shape=(n_windows, length), strides=(stride, stride),
+                      writeable=False)
+
+
+def valid_window_starts(valid, length):
+    """0-indexed start positions of windows made only of valid residues."""
+    if len(valid) < length:
+        return np.empty(0, dtype=np.int64)
+    invalid_count = np.concatenate(([0], np.cumsum(~valid)))
+    return np.flatnonzero(invalid_count[length:] == invalid_count[:-length])
+
+
+def frame_windows(windows, max_length, out=None):
+    """Add CLS/EOS/pad columns around rows of residue ids.
+
+    windows is an (n, length) array or view; the framed (n, max_length)
+    int64 array is written into out when given.
+    """
+    n, length = windows.shape
+    if out is None:
+        out = np.empty((n, max_length), dtype=np.int64)
+    out[:, 0] = CLS_TOKEN_ID
+    out[:, 1:length + 1] = windows
+    out[:, length + 1] = EOS_TOKEN_ID
+    out[:, length + 2:] = PAD_TOKEN_ID
+    return out
+
+
+class NativeTokenizer:
+    """Drop-in replacement for the HF ESM tokenizer on residue strings."""
+
+    def __call__(self, sequences):
+        """HF-compatible call: CLS + residues + EOS per sequence, unpadded."""
+        input_ids = [
+            [CLS_TOKEN_ID] + encode(sequence).tolist() + [EOS_TOKEN_ID]
+            for sequence in sequences
+        ]
+        return {'input_ids': input_ids}
+
+    def encode_batch(self, sequences, max_length):
+        """Tokenize same-length sequences into a padded (n, max_length) int64 array."""
+        if not sequences:
+            return np.full((0, max_length), PAD_TOKEN_ID, dtype=np.int64)
+        length = len(sequences[0])
+        residues = TOKEN_LOOKUP[sequence_bytes(''.join(sequences))].reshape(len(sequences), length)
+        return frame_windows(residues, max_length)
+
+
+def check_equivalence(hf_tokenizer, sequences):
+    """Return the sequences whose native token ids differ from hf_tokenizer's."""
+    native_ids = NativeTokenizer()(sequences)['input_ids']
+    hf_ids = hf_tokenizer(list(sequences))['input_ids']
+    return [s for s, a, b in zip(sequences, native_ids, hf_ids) if list(a) != list(b)]
+
+
+if __name__ == '__main__':
+    # Compare against the HuggingFace tokenizer (must be cached or downloadable)
+    from transformers import AutoTokenizer
+    hf_tokenizer = AutoTokenizer.from_pretrained("facebook/esm2_t33_650M_UR50D")
+    rng = random.Random(0)
+    samples = [VALID_AMINO_ACIDS, "XBUZO"]
+    samples += [''.join(rng.choice(VALID_AMINO_ACIDS) for _ in range(rng.randint(8, 21)))
+                for _ in range(10000)]
+    mismatches = check_equivalence(hf_tokenizer, samples)
+    if mismatches:
+        print(f"{len(mismatches)} sequences tokenized differently, e.g. {mismatches[:5]}")
+        sys.exit(1)
+    print(f"Native tokenizer matches HF tokenizer on {len(samples)} sequences")
@@ -0,0 +1,215 @@
+"""Variant scanning: re-score only the windows a mutation changes.
+
+Once their common prefix and suffix are removed, a variant differs from its
+reference in one contiguous region. Windows lying entirely in the prefix or
+the suffix hold the same peptide as in the reference, so only windows that
+overlap the changed region (or span the junction left by a deletion) are
+scored; every other window keeps its reference score.
+
+Variants are given as point mutations in one-letter notation ("A123V", 1-indexed,
+several per variant separated by commas or '+'), as full variant sequences
+(which may carry insertions and deletions), or as a saturation scan of every
+substitution over a range of positions.
+"""
+import re
+
+import numpy as np
+
+from .batching import EPITOPE_THRESHOLD, length_classes
+from .tokenizer import VALID_AMINO_ACIDS, valid_residues, valid_window_starts
+
+MUTATION_PATTERN = re.compile(r'^(?:P\.)?([A-Z])(\d+)([A-Z])$')
+
+
+def parse_mutations(spec, reference):
+    """Parse "A12V,K45R" (or a list of such strings) into sorted (index, ref, alt) tuples.
+
+    Raises ValueError when a mutation is malformed, out of range, or its
+    reference residue does not match the reference sequence.
+    """
+    items = spec if isinstance(spec, (list, tuple)) else [spec]
+    mutations = {}
+    for item in items:
+        for text in re.split(r'[,+;\s]+', str(item).strip().upper()):
+            if not text:
+                continue
+            match = MUTATION_PATTERN.match(text)
+            if match is None:
+                raise ValueError(f"Invalid mutation '{text}'; expected e.g. A123V")
+            ref, position, alt = match.group(1), int(match.group(2)), match.group(3)
+            if not 1 <= position <= len(reference):
+                raise ValueError(f"Mutation '{text}' is outside the reference sequence")
+            if reference[position - 1] != ref:
+                raise ValueError(f"Mutation '{text}' does not match reference residue "
+                                 f"{reference[position - 1]} at position {position}")
+            if alt not in VALID_AMINO_ACIDS:
+                raise ValueError(f"Mutation '{text}' introduces an invalid amino acid")
+            if mutations.get(position - 1, alt) != alt:
+                raise ValueError(f"Conflicting mutations at position {position}")
+            mutations[position - 1] = alt
+    if not mutations:
+        raise ValueError("No mutations given")
+    return [(index, reference[index], alt) for index, alt in sorted(mutations.items())]
+
+
+def mutation_name(mutations):
+    return ','.join(f"{ref}{index + 1}{alt}" for index, ref, alt in mutations)
+
+
+def apply_mutations(reference, mutations):
+    """Return the reference sequence with the substitutions applied."""
+    residues = list(reference)
+    for index, _, alt in mutations:
+        residues[index] = alt
+    return ''.join(residues)
+
+
+def saturation_mutations(reference, start=1, end=None):
+    """Every single substitution at 1-indexed positions start..end."""
+    end = min(end or len(reference), len(reference))
+    return [[(index, reference[index], alt)]
+            for index in range(max(start, 1) - 1, end)
+            for alt in VALID_AMINO_ACIDS if alt != reference[index]]
+
+
+def changed_region(reference, variant):
+    """Return (begin, reference_end, variant_end) of the region where the sequences differ."""
+    shortest = min(len(reference), len(variant))
+    begin = 0
+    while begin < shortest and reference[begin] == variant[begin]:
+        begin += 1
+    suffix = 0
+    while suffix < shortest - begin and reference[-1 - suffix] == variant[-1 - suffix]:
+        suffix += 1
+    return begin, len(reference) - suffix, len(variant) - suffix
+
+
+def affected_starts(starts, begin, end, length):
+    """The window starts that overlap [begin, end), or span position begin when it is empty."""
+    return starts[(starts > begin - length) & (starts < end)]
+
+
+def reference_profile(reference, hla_class, score, fixed_window_size=None):
+    """Score every window of the reference.
+
+    Returns {(class, length): float32 array indexed by start}, NaN where the
+    window is not valid.
+    """
+    valid = valid_residues(reference)
+    plan = {}
+    for length, classes in length_classes(hla_class, fixed_window_size):
+        starts = valid_window_starts(valid, length)
+        for peptide_class in classes:
+            plan.setdefault(peptide_class, []).append((length, starts))
+    profile = {}
+    for peptide_class, lengths in plan.items():
+        peptides = [reference[start:start + length] for length, starts in lengths for start in starts.tolist()]
+        probabilities = score(peptides, peptide_class) if peptides else np.empty(0, dtype=np.float32)
+        offset = 0
+        for length, starts in lengths:
+            scores = np.full(max(len(reference) - length + 1, 0), np.nan, dtype=np.float32)
+            scores[starts] = probabilities[offset:offset + len(starts)]
+            offset += len(starts)
+            profile[(peptide_class, length)] = scores
+    return profile
+
+
+def scan_variants(reference, variants, hla_class, score, fixed_window_size=None, include_windows=True):
+    """Score a batch of variants against a reference sequence.
+
+    variants is a list of (name, sequence) pairs; score(peptides, hla_class)
+    returns float32 probabilities. Peptides shared between variants are
+    scored once. Returns (reference summary, per-variant results, stats).
+    """
+    profile = reference_profile(reference, hla_class, score, fixed_window_size)
+    plan = length_classes(hla_class, fixed_window_size)
+    reference_valid = valid_residues(reference)
+    reference_starts_by_length = {length: valid_window_starts(reference_valid, length) for length, _ in plan}
+
+    # Collect the changed windows of every variant, deduplicated per class
+    unique = {}
+    affected = []
+    windows_total = 0
+    for name, sequence in variants:
+        begin, reference_end, variant_end = changed_region(reference, sequence)
+        valid = valid_residues(sequence)
+        # Substitutions of valid residues leave the valid windows unchanged
+        same_windows = len(sequence) == len(reference) and np.array_equal(valid, reference_valid)
+        windows = []
+        for length, classes in plan:
+            all_starts = reference_starts_by_length[length] if same_windows else valid_window_starts(valid, length)
+            variant_starts = affected_starts(all_starts, begin, variant_end, length)
+            reference_starts = affected_starts(reference_starts_by_length[length], begin, reference_end, length)
+            peptides = [sequence[start:start + length] for start in variant_starts.tolist()]
+            windows_total += len(all_starts) * len(classes)
+            for peptide_class in classes:
+                indices = unique.setdefault(peptide_class, {})
+                ids = [indices.setdefault(peptide, len(indices)) for peptide in peptides]
+                windows.append((peptide_class, length, variant_starts, reference_starts, peptides, ids))
+        affected.append((name, sequence, windows))
+
+    scores = {}
+    for peptide_class, indices in unique.items():
+        scores[peptide_class] = score(list(indices), peptide_class) if indices else np.empty(0, dtype=np.float32)
+
+    results = []
+    windows_changed = 0
+    for name, sequence, windows in affected:
+        records = []
+        deltas = []
+        gained = lost = 0
+        for peptide_class, length, variant_starts, reference_starts, peptides, ids in windows:
+            reference_scores = profile[(peptide_class, length)]
+            probabilities = scores[peptide_class][ids] if ids else np.empty(0, dtype=np.float32)
+            windows_changed += len(ids)
+            # Reference windows at the same start; missing where the reference is shorter
+            paired = np.full(len(variant_starts), np.nan, dtype=np.float32)
+            in_reference = variant_starts < len(reference_scores)
+            paired[in_reference] = reference_scores[variant_starts[in_reference]]
+            variant_epitopes = probabilities > EPITOPE_THRESHOLD
+            gained += int((variant_epitopes & ~(paired > EPITOPE_THRESHOLD)).sum())
+            reference_epitopes = reference_scores[reference_starts] > EPITOPE_THRESHOLD
+            lost += int(reference_epitopes.sum()) - int(np.isin(
+                reference_starts[reference_epitopes], variant_starts[variant_epitopes]).sum())
+            delta = probabilities - paired
+            deltas.append(delta[~np.isnan(delta)])
+            if include_windows:
+                for start, peptide, probability, reference_probability in zip(
+                        variant_starts.tolist(), peptides, probabilities.tolist(), paired.tolist()):
+                    has_reference = not np.isnan(reference_probability)
+                    records.append({
+                        "peptide": peptide,
+                        "position": start + 1,  # 1-indexed position
+                        "length": length,
+                        "class": peptide_class,
+                        "probability": probability,
+                        "is_epitope": probability > EPITOPE_THRESHOLD,
+                        "reference_peptide": reference[start:start + length] if has_reference else None,
+                        "reference_probability": reference_probability if has_reference else None,
+                        "delta": probability - reference_probability if has_reference else None
+                    })
+        deltas = np.concatenate(deltas) if deltas else np.empty(0, dtype=np.float32)
+        result = {
+            "variant": name,
+            "changed_windows": sum(len(w[5]) for w in windows),
+            "max_increase": float(deltas.max()) if len(deltas) else 0.0,
+            "max_decrease": float(deltas.min()) if len(deltas) else 0.0,
+            "mean_delta": float(deltas.mean()) if len(deltas) else 0.0,
+            "epitopes_gained": gained,
+            "epitopes_lost": lost
+        }
+        if include_windows:
+            result["windows"] = records
+        results.append(result)
+
+    reference_scores = np.concatenate([s[~np.isnan(s)] for s in profile.values()]) if profile else np.empty(0)
+    summary = {
+        "total_peptides": len(reference_scores),
+        "epitope_count": int((reference_scores > EPITOPE_THRESHOLD).sum())
+    }
+    stats = {
+        "windows_changed": windows_changed,
+        "windows_scored": sum(len(indices) for indices in unique.values()),
+        "windows_reused": windows_total - windows_changed
+    }
+    return summary, results, stats
@@ -0,0 +1,169 @@
+"""Memory-mapped checkpoint weights.
+
+Parameters loaded by from_pretrained live in anonymous memory, so every
+worker process holds its own copy. load_mmap_model instead builds the model
+without initializing its weights and assigns every parameter its tensor in
+a private memory map of the checkpoint file: weights are never copied into
+anonymous memory, even while loading. Pages come from the OS page cache and
+are shared by every process that maps the same file, and are only copied if
+a process writes to them.
+
+Checkpoints that do not cover every parameter (legacy .bin files, renamed
+or tied weights) are loaded with from_pretrained, and remap_to_mmap then
+points the matching parameters at the memory map.
+"""
+import os
+import json
+import glob
+import struct
+import hashlib
+from contextlib import ExitStack, contextmanager
+
+import torch
+
+SAFETENSORS_DTYPES = {
+    "F64": torch.float64,
+    "F32": torch.float32,
+    "F16": torch.float16,
+    "BF16": torch.bfloat16,
+    "I64": torch.int64,
+    "I32": torch.int32,
+    "I16": torch.int16,
+    "I8": torch.int8,
+    "U8": torch.uint8,
+    "BOOL": torch.bool,
+}
+
+
+def mmap_safetensors(path):
+    """Return {name: tensor} for a safetensors file, backed by a private memory map.
+
+    Tensors whose dtype is unknown or whose offset is not aligned to their
+    element size are skipped.
+    """
+    with open(path, 'rb') as handle:
+        header_size = struct.unpack('<Q', handle.read(8))[0]
+        header = json.loads(handle.read(header_size))
+    storage = torch.UntypedStorage.from_file(path, shared=False, nbytes=os.path.getsize(path))
+    data_start = 8 + header_size
+    tensors = {}
+    for name, info in header.items():
+        dtype = SAFETENSORS_DTYPES.get(info.get("dtype")) if name != "__metadata__" else None
+        if dtype is None:
+            continue
+        offset = data_start + info["data_offsets"][0]
+        element_size = torch.empty(0, dtype=dtype).element_size()
+        if offset % element_size:
+            continue
+        tensors[name] = torch.empty(0, dtype=dtype).set_(storage, offset // element_size, info["shape"])
+    return tensors
+
+
+def checkpoint_files(snapshot_dir):
+    """Weight files of a model snapshot, preferring safetensors."""
+    files = sorted(glob.glob(os.path.join(snapshot_dir, '*.safetensors')))
+    if not files:
+        files = sorted(glob.glob(os.path.join(snapshot_dir, 'pytorch_model*.bin')))
+    return files
+
+
+def checkpoint_digest(snapshot_dir):
+    """SHA-256 of the bytes of every weight file of a snapshot, in name order."""
+    digest = hashlib.sha256()
+    for path in checkpoint_files(snapshot_dir):
+        digest.update(os.path.basename(path).encode())
+        with open(path, 'rb') as handle:
+            for block in iter(lambda: handle.read(1 << 20), b''):
+                digest.update(block)
+    return digest.hexdigest()
+
+
+def mmap_checkpoint(snapshot_dir):
+    """Return {name: tensor} for every weight file of a snapshot, memory-mapped."""
+    tensors = {}
+    for path in checkpoint_files(snapshot_dir):
+        if path.endswith('.safetensors'):
+            tensors.update(mmap_safetensors(path))
+        else:
+            try:
+                tensors.update(torch.load(path, map_location='cpu', mmap=True, weights_only=True))
+            except (RuntimeError, ValueError) as e:
+                # Legacy (non-zipfile) checkpoints cannot be memory-mapped
+                print(f"Could not memory-map {path}: {str(e)}")
+    return tensors
+
+
+# torch.nn.init functions that module constructors use to fill new weights
+INIT_FUNCTIONS = (
+    'uniform_', 'normal_', 'trunc_normal_', 'constant_', 'zeros_', 'ones_', 'eye_', 'dirac_',
+    'xavier_uniform_', 'xavier_normal_', 'kaiming_uniform_', 'kaiming_normal_', 'orthogonal_', 'sparse_',
+)
+
+
+@contextmanager
+def skip_weight_init():
+    """Construct modules without filling their weights.
+
+    New weights stay untouched torch.empty memory, which the OS only backs
+    with pages once written, so a model about to receive checkpoint tensors
+    costs next to nothing to build.
+    """
+    saved = {name: getattr(torch.nn.init, name) for name in INIT_FUNCTIONS if hasattr(torch.nn.init, name)}
+    for name in saved:
+        setattr(torch.nn.init, name, lambda tensor, *args, **kwargs: tensor)
+    try:
+        with ExitStack() as stack:
+            # HF models also skip their own _init_weights
+            try:
+                from transformers.modeling_utils import no_init_weights
+            except ImportError:
+                from transformers.initialization import no_init_weights
+            stack.enter_context(no_init_weights())
+            yield
+    finally:
+        for name, function in saved.items():
+            setattr(torch.nn.init, name, function)
+
+
+def load_mmap_model(snapshot_dir):
+    """Build a CPU model whose weights are the snapshot's memory-mapped tensors.
+
+    Returns (model, bytes memory-mapped), or (None, 0) when the checkpoint
+    does not hold every weight and persistent buffer with the model's own
+    name, shape and dtype.
+    """
+    from transformers import AutoConfig, AutoModel
+
+    tensors = mmap_checkpoint(snapshot_dir)
+    if not tensors:
+        return None, 0
+    config = AutoConfig.from_pretrained(snapshot_dir, trust_remote_code=True)
+    with skip_weight_init():
+        model = AutoModel.from_config(config, trust_remote_code=True)
+    expected = model.state_dict()
+    for name, tensor in expected.items():
+        mapped = tensors.get(name)
+        if mapped is None or mapped.shape != tensor.shape or mapped.dtype != tensor.dtype:
+            return None, 0
+    model.load_state_dict({name: tensors[name] for name in expected}, assign=True)
+    model.eval()
+    return model, sum(tensors[name].numel() * tensors[name].element_size() for name in expected)
+
+
+def remap_to_mmap(model, snapshot_dir):
+    """Point a CPU model's parameters at memory-mapped checkpoint tensors.
+
+    Only parameters whose checkpoint tensor has the same shape, dtype and
+    values are remapped, so weights changed after loading are kept as they
+    are. Returns the number of bytes now backed by the memory map.
+    """
+    tensors = mmap_checkpoint(snapshot_dir)
+    remapped = 0
+    for name, parameter in model.named_parameters():
+        mapped = tensors.get(name)
+        if (mapped is None or parameter.device.type != 'cpu' or mapped.shape != parameter.shape
+                or mapped.dtype != parameter.dtype or not torch.equal(mapped, parameter.data)):
+            continue
+        parameter.data = mapped
+        remapped += mapped.numel() * mapped.element_size()
+    return remapped
@@ -0,0 +1,257 @@
+"""Wire formats: JSON and MessagePack encoding, and body compression.
+
+Responses are encoded with orjson when it is installed, which serializes
+NumPy result columns directly instead of through Python lists. Prediction
+and structure responses are sent as MessagePack instead when the client
+asks for it with `Accept: application/msgpack` (requires msgpack); floats
+are packed as float32, which holds every probability to the precision
+reported.
+
+Response bodies of at least COMPRESS_MIN_BYTES are compressed with zstd
+(requires zstandard) or gzip, whichever the client's Accept-Encoding
+prefers. Streamed responses are compressed record by record, with a flush
+after each, so clients still see every batch as soon as it is scored.
+
+Request bodies sent with `Content-Encoding: gzip`, `deflate` or `zstd` are
+decompressed before Flask reads them, up to the app's MAX_CONTENT_LENGTH.
+"""
+import io
+import os
+import json
+import zlib
+import importlib.util
+
+import numpy as np
+from flask import Response, jsonify, request
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Smallest response body worth compressing
+COMPRESS_MIN_BYTES = int(os.environ.get('TRANSHLA_COMPRESS_MIN_BYTES', 1024))
+# Level 3 compresses result JSON about as well as 6 in less than half the time
+GZIP_LEVEL = int(os.environ.get('TRANSHLA_GZIP_LEVEL', 3))
+ZSTD_LEVEL = int(os.environ.get('TRANSHLA_ZSTD_LEVEL', 3))
+
+MSGPACK_MIMETYPE = 'application/msgpack'
+
+# Response types worth compressing; PDB text is served inside JSON
+COMPRESSIBLE_TYPES = (
+    'application/json', 'application/x-ndjson', MSGPACK_MIMETYPE,
+    'application/vnd.apache.arrow.stream', 'text/',
+)
+
+
+def to_builtin(value):
+    """Convert NumPy values the encoders cannot handle natively."""
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f"Object of type {type(value).__name__} is not serializable")
+
+
+def dumps(value, sort_keys=False):
+    """JSON bytes, through orjson when it is installed."""
+    if orjson is not None:
+        option = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+        if sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        return orjson.dumps(value, default=to_builtin, option=option)
+    return json.dumps(value, default=to_builtin, sort_keys=sort_keys).encode()
+
+
+def packb(value):
+    """MessagePack bytes; raises RuntimeError when msgpack is not installed."""
+    try:
+        import msgpack
+    except ImportError:
+        raise RuntimeError("MessagePack output requires msgpack (pip install msgpack)")
+    return msgpack.packb(value, default=to_builtin, use_single_float=True)
+
+
+class WireJSONProvider(DefaultJSONProvider):
+    """Flask JSON provider that encodes with dumps() and handles NumPy values.
+
+    Keys are sorted as with Flask's default provider (sort_keys).
+    """
+
+    def _default(self, value):
+        try:
+            return to_builtin(value)
+        except TypeError:
+            return self.default(value)
+
+    def dumps(self, obj, **kwargs):
+        if orjson is None or kwargs:
+            kwargs.setdefault("default", self._default)
+            return super().dumps(obj, **kwargs)
+        return dumps(obj, self.sort_keys).decode()
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        if orjson is None:
+            return super().response(obj)
+        return self._app.response_class(dumps(obj, self.sort_keys), mimetype=self.mimetype)
+
+
+def wants_msgpack():
+    """True if the client prefers MessagePack to JSON."""
+    accept = request.accept_mimetypes
+    return accept[MSGPACK_MIMETYPE] > accept['application/json']
+
+
+def encode_response(payload):
+    """Return a payload as MessagePack or JSON, as negotiated with the client."""
+    if wants_msgpack():
+        try:
+            response = Response(packb(payload), mimetype=MSGPACK_MIMETYPE)
+        except RuntimeError as e:
+            response = jsonify({"error": str(e)})
+            response.status_code = 406
+    else:
+        response = jsonify(payload)
+    response.vary.add('Accept')
+    return response
+
+
+def installed(module):
+    """True if an optional dependency can be imported."""
+    return importlib.util.find_spec(module) is not None
+
+
+def response_encoding():
+    """The compression the client accepts and prefers, or None."""
+    accept = request.accept_encodings
+    candidates = [name for name in ('zstd', 'gzip') if accept[name] > 0]
+    if 'zstd' in candidates and not installed('zstandard'):
+        candidates.remove('zstd')
+    if not candidates:
+        return None
+    return max(candidates, key=lambda name: accept[name])
+
+
+def compressor(encoding):
+    """(compress(chunk), flush(), finish()) for an encoding."""
+    if encoding == 'zstd':
+        import zstandard
+        stream = zstandard.ZstdCompressor(level=ZSTD_LEVEL).compressobj()
+        return (stream.compress, lambda: stream.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK),
+                stream.flush)
+    # wbits 31 writes a gzip header and trailer
+    stream = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+    return stream.compress, lambda: stream.flush(zlib.Z_SYNC_FLUSH), stream.flush
+
+
+def compress_stream(chunks, encoding):
+    compress, flush, finish = compressor(encoding)
+    for chunk in chunks:
+        data = compress(chunk) + flush()
+        if data:
+            yield data
+    yield finish()
+
+
+def compress_response(response):
+    """Compress a response body in place if the client accepts it; returns the response."""
+    if (response.status_code < 200 or response.status_code in (204, 304)
+            or response.direct_passthrough or 'Content-Encoding' in response.headers
+            or not response.mimetype.startswith(COMPRESSIBLE_TYPES)):
+        return response
+    response.vary.add('Accept-Encoding')
+    encoding = response_encoding()
+    if encoding is None:
+        return response
+
+    if response.is_streamed:
+        response.response = compress_stream(response.iter_encoded(), encoding)
+        response.headers.pop('Content-Length', None)
+    else:
+        body = response.get_data()
+        if len(body) < COMPRESS_MIN_BYTES:
+            return response
+        compress, _, finish = compressor(encoding)
+        response.set_data(compress(body) + finish())
+    response.headers['Content-Encoding'] = encoding
+    return response
+
+
+class RequestTooLarge(Exception):
+    pass
+
+
+def decompress(data, encoding, limit):
+    """Decompress a request body of at most limit bytes; raises RequestTooLarge or ValueError."""
+    if encoding == 'zstd':
+        try:
+            import zstandard
+        except ImportError:
+            raise ValueError("zstd request bodies require zstandard (pip install zstandard)")
+        try:
+            chunks, size = [], 0
+            with zstandard.ZstdDecompressor().stream_reader(io.BytesIO(data)) as reader:
+                while size <= limit:
+                    chunk = reader.read(1 << 20)
+                    if not chunk:
+                        break
+                    chunks.append(chunk)
+                    size += len(chunk)
+            body = b''.join(chunks)
+        except zstandard.ZstdError as e:
+            raise ValueError(f"Invalid zstd request body: {e}")
+    else:
+        # wbits 47 accepts both gzip and zlib headers
+        stream = zlib.decompressobj(47 if encoding == 'gzip' else zlib.MAX_WBITS)
+        try:
+            body = stream.decompress(data, limit + 1)
+        except zlib.error as e:
+            raise ValueError(f"Invalid {encoding} request body: {e}")
+    if len(body) > limit:
+        raise RequestTooLarge(f"Decompressed request body exceeds {limit} bytes")
+    return body
+
+
+class DecompressRequests:
+    """WSGI middleware that decompresses request bodies before the app reads them."""
+
+    ENCODINGS = ('gzip', 'deflate', 'zstd')
+
+    def __init__(self, app, limit):
+        self.app = app
+        self.limit = limit
+
+    def __call__(self, environ, start_response):
+        encoding = environ.get('HTTP_CONTENT_ENCODING', '').strip().lower()
+        if not encoding or encoding == 'identity':
+            return self.app(environ, start_response)
+        if encoding not in self.ENCODINGS:
+            return self.error(environ, start_response, 415,
+                              f"Unsupported Content-Encoding. Use one of: {', '.join(self.ENCODINGS)}")
+
+        length = environ.get('CONTENT_LENGTH')
+        try:
+            length = int(length) if length else None
+        except ValueError:
+            return self.error(environ, start_response, 400, "Invalid Content-Length header")
+        if length is not None and length < 0:
+            return self.error(environ, start_response, 400, "Invalid Content-Length header")
+        data = environ['wsgi.input'].read(min(length, self.limit + 1) if length is not None else self.limit + 1)
+        if len(data) > self.limit:
+            return self.error(environ, start_response, 413, f"Request body exceeds {self.limit} bytes")
+        try:
+            body = decompress(data, encoding, self.limit)
+        except RequestTooLarge as e:
+            return self.error(environ, start_response, 413, str(e))
+        except ValueError as e:
+            return self.error(environ, start_response, 400, str(e))
+        environ['wsgi.input'] = io.BytesIO(body)
+        environ['CONTENT_LENGTH'] = str(len(body))
+        del environ['HTTP_CONTENT_ENCODING']
+        return self.app(environ, start_response)
+
+    @staticmethod
+    def error(environ, start_response, status, message):
+        return Response(dumps({"error": message}), status=status, mimetype='application/json')(environ, start_response)
@@ -0,0 +1,96 @@
+"""Compare the batching engine against the original per-32 prediction loop.
+
+Usage: python benchmarks/bench_batching.py [--length 1000] [--hla-class II]
+"""
+import os
+import sys
+import time
+import random
+import argparse
+
+import torch
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(PROJECT_ROOT)
+
+from app.batching import BatchingEngine, MAX_TOKEN_LENGTH
+from app.tokenizer import encode
+from benchmarks.stand_in import make_stand_in_models
+
+AMINO_ACIDS = "ACDEFGHIKLMNPQRSTVWY"
+LENGTH_RANGES = {"I": range(8, 15), "II": range(13, 22)}
+
+
+def random_protein(length, seed=0):
+    rng = random.Random(seed)
+    return ''.join(rng.choice(AMINO_ACIDS) for _ in range(length))
+
+
+def sliding_windows(sequence, hla_class):
+    return [sequence[i:i + length]
+            for length in LENGTH_RANGES[hla_class]
+            for i in range(len(sequence) - length + 1)]
+
+
+def legacy_predict(model, tokenizer, peptides, hla_class, device):
+    """The original run_prediction loop: batches of 32 and one .item() per peptide."""
+    probabilities = []
+    batch_size = 32
+    max_length = MAX_TOKEN_LENGTH[hla_class]
+    for i in range(0, len(peptides), batch_size):
+        batch_encoding = tokenizer(peptides[i:i + batch_size])['input_ids']
+        for seq in batch_encoding:
+            seq.extend([1] * (max_length - len(seq)))
+        input_tensor = torch.tensor(batch_encoding).to(device)
+        with torch.no_grad():
+            outputs, _ = model(input_tensor)
+            for j in range(len(batch_encoding)):
+                probabilities.append(outputs[j][1].item())
+    return probabilities
+
+
+def time_call(fn, repeats):
+    best = float('inf')
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the TransHLA batching engine on CPU')
+    parser.add_argument('--length', type=int, default=1000, help='Protein length (default: 1000)')
+    parser.add_argument('--hla-class', choices=['I', 'II'], default='II')
+    parser.add_argument('--repeats', type=int, default=3)
+    parser.add_argument('--threads', type=int, default=None, help='torch intra-op threads')
+    args = parser.parse_args()
+
+    if args.threads:
+        torch.set_num_threads(args.threads)
+    device = torch.device('cpu')
+    tokenizer, model_i, model_ii = make_stand_in_models(device)
+    model = model_i if args.hla_class == "I" else model_ii
+
+    protein = random_protein(args.length)
+    peptides = sliding_windows(protein, args.hla_class)
+    engine = BatchingEngine(model, args.hla_class, device, tokenizer)
+
+    legacy_time, legacy_probs = time_call(
+        lambda: legacy_predict(model, tokenizer, peptides, args.hla_class, device), args.repeats)
+    engine_time, engine_probs = time_call(lambda: engine.predict(peptides), args.repeats)
+    window_time, _ = time_call(
+        lambda: [engine.predict_windows(encode(protein), length)
+                 for length in LENGTH_RANGES[args.hla_class]], args.repeats)
+
+    max_diff = max(abs(a - b) for a, b in zip(legacy_probs, engine_probs.tolist()))
+    print(f"Peptides: {len(peptides)} (class {args.hla_class}, protein length {args.length})")
+    print(f"Engine batch size: {engine.batch_size}")
+    print(f"Legacy loop:  {len(peptides) / legacy_time:10.1f} peptides/sec")
+    print(f"Batch engine: {len(peptides) / engine_time:10.1f} peptides/sec")
+    print(f"Strided windows: {len(peptides) / window_time:7.1f} peptides/sec")
+    print(f"Speedup: {legacy_time / engine_time:.2f}x, max probability difference: {max_diff:.2e}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+"""Microbenchmarks of the prediction hot paths in app/app.py.
+
+Runs offline on the randomly initialized stand-in models, with the score
+cache and score store disabled so every prediction reaches the model.
+
+Usage: python benchmarks/bench_micro.py [--lengths 100 500 1000] [--batch-sizes 32 128 512]
+                                        [--json results.json] [--compare baseline.json]
+"""
+import os
+import sys
+import argparse
+
+os.environ.setdefault('HF_HUB_OFFLINE', '1')
+os.environ['TRANSHLA_DISABLE_SCORE_STORE'] = '1'
+os.environ['TRANSHLA_SCORE_CACHE_BYTES'] = '0'
+
+import torch
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(PROJECT_ROOT)
+
+from app import app as server
+from app import model_loader
+from app.batching import BatchingEngine, bucket_by_length, encode_bucket
+from app.proteome_scan import iter_windows
+from app.tokenizer import NativeTokenizer
+from benchmarks.bench_batching import random_protein, time_call
+from benchmarks.report import compare, write_report
+from benchmarks.stand_in import make_stand_in_models
+
+
+def measure(results, name, fn, items, repeats, **params):
+    seconds, _ = time_call(fn, repeats)
+    result = {"name": name, **params, "items": items, "best_ms": seconds * 1000, "items_per_sec": items / seconds}
+    results.append(result)
+    print(f"{name:<40} {items:8d} items {seconds * 1000:10.2f} ms {items / seconds:12.1f} items/sec")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Microbenchmarks of the TransHLA prediction hot paths')
+    parser.add_argument('--lengths', type=int, nargs='+', default=[100, 500, 1000], help='Protein lengths')
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=[32, 128, 512])
+    parser.add_argument('--hla-classes', nargs='+', choices=['I', 'II'], default=['I', 'II'])
+    parser.add_argument('--repeats', type=int, default=3)
+    parser.add_argument('--threads', type=int, default=None, help='torch intra-op threads')
+    parser.add_argument('--json', help='Write results to this JSON file')
+    parser.add_argument('--compare', help='Compare with a previous JSON report')
+    args = parser.parse_args()
+
+    if args.threads:
+        torch.set_num_threads(args.threads)
+    device = torch.device('cpu')
+    tokenizer, model_i, model_ii = make_stand_in_models(device)
+    model_loader.install_model('I', model_i)
+    model_loader.install_model('II', model_ii)
+    native = NativeTokenizer()
+
+    results = []
+    for length in args.lengths:
+        protein = random_protein(length, seed=length)
+        for hla_class in args.hla_classes:
+            suffix = f"class {hla_class}, length {length}"
+            windows = lambda: [protein[i:i + size]
+                               for size, starts in iter_windows(protein, hla_class) for i in starts.tolist()]
+            peptides = windows()
+            params = {"hla_class": hla_class, "sequence_length": length}
+
+            measure(results, f"window peptides {suffix}", windows, len(peptides), args.repeats, **params)
+            measure(results, f"tokenize {suffix}",
+                    lambda: native(peptides), len(peptides), args.repeats, **params)
+            max_length = server.MAX_TOKEN_LENGTH[hla_class]
+            buckets = [[peptides[i] for i in indices] for indices in bucket_by_length(peptides).values()]
+            measure(results, f"encode_bucket {suffix}",
+                    lambda: [encode_bucket(native, bucket, max_length) for bucket in buckets],
+                    len(peptides), args.repeats, **params)
+            measure(results, f"score_peptides {suffix}",
+                    lambda: server.score_peptides(peptides, hla_class), len(peptides), args.repeats, **params)
+            model = model_loader.get_model(hla_class)
+            for batch_size in args.batch_sizes:
+                engine = BatchingEngine(model, hla_class, device, batch_size=batch_size)
+                measure(results, f"predict batch {batch_size} {suffix}",
+                        lambda: engine.predict(peptides), len(peptides), args.repeats,
+                        batch_size=batch_size, **params)
+        measure(results, f"run_sliding_prediction both, length {length}",
+                lambda: server.run_sliding_prediction(protein, 'both'),
+                server.count_windows(protein, 'both'), args.repeats, hla_class='both', sequence_length=length)
+
+    if args.json:
+        write_report(args.json, 'micro', results)
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+"""Measure how the CPU inference pool scales with the number of workers.
+
+Each configuration pins its workers to disjoint cores and scores every
+sliding window of a random protein; the in-process engine using all cores
+is run last for comparison.
+
+Usage: python benchmarks/bench_pool.py [--length 2000] [--hla-class II] [--workers 1 2 4 8]
+"""
+import os
+import sys
+import time
+import argparse
+
+import torch
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(PROJECT_ROOT)
+
+from app import model_loader
+from app.batching import BatchingEngine, PEPTIDE_LENGTHS
+from app.inference_pool import InferencePool, PoolEngine, assign_cores
+from app.tokenizer import encode
+from benchmarks.bench_batching import random_protein, time_call
+from benchmarks.stand_in import make_stand_in_models
+
+
+def scan(engine, residue_ids, hla_class):
+    return sum(len(engine.predict_windows(residue_ids, length)[1]) for length in PEPTIDE_LENGTHS[hla_class])
+
+
+def main():
+    cores = len(assign_cores(1)[0])
+    default_workers = [n for n in (1, 2, 4, 8, 16, 32, 64) if n <= cores]
+    parser = argparse.ArgumentParser(description='Benchmark the multi-process CPU inference pool')
+    parser.add_argument('--length', type=int, default=2000, help='Protein length (default: 2000)')
+    parser.add_argument('--hla-class', choices=['I', 'II'], default='II')
+    parser.add_argument('--repeats', type=int, default=3)
+    parser.add_argument('--workers', type=int, nargs='+', default=default_workers,
+                        help='Worker counts to measure (default: powers of two up to the core count)')
+    args = parser.parse_args()
+
+    # Workers are forked from this process, so it stays single-threaded
+    # until every pool has been measured
+    torch.set_num_threads(1)
+    device = torch.device('cpu')
+    _, model_i, model_ii = make_stand_in_models(device)
+    model_loader.install_model('I', model_i)
+    model_loader.install_model('II', model_ii)
+
+    residue_ids = encode(random_protein(args.length))
+    print(f"Class {args.hla_class}, protein length {args.length}, {cores} cores available")
+
+    results = []
+    for n_workers in args.workers:
+        pool = InferencePool(n_workers, device=device)
+        engine = PoolEngine(pool, args.hla_class)
+        scan(engine, residue_ids, args.hla_class)
+        seconds, peptides = time_call(lambda: scan(engine, residue_ids, args.hla_class), args.repeats)
+        pool.close()
+        results.append((n_workers, peptides / seconds))
+
+    base_rate = results[0][1] / results[0][0]
+    for n_workers, rate in results:
+        print(f"{n_workers:3d} workers: {rate:10.1f} peptides/sec, "
+              f"scaling efficiency {rate / (base_rate * n_workers):6.1%}")
+
+    torch.set_num_threads(cores)
+    engine = BatchingEngine(model_loader.get_model(args.hla_class), args.hla_class, device)
+    seconds, peptides = time_call(lambda: scan(engine, residue_ids, args.hla_class), args.repeats)
+    print(f"In-process engine, {cores} threads: {peptides / seconds:10.1f} peptides/sec")
+
+
+if __name__ == '__main__':
+    main()
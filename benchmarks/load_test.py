@@ -0,0 +1,143 @@
+"""End-to-end load generator for the prediction service.
+
+Sends concurrent /predict requests and reports p50/p95/p99 latency and
+throughput per scenario. Without --url, the Flask app is served in this
+process on the randomly initialized stand-in models (score cache and store
+disabled), so the test runs offline.
+
+Usage: python benchmarks/load_test.py [--url http://localhost:8080] [--concurrency 1 8]
+                                      [--requests 200] [--json load.json] [--compare baseline.json]
+"""
+import os
+import sys
+import time
+import random
+import logging
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import requests
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(PROJECT_ROOT)
+
+from benchmarks.bench_batching import AMINO_ACIDS, random_protein
+from benchmarks.report import compare, write_report
+
+
+def single_payload(rng, hla_class):
+    length = rng.randint(8, 14) if hla_class == 'I' else rng.randint(13, 21)
+    return {"sequence": ''.join(rng.choice(AMINO_ACIDS) for _ in range(length)),
+            "mode": "single", "hla_class": hla_class}
+
+
+def sliding_payload(rng, hla_class, protein_length):
+    return {"sequence": random_protein(protein_length, seed=rng.random()),
+            "mode": "sliding", "hla_class": hla_class}
+
+
+def serve_in_process():
+    """Serve the app on the stand-in models on a free local port; returns its URL."""
+    os.environ.setdefault('HF_HUB_OFFLINE', '1')
+    os.environ['TRANSHLA_DISABLE_SCORE_STORE'] = '1'
+    os.environ['TRANSHLA_SCORE_CACHE_BYTES'] = '0'
+    from werkzeug.serving import make_server
+    from app import app as server
+    from app import model_loader
+    from benchmarks.stand_in import make_stand_in_models
+
+    _, model_i, model_ii = make_stand_in_models()
+    model_loader.install_model('I', model_i)
+    model_loader.install_model('II', model_ii)
+    # Keep the per-request access log out of the report
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)
+    http_server = make_server('127.0.0.1', 0, server.app, threaded=True)
+    threading.Thread(target=http_server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{http_server.server_port}"
+
+
+def run_scenario(url, payloads, concurrency, timeout):
+    """Send every payload with the given concurrency; return latencies, errors and wall time."""
+    local = threading.local()
+
+    def send(payload):
+        session = getattr(local, 'session', None)
+        if session is None:
+            session = local.session = requests.Session()
+        start = time.perf_counter()
+        try:
+            ok = session.post(f"{url}/predict", json=payload, timeout=timeout).status_code == 200
+        except requests.RequestException:
+            ok = False
+        return time.perf_counter() - start, ok
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        outcomes = list(executor.map(send, payloads))
+    wall = time.perf_counter() - start
+    latencies = np.array([latency for latency, ok in outcomes if ok])
+    return latencies, sum(1 for _, ok in outcomes if not ok), wall
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load test the TransHLA prediction service')
+    parser.add_argument('--url', help='Server to test (default: serve the app in-process on stand-in models)')
+    parser.add_argument('--modes', nargs='+', choices=['single', 'sliding'], default=['single', 'sliding'])
+    parser.add_argument('--hla-class', choices=['I', 'II', 'both'], default='I')
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 8])
+    parser.add_argument('--requests', type=int, default=200, help='Requests per single-mode scenario')
+    parser.add_argument('--sliding-requests', type=int, default=20, help='Requests per sliding-mode scenario')
+    parser.add_argument('--protein-length', type=int, default=300, help='Sequence length in sliding mode')
+    parser.add_argument('--timeout', type=float, default=300)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--json', help='Write results to this JSON file')
+    parser.add_argument('--compare', help='Compare with a previous JSON report')
+    args = parser.parse_args()
+
+    url = args.url or serve_in_process()
+    # Single mode does not accept 'both'
+    single_class = 'I' if args.hla_class == 'both' else args.hla_class
+    results = []
+    for mode in args.modes:
+        for concurrency in args.concurrency:
+            rng = random.Random(args.seed)
+            hla_class = single_class if mode == 'single' else args.hla_class
+            if mode == 'single':
+                payloads = [single_payload(rng, hla_class) for _ in range(args.requests + 1)]
+            else:
+                payloads = [sliding_payload(rng, hla_class, args.protein_length)
+                            for _ in range(args.sliding_requests + 1)]
+            # One untimed request so model warm-up is not counted
+            run_scenario(url, payloads[:1], 1, args.timeout)
+            payloads = payloads[1:]
+            latencies, errors, wall = run_scenario(url, payloads, concurrency, args.timeout)
+            p50, p95, p99 = np.percentile(latencies, [50, 95, 99]) * 1000 if len(latencies) else (0, 0, 0)
+            result = {
+                "name": f"{mode} class {hla_class} x{concurrency}",
+                "mode": mode,
+                "hla_class": hla_class,
+                "concurrency": concurrency,
+                "requests": len(payloads),
+                "errors": errors,
+                "p50_ms": float(p50),
+                "p95_ms": float(p95),
+                "p99_ms": float(p99),
+                "requests_per_sec": len(latencies) / wall,
+            }
+            if mode == 'sliding':
+                result["protein_length"] = args.protein_length
+            results.append(result)
+            print(f"{result['name']:<28} {result['requests']:5d} requests, {errors} errors, "
+                  f"p50 {p50:8.1f} ms, p95 {p95:8.1f} ms, p99 {p99:8.1f} ms, "
+                  f"{result['requests_per_sec']:8.1f} requests/sec")
+
+    if args.json:
+        write_report(args.json, 'load', results)
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == '__main__':
+    main()
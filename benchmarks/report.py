@@ -0,0 +1,57 @@
+"""JSON reports for the benchmark scripts, and comparison against a baseline.
+
+A report holds the environment it was measured in (commit, torch version,
+threads) and a list of named results. Comparing two reports prints the
+change of every metric ending in _per_sec (higher is better) or _ms (lower
+is better) for results present in both.
+"""
+import os
+import json
+import time
+import platform
+import subprocess
+
+import torch
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+
+def environment():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=PROJECT_ROOT,
+                                capture_output=True, text=True, timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    return {
+        "commit": commit,
+        "timestamp": time.strftime('%Y-%m-%dT%H:%M:%S'),
+        "python": platform.python_version(),
+        "torch": torch.__version__,
+        "torch_threads": torch.get_num_threads(),
+        "cpu_count": os.cpu_count(),
+    }
+
+
+def write_report(path, suite, results):
+    with open(path, 'w') as handle:
+        json.dump({"suite": suite, "environment": environment(), "results": results}, handle, indent=2)
+    print(f"Wrote {len(results)} results to {path}")
+
+
+def compare(results, baseline_path):
+    """Print each metric's change against the same result in a baseline report."""
+    with open(baseline_path) as handle:
+        baseline = json.load(handle)
+    previous = {result["name"]: result for result in baseline["results"]}
+    print(f"\nCompared with {baseline_path} (commit {baseline['environment'].get('commit')}):")
+    for result in results:
+        old = previous.get(result["name"])
+        if old is None:
+            continue
+        for metric, value in result.items():
+            if not metric.endswith(('_per_sec', '_ms')) or not old.get(metric):
+                continue
+            change = value / old[metric] - 1
+            better = change > 0 if metric.endswith('_per_sec') else change < 0
+            print(f"  {result['name']:<40} {metric:<20} {old[metric]:12.2f} -> {value:12.2f} "
+                  f"({change:+7.1%}{'' if abs(change) < 0.05 else ', better' if better else ', WORSE'})")
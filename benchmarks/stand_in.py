@@ -0,0 +1,98 @@
+"""Small randomly initialized stand-ins for the TransHLA models.
+
+They reproduce the call signatures used by the app (``model(input_ids)``
+returning ``(probabilities, features)`` and ``tokenizer(list)['input_ids']``)
+so hot paths can be measured offline without downloading the checkpoints.
+"""
+import os
+import sys
+
+import torch
+import torch.nn as nn
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(PROJECT_ROOT)
+
+from app.tokenizer import ESM_VOCAB, EOS_TOKEN_ID, PAD_TOKEN_ID, NativeTokenizer
+
+
+class StandInLayer(nn.Module):
+    """Pre-norm transformer layer laid out like an ESM2 layer."""
+
+    def __init__(self, d_model, n_head):
+        super().__init__()
+        self.self_attn_layer_norm = nn.LayerNorm(d_model)
+        self.self_attn = nn.MultiheadAttention(d_model, n_head, batch_first=True)
+        self.final_layer_norm = nn.LayerNorm(d_model)
+        self.fc1 = nn.Linear(d_model, 4 * d_model)
+        self.fc2 = nn.Linear(4 * d_model, d_model)
+
+    def forward(self, hidden, padding_mask):
+        normed = self.self_attn_layer_norm(hidden)
+        attended, _ = self.self_attn(normed, normed, normed, key_padding_mask=padding_mask, need_weights=False)
+        hidden = hidden + attended
+        return hidden + self.fc2(torch.relu(self.fc1(self.final_layer_norm(hidden))))
+
+
+class StandInESM2(nn.Module):
+    """ESM2-shaped backbone: padding-masked encoder returning representations and contacts."""
+
+    def __init__(self, d_model=128, n_layers=2, n_head=4, max_positions=32, seed=0):
+        super().__init__()
+        torch.manual_seed(seed)
+        self.num_layers = n_layers
+        self.embed_tokens = nn.Embedding(len(ESM_VOCAB), d_model, padding_idx=PAD_TOKEN_ID)
+        self.embed_positions = nn.Embedding(max_positions, d_model)
+        self.layers = nn.ModuleList(StandInLayer(d_model, n_head) for _ in range(n_layers))
+
+    def forward(self, tokens, repr_layers=(), return_contacts=False):
+        padding_mask = tokens.eq(PAD_TOKEN_ID)
+        positions = torch.arange(tokens.shape[1], device=tokens.device)
+        hidden = self.embed_tokens(tokens) + self.embed_positions(positions)
+        hidden = hidden * (~padding_mask).unsqueeze(-1)
+        for layer in self.layers:
+            hidden = layer(hidden, padding_mask)
+        hidden = hidden * (~padding_mask).unsqueeze(-1)
+        results = {"representations": {self.num_layers: hidden}}
+        if return_contacts:
+            # Like ESM2, padding and EOS positions are zeroed and CLS/final dropped
+            keep = (~padding_mask & tokens.ne(EOS_TOKEN_ID)).to(hidden.dtype)[:, 1:-1]
+            inner = hidden[:, 1:-1]
+            contacts = torch.sigmoid(inner @ inner.transpose(1, 2) / inner.shape[-1] ** 0.5)
+            results["contacts"] = contacts * keep.unsqueeze(1) * keep.unsqueeze(2)
+        return results
+
+
+class StandInTransHLA(nn.Module):
+    """TransHLA-shaped model: ESM backbone, CNN over embeddings and contacts, classifier."""
+
+    def __init__(self, max_length, esm=None, seed=0):
+        super().__init__()
+        self.esm = esm or StandInESM2()
+        torch.manual_seed(seed)
+        d_model = self.esm.embed_tokens.embedding_dim
+        self.cnn = nn.Sequential(
+            nn.Conv1d(d_model + 1, 64, kernel_size=3, padding=1),
+            nn.ReLU(),
+            nn.MaxPool1d(2),
+        )
+        self.classifier = nn.Linear(64 * (max_length // 2), 2)
+
+    def forward(self, input_ids):
+        results = self.esm(input_ids, repr_layers=[self.esm.num_layers], return_contacts=True)
+        hidden = results["representations"][self.esm.num_layers]
+        contact_profile = nn.functional.pad(results["contacts"].sum(-1), (1, 1)).unsqueeze(-1)
+        features = self.cnn(torch.cat([hidden, contact_profile], dim=-1).transpose(1, 2)).flatten(1)
+        return torch.softmax(self.classifier(features), dim=-1), features
+
+
+def make_stand_in_models(device=None):
+    """Return (tokenizer, class I model, class II model) in eval mode.
+
+    Both models carry identical copies of the backbone weights, so backbone
+    sharing can be exercised.
+    """
+    device = device or torch.device('cpu')
+    model_i = StandInTransHLA(16, StandInESM2(seed=0), seed=1).to(device).eval()
+    model_ii = StandInTransHLA(23, StandInESM2(seed=0), seed=2).to(device).eval()
+    return NativeTokenizer(), model_i, model_ii
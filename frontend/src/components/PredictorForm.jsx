@@ -20,6 +20,7 @@ import { FontAwesomeIcon } from '@fortawesome/react-fontawesome'
 import { faTriangleExclamation } from '@fortawesome/free-solid-svg-icons'
 import { notifications } from '@mantine/notifications'
 import axios from 'axios'
+import { streamMsgpack } from '../wire'
 
 // Custom styled components
 const StyledPaper = ({ children, interactive = false, ...props }) => (
@@ -108,6 +109,80 @@ const StyledButton = ({ children, ...props }) => (
   </Button>
 );
 
+// Expand a columnar results batch into one object per window; peptides
+// are sliced from the scanned sequence
+const columnsToRows = (columns, sequence) => columns.position.map((position, i) => ({
+  peptide: sequence.substring(position - 1, position - 1 + columns.length[i]),
+  position,
+  length: columns.length[i],
+  class: columns.classes[columns.class[i]],
+  probability: columns.probability[i],
+  is_epitope: columns.is_epitope[i]
+}));
+
+// Request a sliding window scan as a MessagePack stream and report partial
+// results after every batch. Resolves with the complete results object.
+const streamSlidingPrediction = async (requestData, onProgress) => {
+  let results = null;
+  // Rows are appended in place as batches arrive and handed to onProgress
+  // at most once per animation frame, so a long scan renders in a few
+  // passes instead of once per batch
+  const rows = [];
+  let epitopeCount = 0;
+  let frame = null;
+  
+  const commit = () => {
+    frame = null;
+    onProgress({
+      ...results,
+      results: rows.slice(),
+      total_peptides: rows.length,
+      epitope_count: epitopeCount,
+      epitope_density: rows.length ? epitopeCount / rows.length : 0
+    });
+  };
+  
+  try {
+    const records = streamMsgpack('/predict', { ...requestData, stream: 'msgpack', layout: 'columns' });
+    for await (const record of records) {
+      if (record.type === 'start') {
+        results = {
+          original_sequence: record.original_sequence,
+          hla_class: record.hla_class,
+          results: [],
+          total_windows: record.total_windows,
+          total_peptides: 0,
+          epitope_count: 0,
+          epitope_density: 0,
+          streaming: true
+        };
+      } else if (record.type === 'results') {
+        for (const row of columnsToRows(record.results, results.original_sequence)) {
+          rows.push(row);
+          if (row.is_epitope) {
+            epitopeCount += 1;
+          }
+        }
+        if (frame === null) {
+          frame = requestAnimationFrame(commit);
+        }
+      } else if (record.type === 'summary') {
+        results = { ...results, ...record, results: rows, streaming: false };
+        delete results.type;
+      } else if (record.type === 'error') {
+        throw { response: { data: { error: record.error } } };
+      }
+    }
+  } finally {
+    // The caller renders the final results itself
+    if (frame !== null) {
+      cancelAnimationFrame(frame);
+    }
+  }
+  
+  return results;
+};
+
 const PredictorForm = ({ onPredictionComplete, isLoading, setIsLoading }) => {
   const [lengthWarning, setLengthWarning] = useState('')
   const [useFixedWindowSize, setUseFixedWindowSize] = useState(false)
@@ -296,11 +371,16 @@ const PredictorForm = ({ onPredictionComplete, isLoading, setIsLoading }) => {
       requestData.windowSize = parseInt(data.windowSize);
     }
     
+    // Sliding window scans are streamed so results render as batches arrive
+    const prediction = data.mode === 'sliding'
+      ? streamSlidingPrediction(requestData, onPredictionComplete)
+      : axios.post('/predict', requestData).then(response => response.data);
+    
     // Submit the request
-    axios.post('/predict', requestData)
-      .then(response => {
-        console.log('Prediction results:', response.data);
-        onPredictionComplete(response.data);
+    prediction
+      .then(results => {
+        console.log('Prediction results:', results);
+        onPredictionComplete(results);
       })
       .catch(error => {
         console.error('Prediction error:', error);
@@ -141,11 +141,6 @@ const SlidingResults = ({ results }) => {
     
     createDensityChart()
     
-    // Initial chart creation only when results change
-    if (results.original_sequence) {
-      loadStructure(results.original_sequence)
-    }
-    
     return () => {
       if (densityChartInstance.current) {
         densityChartInstance.current.destroy()
@@ -153,6 +148,16 @@ const SlidingResults = ({ results }) => {
       if (distributionChartInstance.current) {
         distributionChartInstance.current.destroy()
       }
+    }
+  }, [results]) // Removed chartXAxis and chartYAxis dependencies
+  
+  // Load the structure once per sequence, not on every streamed batch
+  useEffect(() => {
+    if (!results || !results.original_sequence) return
+    
+    loadStructure(results.original_sequence)
+    
+    return () => {
       if (viewerRef.current) {
         try {
           if (containerRef.current) {
@@ -164,7 +169,7 @@ const SlidingResults = ({ results }) => {
         }
       }
     }
-  }, [results]) // Removed chartXAxis and chartYAxis dependencies
+  }, [results && results.original_sequence])
   
   // Initial creation of distribution chart when results load
   useEffect(() => {
@@ -742,6 +747,11 @@ const SlidingResults = ({ results }) => {
           <div style={{ display: 'flex', alignItems: 'center', gap: '0.5rem', fontWeight: 500 }}>
             <span style={{ fontSize: '1rem' }}>Analysis Summary:</span>
             <span style={{ fontSize: '0.9rem' }}>Found {epitopeCount} potential epitopes out of {totalPeptides} possible peptides ({epitopeDensity}% epitope density)</span>
+            {results.streaming && (
+              <span style={{ fontSize: '0.8rem', color: '#666', display: 'flex', alignItems: 'center', gap: '0.25rem' }}>
+                <Loader size="xs" color="green" /> Scoring windows: {totalPeptides} of {results.total_windows}
+              </span>
+            )}
           </div>
         </Alert>
       </div>
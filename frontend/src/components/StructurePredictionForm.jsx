@@ -9,12 +9,14 @@ import {
   Alert,
   Box,
   Divider,
-  Loader
+  Loader,
+  Checkbox
 } from '@mantine/core'
 import { FontAwesomeIcon } from '@fortawesome/react-fontawesome'
 import { faTriangleExclamation } from '@fortawesome/free-solid-svg-icons'
 import { notifications } from '@mantine/notifications'
 import axios from 'axios'
+import { postMsgpack } from '../wire'
 
 // Custom styled components
 const StyledPaper = ({ children, interactive = false, ...props }) => (
@@ -86,6 +88,7 @@ const StructurePredictionForm = ({ onPredictionComplete }) => {
   const [sequence, setSequence] = useState('')
   const [lengthWarning, setLengthWarning] = useState('')
   const [isLoading, setIsLoading] = useState(false)
+  const [withSaliency, setWithSaliency] = useState(false)
   
   // Filter input to only valid amino acids
   const handleSequenceChange = (e) => {
@@ -124,11 +127,26 @@ const StructurePredictionForm = ({ onPredictionComplete }) => {
     
     setIsLoading(true)
     
-    // Call the backend API through the Vite proxy
-    axios.post('/api/predict-structure', { sequence })
-      .then(response => {
-        console.log('Structure prediction results:', response.data);
-        onPredictionComplete(response.data);
+    // Call the backend API through the Vite proxy; the epitope scan only
+    // needs to return the saliency profile, so a single window is kept
+    const requests = [axios.post('/api/predict-structure', { sequence })]
+    if (withSaliency) {
+      requests.push(postMsgpack('/predict', {
+        sequence,
+        mode: 'sliding',
+        hla_class: 'both',
+        saliency: true,
+        top_k: 1
+      }).catch(error => {
+        // The structure is still shown, in the default colours
+        console.error('Saliency scan error:', error);
+        return null;
+      }))
+    }
+    Promise.all(requests)
+      .then(([structure, scan]) => {
+        console.log('Structure prediction results:', structure.data);
+        onPredictionComplete(scan && scan.saliency ? { ...structure.data, saliency: scan.saliency } : structure.data);
       })
       .catch(error => {
         console.error('Prediction error:', error);
@@ -205,6 +223,22 @@ const StructurePredictionForm = ({ onPredictionComplete }) => {
             </Alert>
           )}
           
+          <Checkbox
+            label="Colour residues by epitope saliency (runs a class I and II epitope scan)"
+            checked={withSaliency}
+            onChange={(event) => setWithSaliency(event.currentTarget.checked)}
+            styles={{
+              input: {
+                backgroundColor: 'white',
+                borderColor: '#C6D8CC',
+                '&:checked': {
+                  backgroundColor: '#6E9F7F',
+                  borderColor: '#6E9F7F'
+                }
+              }
+            }}
+          />
+          
           <div style={{ display: 'flex', justifyContent: 'space-between' }}>
             <Button 
               variant="outline" 
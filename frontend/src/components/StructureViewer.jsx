@@ -64,6 +64,15 @@ const StyledButton = ({ children, ...props }) => (
   </Button>
 );
 
+// Colour of a residue with saliency t in [0, 1], from pale green to red
+const SALIENCY_LOW = [220, 232, 224];
+const SALIENCY_HIGH = [192, 57, 43];
+
+const saliencyColor = (t) => {
+  const channel = (i) => Math.round(SALIENCY_LOW[i] + (SALIENCY_HIGH[i] - SALIENCY_LOW[i]) * t);
+  return `rgb(${channel(0)}, ${channel(1)}, ${channel(2)})`;
+};
+
 const StructureViewer = ({ data, onBack }) => {
   const viewerRef = useRef(null);
   const containerRef = useRef(null);
@@ -95,8 +104,19 @@ const StructureViewer = ({ data, onBack }) => {
         // Add the PDB data
         viewerRef.current.addModel(data.pdb_structure, "pdb");
         
-        // Style the protein
-        viewerRef.current.setStyle({}, { cartoon: { color: 'spectrum' } });
+        // Style the protein, coloured by per-residue saliency when the
+        // epitope scan returned a profile
+        const profile = data.saliency && data.saliency.combined;
+        if (profile && profile.length) {
+          const peak = Math.max(...profile) || 1;
+          viewerRef.current.setStyle({}, {
+            cartoon: {
+              colorfunc: (atom) => saliencyColor((profile[atom.resi - 1] || 0) / peak)
+            }
+          });
+        } else {
+          viewerRef.current.setStyle({}, { cartoon: { color: 'spectrum' } });
+        }
         
         // Add surface representation
         viewerRef.current.addSurface($3Dmol.SurfaceType.VDW, {
@@ -158,6 +178,7 @@ const StructureViewer = ({ data, onBack }) => {
       
       <Text mb="md" size="sm" color="#555">
         Interactive 3D model of your protein sequence. You can rotate, zoom, and explore the structure.
+        {data.saliency && ' Residues are coloured by epitope saliency, from green (low) to red (high).'}
       </Text>
       
       {/* Container for the 3D viewer */}
@@ -0,0 +1,51 @@
+import { decode, decodeMultiStream } from '@msgpack/msgpack'
+
+// Request bodies at least this large are sent gzip-compressed
+const COMPRESS_REQUEST_BYTES = 16 * 1024
+
+// JSON-encode a request body, gzipping large bodies where the browser can
+const encodeBody = async (data) => {
+  const json = JSON.stringify(data);
+  const headers = { 'Content-Type': 'application/json' };
+  if (json.length < COMPRESS_REQUEST_BYTES || typeof CompressionStream === 'undefined') {
+    return { body: json, headers };
+  }
+  const compressed = new Blob([json]).stream().pipeThrough(new CompressionStream('gzip'));
+  return {
+    body: await new Response(compressed).blob(),
+    headers: { ...headers, 'Content-Encoding': 'gzip' }
+  };
+};
+
+// POST data asking for a MessagePack response. Errors are thrown in the
+// shape axios uses, so callers can read error.response.data.error
+const postMsgpack = async (url, data) => {
+  const { body, headers } = await encodeBody(data);
+  const response = await fetch(url, {
+    method: 'POST',
+    headers: { ...headers, Accept: 'application/msgpack' },
+    body
+  });
+  if (!response.ok) {
+    const errorBody = await response.json().catch(() => ({}));
+    throw { response: { data: errorBody } };
+  }
+  return decode(await response.arrayBuffer());
+};
+
+// POST data asking for a MessagePack stream; yields each record as it arrives
+async function* streamMsgpack(url, data) {
+  const { body, headers } = await encodeBody(data);
+  const response = await fetch(url, {
+    method: 'POST',
+    headers: { ...headers, Accept: 'application/msgpack' },
+    body
+  });
+  if (!response.ok) {
+    const errorBody = await response.json().catch(() => ({}));
+    throw { response: { data: errorBody } };
+  }
+  yield* decodeMultiStream(response.body);
+}
+
+export { encodeBody, postMsgpack, streamMsgpack };
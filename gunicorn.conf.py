@@ -0,0 +1,64 @@
+"""Gunicorn settings for serving TransHLA from many workers with one copy of the models.
+
+The master imports the app and loads both models before forking
+(preload_app), so every worker shares the weight pages copy-on-write
+instead of loading its own copy. Model weights are only read during
+inference, so the shared pages stay shared; per-worker memory is limited
+to activations, batch buffers and caches.
+
+    gunicorn -c gunicorn.conf.py app.app:app
+"""
+import os
+import gc
+import multiprocessing
+
+# PYTORCH_JIT is read when torch is imported, so it is set before the import;
+# TorchScript stays enabled for compiled inference
+if os.environ.get('TRANSHLA_COMPILE', 'off') == 'off':
+    os.environ['PYTORCH_JIT'] = '0'
+os.environ['PYTORCH_DISABLE_JIT_PROFILING'] = '1'
+
+import torch
+
+bind = f"{os.environ.get('FLASK_HOST', '0.0.0.0')}:{os.environ.get('FLASK_PORT', 8080)}"
+
+# One HTTP worker per core by default; threads let the micro-batcher
+# coalesce concurrent requests inside each worker
+workers = int(os.environ.get('TRANSHLA_WORKERS', multiprocessing.cpu_count()))
+worker_class = 'gthread'
+threads = int(os.environ.get('TRANSHLA_WORKER_THREADS', 4))
+timeout = int(os.environ.get('TRANSHLA_WORKER_TIMEOUT', 300))
+
+preload_app = True
+
+# Intra-op threads per worker; by default the cores are split between workers
+TORCH_THREADS = int(os.environ.get('TRANSHLA_TORCH_THREADS', max(1, multiprocessing.cpu_count() // workers)))
+
+# A forked child hangs in its first multi-threaded op if the parent already
+# ran one, so the master loads and warms the models on a single thread
+torch.set_num_threads(1)
+
+
+def when_ready(server):
+    """Load both models in the master, before any worker is forked."""
+    from app import model_loader
+
+    if not model_loader.load_models():
+        server.log.error("Models could not be loaded in the master; workers will load their own")
+        return
+    # Keep the objects created while loading out of the collector, so its
+    # bookkeeping writes do not copy their pages into every worker
+    gc.freeze()
+    server.log.info("Models loaded in the master and shared with workers")
+
+
+def post_fork(server, worker):
+    from app.app import get_inference_pool
+
+    # Fork the inference pool while this worker still runs a single thread;
+    # inference then runs in the pool, so torch stays single-threaded here
+    if get_inference_pool() is not None:
+        server.log.info(f"Worker {worker.pid} started its inference pool")
+        return
+    torch.set_num_threads(TORCH_THREADS)
+    server.log.info(f"Worker {worker.pid} using {TORCH_THREADS} torch threads")
@@ -4,12 +4,13 @@ import sys
 import logging
 import argparse
 
-# Configure environment variables
-os.environ['PYTORCH_JIT'] = '0'
+# Configure environment variables; TorchScript stays enabled for compiled inference
+if os.environ.get('TRANSHLA_COMPILE', 'off') == 'off':
+    os.environ['PYTORCH_JIT'] = '0'
 os.environ['PYTORCH_DISABLE_JIT_PROFILING'] = '1'
 
 # Import the Flask app
-from app.app import app
+from app.app import app, get_inference_pool
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -34,6 +35,9 @@ if __name__ == '__main__':
             os.makedirs(static_dir)
             logger.info(f"Created static directory at {static_dir}")
 
+        # Start the inference pool, if enabled, before the server starts any thread
+        get_inference_pool()
+
         # Use host='0.0.0.0' to make the app accessible from outside the container
         logger.info(f"Starting server on {host}:{port}...")
         app.run(debug=False, host=host, port=port)
@@ -0,0 +1,60 @@
+# Scan whole proteomes with the TransHLA models from the command line
+import os
+import sys
+import logging
+import argparse
+
+# Configure environment variables before torch is imported; TorchScript
+# stays enabled for compiled inference
+if os.environ.get('TRANSHLA_COMPILE', 'off') == 'off':
+    os.environ['PYTORCH_JIT'] = '0'
+os.environ['PYTORCH_DISABLE_JIT_PROFILING'] = '1'
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Scan a FASTA proteome for HLA epitopes')
+    parser.add_argument('fasta', help='FASTA file (optionally .gz) of proteins to scan')
+    parser.add_argument('-o', '--output', required=True,
+                        help='Output CSV file, or a directory ending in .parquet for Parquet parts')
+    parser.add_argument('--hla-class', nargs='+', choices=['I', 'II'], default=['I', 'II'],
+                        help='HLA classes to scan (default: both)')
+    parser.add_argument('--window-size', type=int, default=None,
+                        help='Only scan peptides of this length')
+    parser.add_argument('--epitopes-only', action='store_true',
+                        help='Only write windows predicted to be epitopes')
+    parser.add_argument('--chunk-windows', type=int, default=None,
+                        help='Approximate windows scored per chunk (bounds memory use)')
+    parser.add_argument('--resume', action='store_true',
+                        help='Resume from the checkpoint left by an interrupted run')
+    args = parser.parse_args()
+
+    # Import the app after parsing so --help does not load the models
+    from app import app as server
+    from app.proteome_scan import ProteomeScanner
+
+    try:
+        server.parse_window_size(args.window_size, 'both' if len(set(args.hla_class)) == 2 else args.hla_class[0])
+    except ValueError as e:
+        parser.error(str(e))
+
+    if not server.load_models():
+        logger.error("Models could not be loaded")
+        sys.exit(1)
+
+    def report(stats):
+        logger.info(f"{stats['proteins_done']} proteins, {stats['windows_done']} windows, "
+                    f"{stats['unique_peptides_scored']} unique peptides scored in {stats['elapsed']:.1f}s")
+
+    scanner = ProteomeScanner(
+        server.score_peptides,
+        hla_classes=args.hla_class,
+        fixed_window_size=args.window_size,
+        chunk_windows=args.chunk_windows,
+        epitopes_only=args.epitopes_only,
+        progress_fn=report
+    )
+    stats = scanner.run(args.fasta, args.output, resume=args.resume)
+    logger.info(f"Scan complete: {stats['rows_written']} rows written to {args.output}")
@@ -0,0 +1,20 @@
+import os
+import sys
+
+# Tests import the app package and the benchmark stand-ins from the project root
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import pytest
+
+
+@pytest.fixture(scope='session')
+def server():
+    """The Flask app module, serving the benchmark stand-in models."""
+    os.environ.setdefault('HF_HUB_OFFLINE', '1')
+    from app import app as server, model_loader
+    from benchmarks.stand_in import make_stand_in_models
+
+    _, model_i, model_ii = make_stand_in_models()
+    model_loader.install_model('I', model_i)
+    model_loader.install_model('II', model_ii)
+    return server
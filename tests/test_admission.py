@@ -0,0 +1,88 @@
+"""Admission control routes by cost, shares the heavy lane fairly and answers 429 when full."""
+import time
+import threading
+
+import pytest
+
+from app.admission import AdmissionController, Overloaded
+
+
+def controller(**options):
+    settings = dict(fast_lane_cost=10, heavy_slots=1, heavy_queue=0, client_share=2, queue_timeout=5)
+    settings.update(options)
+    return AdmissionController(**settings)
+
+
+def test_routes_by_cost():
+    admission = controller()
+    assert admission.lane(10) == "fast" and admission.lane(11) == "heavy"
+    heavy = admission.admit("a", 1000)
+    # The fast lane does not wait behind a full heavy lane
+    with admission.admit("b", 5) as fast:
+        assert fast.lane == "fast"
+    heavy.release()
+    assert admission.stats()["admitted"] == {"fast": 1, "heavy": 1}
+
+
+def test_rejects_when_heavy_lane_is_full():
+    admission = controller()
+    held = admission.admit("a", 1000)
+    with pytest.raises(Overloaded) as rejected:
+        admission.admit("b", 1000)
+    # Backlog of 2000 windows at the initial 0.002 seconds per window
+    assert rejected.value.retry_after == 4
+    held.release()
+    admission.admit("b", 1000).release()
+
+
+def test_limits_each_client_to_its_share():
+    admission = controller(heavy_slots=3, client_share=1)
+    held = admission.admit("a", 100)
+    with pytest.raises(Overloaded, match="At most 1 large requests per client"):
+        admission.admit("a", 100)
+    admission.admit("b", 100).release()
+    held.release()
+
+
+def test_freed_slot_goes_to_client_with_fewest_running():
+    admission = controller(heavy_slots=2, heavy_queue=2)
+    first = admission.admit("a", 100)
+    other = admission.admit("x", 100)
+    order = []
+
+    def wait_for_slot(client):
+        ticket = admission.admit(client, 100)
+        order.append(client)
+        ticket.release()
+
+    # "a" queues first, but already has a request running
+    threads = []
+    for client in ("a", "b"):
+        threads.append(threading.Thread(target=wait_for_slot, args=(client,)))
+        threads[-1].start()
+        deadline = time.monotonic() + 5
+        while admission.stats()["heavy_waiting"] < len(threads) and time.monotonic() < deadline:
+            time.sleep(0.01)
+    other.release()
+    threads[1].join(5)
+    first.release()
+    threads[0].join(5)
+    assert order == ["b", "a"]
+
+
+def test_full_heavy_lane_answers_429_with_retry_after(server, monkeypatch):
+    admission = controller()
+    monkeypatch.setattr(server, 'admission', admission)
+    held = admission.admit("someone-else", 1000)
+    try:
+        response = server.app.test_client().post('/predict', headers={"X-Client-ID": "tester"}, json={
+            "sequence": "MKTAYIAKQRQISFVKSHFSRQLEERLGLIEVQAPILSRVGDGTQDNLSGAEKAVQVKVKAL",
+            "mode": "sliding", "hla_class": "I"})
+    finally:
+        held.release()
+    assert response.status_code == 429
+    body = response.get_json()
+    assert body["error"] == "The server is busy with large requests"
+    assert response.headers["Retry-After"] == str(body["retry_after"])
+    assert body["retry_after"] >= 1
+    assert admission.stats()["rejected"]["heavy"] == 1
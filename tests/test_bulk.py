@@ -0,0 +1,66 @@
+"""Bulk scoring validates, deduplicates and lays out peptides in input order."""
+import json
+
+import numpy as np
+
+from app.bulk import columnar_results, score_bulk, validate_peptides
+
+
+class FakeScorer:
+    """Scores a peptide by its length, and records every call."""
+
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, peptides, hla_class):
+        self.calls.append((hla_class, list(peptides)))
+        return np.array([len(p) / 100 for p in peptides], dtype=np.float32)
+
+
+def test_validate_peptides_flags_letters_and_lengths():
+    peptides, valid, errors = validate_peptides([" siinfekl ", "SIINFEKX", "SIINFEK", "A" * 15], "I")
+    assert peptides[0] == "SIINFEKL"
+    assert valid.tolist() == [True, False, False, False]
+    assert errors.tolist() == [None, "Contains invalid amino acid letters",
+                               "Length must be 8-14 amino acids", "Length must be 8-14 amino acids"]
+    _, valid, _ = validate_peptides(["A" * 8, "A" * 21, "A" * 22], "both")
+    assert valid.tolist() == [True, True, False]
+
+
+def test_score_bulk_scores_each_distinct_peptide_once_per_class():
+    peptides = ["SIINFEKL", "A" * 13, "SIINFEKL", "BAD", "C" * 20]
+    valid = np.array([True, True, True, False, True])
+    scorer = FakeScorer()
+    scored, unique_scored = score_bulk(peptides, valid, "both", scorer)
+    assert sorted(scorer.calls) == [("I", ["SIINFEKL", "A" * 13]), ("II", ["A" * 13, "C" * 20])]
+    assert unique_scored == 4
+    # Input order, with both classes of a 13-mer next to each other
+    assert scored["index"].tolist() == [0, 1, 1, 2, 4]
+    assert scored["class"].tolist() == ["I", "I", "II", "I", "II"]
+    assert scored["probability"].tolist() == np.float32([0.08, 0.13, 0.13, 0.08, 0.2]).tolist()
+
+
+def test_score_bulk_without_valid_peptides():
+    scorer = FakeScorer()
+    scored, unique_scored = score_bulk(["BAD"], np.array([False]), "I", scorer)
+    assert unique_scored == 0 and not scorer.calls
+    assert len(scored["index"]) == 0
+
+
+def test_columnar_results_carry_ids_and_epitope_calls():
+    peptides = ["SIINFEKL", "GILGFVFTL"]
+    scored = {"index": np.array([0, 1]), "class": np.array(["I", "I"], dtype=object),
+              "probability": np.array([0.2, 0.9], dtype=np.float32)}
+    columns = columnar_results(peptides, ["p1", "p2"], scored)
+    assert list(columns) == ["id", "index", "peptide", "length", "class", "probability", "is_epitope"]
+    assert columns["id"].tolist() == ["p1", "p2"]
+    assert columns["length"].tolist() == [8, 9]
+    assert columns["is_epitope"].tolist() == [False, True]
+
+
+def test_batch_endpoint_logs_a_structured_event(server, capsys):
+    response = server.app.test_client().post('/predict/batch', json={"peptides": ["SIINFEKL", "NOPE"]})
+    assert response.status_code == 200
+    events = [json.loads(line) for line in capsys.readouterr().out.splitlines() if line.startswith('{')]
+    event = next(e for e in events if e["event"] == "bulk_prediction")
+    assert event["peptides"] == 2 and event["invalid"] == 1
@@ -0,0 +1,89 @@
+"""Score cache versions follow the weights, and the LRU pools stay within their budgets."""
+import shutil
+
+import torch
+from safetensors.torch import save_file
+
+from app.cache import LRUCache, model_version
+from app.weights import checkpoint_digest
+from benchmarks.stand_in import make_stand_in_models
+
+
+def test_checkpoint_digest_follows_bytes_not_path(tmp_path):
+    first, second = tmp_path / 'deploy-1', tmp_path / 'deploy-2'
+    first.mkdir()
+    save_file({"weight": torch.arange(1000, dtype=torch.float32)}, str(first / 'model.safetensors'))
+    shutil.copytree(first, second)
+    assert checkpoint_digest(str(first)) == checkpoint_digest(str(second))
+
+    save_file({"weight": torch.arange(1000, dtype=torch.float32) + (torch.arange(1000) == 501)},
+              str(second / 'model.safetensors'))
+    assert checkpoint_digest(str(first)) != checkpoint_digest(str(second))
+
+
+def test_model_version_changes_with_any_weight():
+    _, model, _ = make_stand_in_models()
+    same_weights = make_stand_in_models()[1]
+    assert model_version(model) == model_version(same_weights)
+
+    _, retrained, _ = make_stand_in_models()
+    with torch.no_grad():
+        # A single value between the positions a strided sample would read
+        next(retrained.parameters()).view(-1)[1] += 1e-3
+    assert model_version(model) != model_version(retrained)
+
+
+def test_model_version_prefers_the_checkpoint_digest():
+    _, model, _ = make_stand_in_models()
+    model.config = type('Config', (), {"name_or_path": "/srv/snapshots/a", "checkpoint_sha256": "ab" * 32})()
+    assert model_version(model) == "sha256:" + "ab" * 8
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def ten_bytes(key, value):
+    return 10
+
+
+def test_evicts_least_recently_used_within_the_byte_budget():
+    cache = LRUCache("test", 30, size_fn=ten_bytes)
+    cache.put_many([("a", 1), ("b", 2), ("c", 3)])
+    assert cache.get("a") == 1
+    cache.put("d", 4)
+    assert cache.get_many(["a", "b", "c", "d"]) == [1, None, 3, 4]
+    stats = cache.stats()
+    assert stats["bytes"] == 30 and stats["entries"] == 3 and stats["evictions"] == 1
+
+
+def test_skips_entries_larger_than_the_budget():
+    cache = LRUCache("test", 30, size_fn=lambda key, value: 40)
+    cache.put("a", 1)
+    assert len(cache) == 0 and cache.get("a") is None
+
+
+def test_entries_expire_after_their_ttl():
+    clock = FakeClock()
+    cache = LRUCache("test", 100, ttl=60, size_fn=ten_bytes, clock=clock)
+    cache.put("a", 1)
+    clock.now = 59
+    assert cache.get("a") == 1
+    clock.now = 60
+    assert cache.get("a", "expired") == "expired"
+    stats = cache.stats()
+    assert stats["expirations"] == 1 and stats["bytes"] == 0
+
+
+def test_counts_hits_and_misses():
+    cache = LRUCache("test", 100, size_fn=ten_bytes)
+    cache.put("a", 1)
+    cache.get("a")
+    cache.get_many(["a", "b", "c"])
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"]) == (2, 2)
+    assert stats["hit_ratio"] == 0.5
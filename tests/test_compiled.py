@@ -0,0 +1,57 @@
+"""Compiled graphs must match eager mode, survive a reload and fall back on failure."""
+import pytest
+import torch
+
+from app.compiled import COMPILE_BUCKETS, COMPILE_TOLERANCE, CompiledModel, apply_compilation, encode_reference, parity
+from benchmarks.stand_in import make_stand_in_models
+
+pytestmark = pytest.mark.skipif(not torch.jit._state._enabled.enabled,
+                                reason="TorchScript is disabled by PYTORCH_JIT=0")
+
+DEVICE = torch.device('cpu')
+
+
+def stand_in(hla_class):
+    _, model_i, model_ii = make_stand_in_models(DEVICE)
+    return model_i if hla_class == "I" else model_ii
+
+
+@pytest.mark.parametrize("hla_class", ["I", "II"])
+def test_traced_graph_is_saved_reloaded_and_matches_eager(hla_class, tmp_path):
+    cache_dir = tmp_path / 'compiled'
+    compiled, report = apply_compilation(stand_in(hla_class), hla_class, DEVICE, str(cache_dir), mode='trace')
+    assert isinstance(compiled, CompiledModel)
+    assert report["source"] == "traced"
+    assert len(list(cache_dir.iterdir())) == 1
+
+    # A fresh model with the same weights loads the saved graph and ties it to its tensors
+    model = stand_in(hla_class)
+    reloaded, report = apply_compilation(model, hla_class, DEVICE, str(cache_dir), mode='trace')
+    assert isinstance(reloaded, CompiledModel)
+    assert report["source"] == "cache"
+    assert report["tied_tensors"] > 0
+    state = model.state_dict(keep_vars=True)
+    for name, tensor in reloaded.graph.named_parameters():
+        assert tensor.data_ptr() == state[name].data_ptr(), name
+
+    buckets = parity(model, reloaded, hla_class, DEVICE)
+    assert sorted(buckets) == sorted(COMPILE_BUCKETS)
+    for bucket, result in buckets.items():
+        assert result["max_drift"] <= COMPILE_TOLERANCE, bucket
+
+
+def test_graph_failure_falls_back_to_eager(tmp_path):
+    model = stand_in("I")
+    compiled, _ = apply_compilation(model, "I", DEVICE, str(tmp_path), mode='trace')
+
+    class BrokenGraph(torch.nn.Module):
+        def forward(self, input_ids):
+            raise RuntimeError("forced graph failure")
+
+    compiled.graph = BrokenGraph()
+    input_ids = encode_reference("I", 5)
+    with torch.no_grad():
+        probabilities, _ = compiled(input_ids)
+        expected, _ = model(input_ids)
+    assert compiled.failed == "forced graph failure"
+    assert torch.equal(probabilities, expected)
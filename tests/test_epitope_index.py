@@ -0,0 +1,118 @@
+"""Index lookups must agree with a brute-force scan of the same proteins."""
+import random
+
+import numpy as np
+import pytest
+
+from app.epitope_index import SEPARATOR, SUFFIX_PREFIX, EpitopeIndex, IndexBuilder, suffix_array
+
+LENGTHS = (8, 9)
+
+
+@pytest.fixture(scope='module')
+def proteome(tmp_path_factory):
+    """A small FASTA over a three-letter alphabet, so peptides repeat, and its index."""
+    rng = random.Random(7)
+    motif = ''.join(rng.choice('ACD') for _ in range(40))
+    proteins = {f"P{i}": ''.join(rng.choice('ACD') for _ in range(rng.randint(20, 60))) for i in range(12)}
+    # Shared stretches longer than SUFFIX_PREFIX, and a protein shorter than any window
+    proteins["P3"] += motif
+    proteins["P7"] = motif + proteins["P7"]
+    proteins["short"] = "ACD"
+    directory = tmp_path_factory.mktemp('index')
+    fasta = directory / 'proteins.fasta'
+    fasta.write_text(''.join(f">{pid}\n{sequence}\n" for pid, sequence in proteins.items()))
+
+    rows = []
+    builder = IndexBuilder(str(fasta), str(directory / 'index'))
+    for pid, sequence in proteins.items():
+        for length in LENGTHS:
+            for start in range(len(sequence) - length + 1):
+                rows.append((pid, start + 1, length, float(np.float32(rng.random()))))
+    builder.write({
+        "protein_id": [row[0] for row in rows],
+        "hla_class": np.array(["I"] * len(rows)),
+        "position": np.array([row[1] for row in rows]),
+        "length": np.array([row[2] for row in rows]),
+        "probability": np.array([row[3] for row in rows], dtype=np.float32),
+    })
+    builder.close()
+    builder.finish()
+    return proteins, rows, fasta, EpitopeIndex(str(directory / 'index'))
+
+
+def brute_force_occurrences(proteins, peptide):
+    found = []
+    for pid, sequence in proteins.items():
+        position = sequence.find(peptide)
+        while position != -1:
+            found.append((pid, position + 1))
+            position = sequence.find(peptide, position + 1)
+    return sorted(found)
+
+
+def test_suffix_array_orders_prefixes():
+    text = np.frombuffer(b"ACDCA\nCACDA\nDDDDDDDD\n", dtype=np.uint8)
+    order = suffix_array(text, prefix=4)
+    positions = [i for i in range(len(text)) if text[i] != SEPARATOR]
+    assert sorted(order.tolist()) == positions
+    prefixes = [text[i:i + 4].tobytes() for i in order.tolist()]
+    assert prefixes == sorted(prefixes)
+
+
+def test_find_peptide_matches_str_find(proteome):
+    proteins, _, _, index = proteome
+    rng = random.Random(11)
+    peptides = ["ACD", "D", "CCCCCCCCCCCC", "ACDC" * 10]
+    for sequence in proteins.values():
+        for _ in range(10):
+            length = rng.randint(1, min(len(sequence), SUFFIX_PREFIX + 10))
+            start = rng.randint(0, len(sequence) - length)
+            peptides.append(sequence[start:start + length])
+    for peptide in peptides:
+        result = index.find_peptide(peptide)
+        found = sorted((o["protein_id"], o["position"]) for o in result["occurrences"])
+        assert found == brute_force_occurrences(proteins, peptide), peptide
+        assert result["count"] == len(found)
+
+
+def test_find_peptide_reports_indexed_scores(proteome):
+    proteins, rows, _, index = proteome
+    pid, position, length, probability = rows[100]
+    peptide = proteins[pid][position - 1:position - 1 + length]
+    first_pid, first_position = brute_force_occurrences(proteins, peptide)[0]
+    expected = next(row[3] for row in rows if row[:3] == (first_pid, first_position, length))
+    assert index.find_peptide(peptide)["scores"]["I"] == pytest.approx(expected)
+
+
+def test_windows_match_a_filtered_sort(proteome):
+    _, rows, _, index = proteome
+    for length in (None, 9):
+        expected = sorted((row for row in rows if 0.3 <= row[3] <= 0.8 and length in (None, row[2])),
+                          key=lambda row: -row[3])
+        result = index.windows("I", length, min_score=0.3, max_score=0.8, limit=25, offset=5)
+        assert result["total"] == len(expected)
+        assert [(r["protein_id"], r["position"], r["length"]) for r in result["results"]] == \
+               [row[:3] for row in expected[5:30]]
+
+
+def test_proteins_match_grouped_counts(proteome):
+    _, rows, _, index = proteome
+    counts, best = {}, {}
+    for pid, _, _, probability in rows:
+        if probability >= 0.9:
+            counts[pid] = counts.get(pid, 0) + 1
+            best[pid] = max(best.get(pid, 0.0), probability)
+    result = index.proteins("I", min_score=0.9, limit=100)
+    assert result["total"] == len(counts)
+    assert {r["protein_id"]: r["windows"] for r in result["results"]} == counts
+    assert [r["windows"] for r in result["results"]] == sorted(counts.values(), reverse=True)
+
+
+def test_scan_rows_for_unknown_proteins_are_rejected(proteome, tmp_path):
+    _, _, fasta, _ = proteome
+    builder = IndexBuilder(str(fasta), str(tmp_path / 'index'))
+    with pytest.raises(ValueError, match="'P99'"):
+        builder.write({"protein_id": ["P99"], "hla_class": np.array(["I"]), "position": np.array([1]),
+                       "length": np.array([8]), "probability": np.array([0.5], dtype=np.float32)})
+    builder.close()
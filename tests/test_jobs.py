@@ -0,0 +1,57 @@
+"""Background jobs share one concurrency cap across workers and expire once finished."""
+import os
+import time
+import threading
+
+from app import jobs
+from app.jobs import JobManager, JobSlots
+
+
+def test_slots_are_shared_across_managers(tmp_path):
+    first = JobSlots(str(tmp_path), 2)
+    second = JobSlots(str(tmp_path), 2)
+    held = [first.try_acquire(), second.try_acquire()]
+    assert all(held)
+    assert first.try_acquire() is None and second.try_acquire() is None
+    JobSlots.release(held[0])
+    assert second.try_acquire() is not None
+
+
+def test_jobs_never_exceed_the_cap_across_workers(tmp_path, monkeypatch):
+    running, peak, lock = [0], [0], threading.Lock()
+
+    def slow_job(server, writer, params):
+        with lock:
+            running[0] += 1
+            peak[0] = max(peak[0], running[0])
+        time.sleep(0.2)
+        with lock:
+            running[0] -= 1
+        return {}
+
+    monkeypatch.setitem(jobs.JOB_RUNNERS, 'structure', slow_job)
+    monkeypatch.setattr(jobs, 'SLOT_POLL_SECONDS', 0.01)
+    # Two managers stand in for two gunicorn workers sharing the jobs directory
+    managers = [JobManager(str(tmp_path), max_workers=2) for _ in range(2)]
+    job_ids = [(manager, manager.submit('structure', {"sequence": "MKT"}))
+               for manager in managers for _ in range(4)]
+
+    deadline = time.time() + 30
+    while any(m.status(j)["status"] != "completed" for m, j in job_ids):
+        assert time.time() < deadline
+        time.sleep(0.05)
+    assert peak[0] == 2
+
+
+def test_finished_jobs_expire(tmp_path):
+    manager = JobManager(str(tmp_path), ttl=60)
+    finished_id, finished_dir = manager.create('structure', {})
+    queued_id, _ = manager.create('structure', {})
+    status = manager.status(finished_id)
+    status.update(status="completed", finished_at=1000.0)
+    jobs._write_json(os.path.join(finished_dir, 'status.json'), status)
+
+    assert manager.remove_expired(now=1030.0) == 0
+    assert manager.remove_expired(now=1100.0) == 1
+    assert manager.status(finished_id) is None
+    assert manager.status(queued_id)["status"] == "queued"
@@ -0,0 +1,20 @@
+"""int8 conversion shares the fp32 model's tensors instead of copying them."""
+import torch
+import torch.nn as nn
+
+from app.precision import convert
+from benchmarks.stand_in import make_stand_in_models
+
+
+def test_int8_copy_shares_non_linear_tensors():
+    _, model, _ = make_stand_in_models()
+    converted = convert(model, 'int8', torch.device('cpu'))
+
+    original = dict(model.named_parameters())
+    shared = [name for name, tensor in converted.named_parameters()
+              if name in original and tensor.data_ptr() == original[name].data_ptr()]
+    assert shared and len(shared) == len(list(converted.parameters()))
+    # The fp32 model is left untouched for calibration and fallback
+    assert any(isinstance(module, nn.Linear) for module in model.modules())
+    assert not any(type(module) is nn.Linear for module in converted.modules())
+    assert converted.inference_precision == 'int8'
@@ -0,0 +1,28 @@
+"""Selection options are validated strictly, with one named message per option."""
+import pytest
+
+from app.selection import parse_selection
+
+
+def test_reads_json_and_form_values():
+    selection = parse_selection({"top_k": "5", "min_distance": 0.0, "epitopes_only": "false",
+                                 "hotspots": "true", "top_k_per_length": 1}, 0.5)
+    assert selection == {"threshold": 0.5, "top": 5, "per_length": True, "min_distance": 0,
+                         "epitopes_only": False, "hotspots": True}
+
+
+@pytest.mark.parametrize("params, message", [
+    ({"top_k": 1.5}, "top_k must be a positive integer"),
+    ({"top_k": "1.5"}, "top_k must be a positive integer"),
+    ({"top_k": 0}, "top_k must be a positive integer"),
+    ({"top_k": True}, "top_k must be a positive integer"),
+    ({"min_distance": "far"}, "min_distance must be a non-negative integer"),
+    ({"min_distance": -1}, "min_distance must be a non-negative integer"),
+    ({"epitopes_only": "maybe"}, "epitopes_only must be true or false"),
+    ({"hotspots": 2}, "hotspots must be true or false"),
+    ({"threshold": "high"}, "threshold must be a number between 0 and 1"),
+    ({"threshold": 1.5}, "threshold must be between 0 and 1"),
+])
+def test_rejects_invalid_options(params, message):
+    with pytest.raises(ValueError, match=message):
+        parse_selection(params, 0.5)
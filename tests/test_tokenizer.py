@@ -0,0 +1,28 @@
+"""The native tokenizer must produce the HF ESM2 tokenizer's ids."""
+import random
+
+from transformers import EsmTokenizer
+
+from app.tokenizer import ESM_VOCAB, VALID_AMINO_ACIDS, NativeTokenizer, check_equivalence
+
+
+def esm_tokenizer(tmp_path):
+    """The HF ESM2 tokenizer, built offline from the fixed vocabulary."""
+    vocab_file = tmp_path / 'vocab.txt'
+    vocab_file.write_text('\n'.join(ESM_VOCAB) + '\n')
+    return EsmTokenizer(str(vocab_file))
+
+
+def test_matches_hf_tokenizer_on_random_peptides(tmp_path):
+    rng = random.Random(0)
+    samples = [VALID_AMINO_ACIDS, "XBUZO"]
+    samples += [''.join(rng.choice(VALID_AMINO_ACIDS) for _ in range(rng.randint(8, 21)))
+                for _ in range(3000)]
+    assert check_equivalence(esm_tokenizer(tmp_path), samples) == []
+
+
+def test_encode_batch_matches_padded_hf_ids(tmp_path):
+    hf_tokenizer = esm_tokenizer(tmp_path)
+    peptides = ["SIINFEKL", "GILGFVFTL"[:8], "NLVPMVATV"[:8]]
+    expected = hf_tokenizer(peptides, padding='max_length', max_length=16)['input_ids']
+    assert NativeTokenizer().encode_batch(peptides, 16).tolist() == expected
@@ -0,0 +1,42 @@
+"""Wire encoding keeps Flask's JSON output and rejects malformed compressed requests."""
+import gzip
+import json
+
+from flask import Flask, jsonify, request
+
+from app.wire import DecompressRequests, WireJSONProvider
+
+
+def make_app():
+    app = Flask(__name__)
+    app.json = WireJSONProvider(app)
+    app.wsgi_app = DecompressRequests(app.wsgi_app, 1024)
+
+    @app.route('/echo', methods=['POST'])
+    def echo():
+        return jsonify({"zeta": 1, "alpha": request.get_json()})
+
+    return app
+
+
+def test_keys_are_sorted_like_flask():
+    client = make_app().test_client()
+    response = client.post('/echo', json={"b": 1, "a": 2})
+    assert response.get_data(as_text=True) == json.dumps({"alpha": {"a": 2, "b": 1}, "zeta": 1},
+                                                         separators=(',', ':'))
+
+
+def test_decompresses_request_bodies():
+    client = make_app().test_client()
+    response = client.post('/echo', data=gzip.compress(b'{"a": 1}'),
+                           headers={"Content-Encoding": "gzip", "Content-Type": "application/json"})
+    assert response.get_json() == {"alpha": {"a": 1}, "zeta": 1}
+
+
+def test_malformed_content_length_is_a_400():
+    app = make_app()
+    environ_overrides = {"CONTENT_LENGTH": "twelve"}
+    response = app.test_client().post('/echo', data=gzip.compress(b'{}'), environ_overrides=environ_overrides,
+                                      headers={"Content-Encoding": "gzip", "Content-Type": "application/json"})
+    assert response.status_code == 400
+    assert response.get_json() == {"error": "Invalid Content-Length header"}